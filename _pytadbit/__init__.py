@@ -75,10 +75,12 @@ def get_dependencies_version(dico=False):
 from pytadbit.tadbit import tadbit, batch_tadbit
 from pytadbit.chromosome import Chromosome
 from pytadbit.experiment import Experiment, load_experiment_from_reads
+from pytadbit.experiment import merge_experiments
 from pytadbit.chromosome import load_chromosome
 from pytadbit.imp.structuralmodels import StructuralModels
 from pytadbit.imp.structuralmodels import load_structuralmodels
 from pytadbit.parsers.hic_parser import load_hic_data_from_reads
+from pytadbit.parsers.hic_parser import load_hic_data
 from pytadbit.imp.impmodel import load_impmodel_from_cmm
 from pytadbit.imp.impmodel import load_impmodel_from_xyz
 from pytadbit.imp.impmodel import IMPmodel
@@ -8,7 +8,7 @@ from pytadbit.boundary_aligner.aligner import align
 from pytadbit                          import tadbit
 from pytadbit.utils.extraviews         import tadbit_savefig
 from pytadbit.utils.extraviews         import _tad_density_plot
-from pytadbit.experiment               import Experiment
+from pytadbit.experiment               import Experiment, merge_experiments
 from string                            import ascii_lowercase as letters
 from copy                              import deepcopy as copy
 from cPickle                           import load, dump
@@ -520,7 +520,7 @@ class Chromosome(object):
                 if name.startswith('batch'):
                     name += '_' + xpr.name
             siz = xprs[0].size
-            tmp = reduce(lambda x, y: x.__add__(y, silent=True), xprs)
+            tmp = merge_experiments(xprs, silent=True)
             tmp.filter_columns(silent=kwargs.get('silent', False))
             remove = tuple([1 if i in tmp._zeros else 0
                             for i in xrange(siz)])
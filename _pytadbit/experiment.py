@@ -7,12 +7,16 @@
 from pytadbit.parsers.hic_parser   import read_matrix, HiC_data
 from pytadbit.utils.extraviews     import nicer
 from pytadbit.utils.extraviews     import tadbit_savefig
-from pytadbit.utils.tadmaths       import zscore, nozero_log_matrix
+from pytadbit.utils.tadmaths       import zscore_array, ZScores
+from pytadbit.utils.tadmaths       import nozero_log_matrix
 from pytadbit.utils.normalize_hic  import iterative
 from pytadbit.utils.hic_filtering  import hic_filtering_for_modelling
+from pytadbit.utils.norm_cache     import cached
 from pytadbit.parsers.tad_parser   import parse_tads
 from math                          import isnan
-from numpy                         import log2, array
+from numpy                         import log2, array, diag_indices_from
+from numpy                         import ones, triu_indices, int64
+from numpy                         import concatenate
 from pytadbit.imp.CONFIG           import CONFIG
 from copy                          import deepcopy as copy
 from sys                           import stderr
@@ -93,6 +97,108 @@ def load_experiment_from_reads(name, fnam, genome_seq, resolution,
                       cell_type=cell_type, enzyme=enzyme, exp_type=exp_type,
                       **kw_descr)
 
+
+def merge_experiments(xprs, silent=False):
+    """
+    Sums the Hi-C data (raw and normalized) of several experiments into a new
+    one. The cells of all the experiments are summed at once, without
+    intermediate matrices, and the experiments summed are not modified.
+
+    Experiments at different resolutions are all brought to the largest one
+    by summing blocks of cells (see :func:`Experiment.set_resolution`), and
+    the ones normalized are then all normalized again at this resolution.
+
+    :param xprs: list of Experiment objects
+    :param False silent: does not warn about experiments not normalized, nor
+       raise an error if they are normalized with different methods
+
+    :returns: an Experiment object
+    """
+    if not xprs:
+        raise Exception('ERROR: no experiment to merge\n')
+    resolution = max(xpr.resolution for xpr in xprs)
+    mixed = any(xpr.resolution != resolution for xpr in xprs)
+    if mixed and not silent:
+        stderr.write(('WARNING: experiments of different resolution, ' +
+                      'setting all to a resolution of %s, and normalizing ' +
+                      'at this resolution\n') % (resolution))
+    hics  = []
+    norms = []
+    normalizations = []
+    for xpr in xprs:
+        hic, norm, normalization = (xpr.hic_data, xpr.norm,
+                                    xpr._normalization)
+        if xpr.resolution != resolution:
+            if resolution % xpr._ori_resolution:
+                raise Exception('ERROR: resolution %d is not a multiple of '
+                                '%d\n' % (resolution, xpr._ori_resolution))
+            hic, norm, _ = xpr._pyramid_level(resolution)
+        if mixed and normalization:
+            # normalized again at this resolution, with default factor
+            tmp = Experiment(xpr.name, resolution, hic_data=hic, no_warn=True)
+            tmp.normalize_hic(silent=True)
+            norm, normalization = tmp.norm, tmp._normalization
+        hics.append(hic)
+        norms.append(norm)
+        normalizations.append(normalization)
+
+    def _sum(matrices):
+        "sum of HiC_data objects in a single sparse reduction"
+        rows, cols, values = zip(*[matrix.get_coo() for matrix in matrices])
+        values = [vals.astype(int64) if vals.dtype.kind in 'iu' else vals
+                  for vals in values]
+        return HiC_data.from_coo(concatenate(rows), concatenate(cols),
+                                 concatenate(values),
+                                 max(len(matrix) for matrix in matrices))
+
+    new_hicdata = _sum([hic[0] for hic in hics]) if all(hics) else None
+    xpr = Experiment(name='+'.join(x.name for x in xprs),
+                     resolution=resolution,
+                     hic_data=new_hicdata, no_warn=True)
+    # check if all experiments are normalized with the same method
+    # and sum normalized data
+    methods = set(n.split('_factor:')[0] if n else None
+                  for n in normalizations)
+    if not None in methods and len(methods) == 1:
+        xpr.norm = [_sum([norm[0] for norm in norms])]
+        # The final value of the factor should be the sum of each
+        try:
+            xpr._normalization = (
+                methods.pop() + '_factor:' +
+                str(sum(int(n.split('_factor:')[1]) for n in normalizations)))
+        except IndexError: # no factor there
+            xpr._normalization = normalizations[0]
+    elif any(norms):
+        if not silent:
+            if any(norm and norm[0] for norm in norms):
+                raise Exception('ERROR: normalization differs between' +
+                                ' each experiment\n')
+            stderr.write('WARNING: experiments should be ' +
+                         'normalized before being summed\n')
+    elif not silent:
+        stderr.write('WARNING: experiments should be normalized ' +
+                     'before being summed\n')
+    xpr.crm = xprs[0].crm
+    if not xpr.size:
+        xpr.size = len(xpr.norm[0])
+
+    def __merge(own, fgn):
+        "internal function to merge descriptions"
+        if own == fgn:
+            return own
+        return '%s+%s' % (own , fgn)
+
+    xpr.identifier  = reduce(__merge, [x.identifier for x in xprs])
+    xpr.cell_type   = reduce(__merge, [x.cell_type  for x in xprs])
+    xpr.enzyme      = reduce(__merge, [x.enzyme     for x in xprs])
+    xpr.exp_type    = reduce(__merge, [x.exp_type   for x in xprs])
+    xpr.description = dict(
+        (des, reduce(__merge, [x.description[des] for x in xprs]))
+        for des in xprs[0].description
+        if all(des in x.description for x in xprs))
+    return xpr
+
+
 class Experiment(object):
     """
     Hi-C experiment.
@@ -172,6 +278,7 @@ class Experiment(object):
         self._ori_hic        = None
         self._ori_norm       = None
         self._ori_size       = None
+        self._pyramid        = {}
         self.conditions      = sorted(conditions) if conditions else []
         self.size            = None
         self.tads            = {}
@@ -217,102 +324,10 @@ class Experiment(object):
 
     def __add__(self, other, silent=False):
         """
-        sum Hi-C data of experiments into a new one.
+        sum Hi-C data of experiments into a new one (see
+        :func:`pytadbit.experiment.merge_experiments`).
         """
-        reso1, reso2 = self.resolution, other.resolution
-        if self.resolution == other.resolution:
-            resolution = self.resolution
-            changed_reso = False
-        else:
-            resolution = max(reso1, reso2)
-            self.set_resolution(resolution)
-            other.set_resolution(resolution)
-            if not silent:
-                stderr.write('WARNING: experiments of different resolution, ' +
-                             'setting both resolution of %s, and normalizing ' +
-                             'at this resolution\n' % (resolution))
-            norm1 = copy(self.norm)
-            norm2 = copy(other.norm)
-            if self._normalization:
-                self.normalize_hic()
-            if other._normalization:
-                other.normalize_hic()
-            changed_reso = True
-        if self.hic_data:
-            new_hicdata = HiC_data([], size=self.size)
-            for i in self.hic_data[0]:
-                new_hicdata[i] = self.hic_data[0].get(i)
-            for i in other.hic_data[0]:
-                new_hicdata[i] += other.hic_data[0].get(i)
-        else:
-            new_hicdata = None
-        xpr = Experiment(name='%s+%s' % (self.name, other.name),
-                         resolution=resolution,
-                         hic_data=new_hicdata, no_warn=True)
-        # check if both experiments are normalized with the same method
-        # and sum both normalized data
-        if self._normalization != None and other._normalization != None:
-            if (self._normalization.split('_factor:')[0] ==
-                other._normalization.split('_factor:')[0]):
-                xpr.norm = [HiC_data([], size=self.size)]
-                for i in self.norm[0]:
-                    xpr.norm[0][i] = self.norm[0].get(i)
-                for i in other.norm[0]:
-                    xpr.norm[0][i] += other.norm[0].get(i)
-                # The final value of the factor should be the sum of each
-                try:
-                    xpr._normalization = (
-                        self._normalization.split('_factor:')[0] +
-                        '_factor:' +
-                        str(int(self._normalization.split('_factor:')[1]) +
-                            int(other._normalization.split('_factor:')[1])))
-                except IndexError: # no factor there
-                    xpr._normalization = (self._normalization)
-        elif self.norm or other.norm:
-            try:
-                if (self.norm[0] or other.norm[0]) != {}:
-                    if not silent:
-                        raise Exception('ERROR: normalization differs between' +
-                                        ' each experiment\n')
-                else:
-                    if not silent:
-                        stderr.write('WARNING: experiments should be ' +
-                                     'normalized before being summed\n')
-            except TypeError:
-                if not silent:
-                    stderr.write('WARNING: experiments should be normalized ' +
-                                 'before being summed\n')
-        else:
-            if not silent:
-                stderr.write('WARNING: experiments should be normalized ' +
-                             'before being summed\n')
-        if changed_reso:
-            self.set_resolution(reso1)
-            self.norm = norm1
-            other.set_resolution(reso2)
-            other.norm = norm2
-        xpr.crm = self.crm
-        if not xpr.size:
-            xpr.size = len(xpr.norm[0])
-        
-        def __merge(own, fgn):
-            "internal function to merge descriptions"
-            if own == fgn:
-                return own
-            return '%s+%s' % (own , fgn)
-        
-        xpr.identifier  = __merge(self.identifier , other.identifier )
-        xpr.cell_type   = __merge(self.cell_type  , other.cell_type  )
-        xpr.enzyme      = __merge(self.enzyme     , other.enzyme     )
-        xpr.description = __merge(self.description, other.description)
-        xpr.exp_type    = __merge(self.exp_type   , other.exp_type   )
-        
-        for des in self.description:
-            if not des in other.description:
-                continue
-            xpr.description[des] = __merge(self.description[des],
-                                           other.description[des])
-        return xpr
+        return merge_experiments([self, other], silent=silent)
 
 
     def set_resolution(self, resolution, keep_original=True):
@@ -322,6 +337,11 @@ class Experiment(object):
         with the data corresponding to new data 
         (:func:`pytadbit.Chromosome.compare_condition`).
 
+        Data at each new resolution is computed only once, summing blocks of
+        cells of the original matrices, and kept in a pyramid of resolutions
+        (see :func:`pytadbit.Experiment.build_resolution_pyramid`), in order
+        to switch between them without any computation.
+
         :param resolution: an integer representing the resolution. This number
            must be a multiple of the original resolution, and higher than it
         :param True keep_original: either to keep or not the original data
@@ -343,10 +363,9 @@ class Experiment(object):
             return
         # if current resolution is the original one
         if self.resolution == self._ori_resolution:
-            if self.hic_data:
-                self._ori_hic  = copy(self.hic_data)
+            self._ori_hic  = self.hic_data
+            self._ori_norm = self.norm
             if self.norm:
-                self._ori_norm = self.norm[:]
                 # change the factor value in normalization description
                 try:
                     self._normalization = (
@@ -356,41 +375,8 @@ class Experiment(object):
                             * (resolution / self.resolution)))
                 except IndexError: # no factor there
                     pass
+        self.hic_data, self.norm, self.size = self._pyramid_level(resolution)
         self.resolution = resolution
-        fact = self.resolution / self._ori_resolution
-        # super for!
-        try:
-            size = len(self._ori_hic[0])
-        except TypeError:
-            size = len(self._ori_norm[0])
-        self.size     = size / fact
-        rest = size % fact
-        if rest:
-            self.size += 1
-        self.hic_data = [HiC_data([], size / fact + (1 if rest else 0))]
-        self.norm     = [HiC_data([], size / fact + (1 if rest else 0))]
-        def resize(mtrx, copee):
-            "resize both hic_data and normalized data"
-            for i in xrange(0, size, fact):
-                for j in xrange(0, size, fact):
-                    val = 0
-                    for k in xrange(fact):
-                        if i + k >= size:
-                            break
-                        for l in  xrange(fact):
-                            if j + l >= size:
-                                break
-                            val += copee[(i + k) * size + j + l]
-                    if val:
-                        mtrx[i/fact * self.size + j/fact] = val
-        try:
-            resize(self.hic_data[0], self._ori_hic[0])
-        except TypeError:
-            pass
-        try:
-            resize(self.norm[0], self._ori_norm[0])
-        except TypeError:
-            pass
         # we need to recalculate zeros:
         if self._filtered_cols:
             stderr.write('WARNING: definition of filtered columns lost at ' +
@@ -399,10 +385,59 @@ class Experiment(object):
         if not keep_original:
             del(self._ori_hic)
             del(self._ori_norm)
+            self._pyramid = {}
+
+
+    def build_resolution_pyramid(self, resolutions):
+        """
+        Computes, from the data at the original resolution, the Hi-C data (raw
+        and normalized) at several resolutions. Later calls to
+        :func:`pytadbit.Experiment.set_resolution` with any of these
+        resolutions will only switch references.
+
+        :param resolutions: list of resolutions, each one a multiple of the
+           original resolution
+        """
+        for resolution in resolutions:
+            if resolution % self._ori_resolution:
+                raise Exception('ERROR: resolution %d is not a multiple of %d'
+                                % (resolution, self._ori_resolution))
+            if resolution != self._ori_resolution:
+                self._pyramid_level(resolution)
+
+
+    def _pyramid_level(self, resolution):
+        """
+        Hi-C data, normalized data and size at a given resolution, computed
+        once from the data at the original resolution. The pyramid is reset if
+        the original data has been replaced.
+        """
+        if self.resolution == self._ori_resolution:
+            hic, norm = self.hic_data, self.norm
+        else:
+            hic, norm = self._ori_hic, self._ori_norm
+        base = self._pyramid.get(self._ori_resolution)
+        if not base or base[0] is not hic or base[1] is not norm:
+            try:
+                size = len(hic[0])
+            except TypeError:
+                size = len(norm[0])
+            self._pyramid = {self._ori_resolution: (hic, norm, size)}
+        try:
+            return self._pyramid[resolution]
+        except KeyError:
+            pass
+        size = self._pyramid[self._ori_resolution][2]
+        fact = resolution / self._ori_resolution
+        self._pyramid[resolution] = (
+            [hic[0].rebin(fact)] if hic else None,
+            [norm[0].rebin(fact)] if norm else None,
+            size / fact + (1 if size % fact else 0))
+        return self._pyramid[resolution]
 
 
     def filter_columns(self, silent=False, draw_hist=False, savefig=None,
-                       diagonal=True, perc_zero=90, auto=True):
+                       diagonal=True, perc_zero=90, auto=True, cache=False):
         """
         Call filtering function, to remove artefactual columns in a given Hi-C
         matrix. This function will detect columns with very low interaction
@@ -422,6 +457,10 @@ class Experiment(object):
            allowed.
         :param True auto: if False, only filters based on the given percentage
            zeros
+        :param False cache: keep the columns removed in the cache of
+           normalizations (see :mod:`pytadbit.utils.norm_cache`), and use the
+           ones already found with the same Hi-C data and parameters (not
+           used when drawing the histogram)
 
         """
         try:
@@ -429,13 +468,23 @@ class Experiment(object):
         except:
             data = self.norm[0]
             diagonal = True
-        self._zeros, has_nans = hic_filtering_for_modelling(
+        compute = lambda: hic_filtering_for_modelling(
             data, silent=silent, draw_hist=draw_hist, savefig=savefig,
             diagonal=diagonal, perc_zero=perc_zero, auto=auto)
+        (self._zeros, has_nans), found = cached(
+            data, 'filtered columns', compute,
+            cache=cache and not (draw_hist or savefig),
+            diagonal=diagonal, perc_zero=perc_zero, auto=auto)
+        if found and not silent:
+            stderr.write('WARNING: %d columns removed (loaded from cache)\n' %
+                         len(self._zeros))
         if has_nans: # to make it simple
-            for i in xrange(self.hic_data[0]._size2):
-                if repr(self.hic_data[0][i]) == 'nan':
-                    del(self.hic_data[0][i])
+            hic_data = self.hic_data[0]
+            rows, cols, values = hic_data.get_coo()
+            nans = values != values # NaN
+            for pos in (rows[nans].astype(int64) * len(hic_data)
+                        + cols[nans]).tolist():
+                del(hic_data[pos])
         # Also remove columns where there is no data in the diagonal
         size = self.size
         # else:
@@ -556,7 +605,7 @@ class Experiment(object):
 
 
     def normalize_hic(self, factor=1, iterations=0, max_dev=0.1, silent=False,
-                      rowsums=None):
+                      rowsums=None, n_cpus=1, cache=False):
         """
         Normalize the Hi-C data. This normalization step does the same of
         the :func:`pytadbit.tadbit.tadbit` function (default parameters),
@@ -582,6 +631,11 @@ class Experiment(object):
            per cell
         :param False silent: does not warn when overwriting weights
         :param None rowsums: input a list of rowsums calculated elsewhere
+        :param 1 n_cpus: number of threads used to compute the sums of rows
+           (by stripes of rows) during the iterative correction
+        :param False cache: keep the biases in the cache of normalizations
+           (see :mod:`pytadbit.utils.norm_cache`), and use the ones already
+           computed with the same Hi-C data and parameters
         """
 
         if not self.hic_data:
@@ -589,21 +643,25 @@ class Experiment(object):
         if self.norm and not silent:
             stderr.write('WARNING: removing previous weights\n')
         size = self.size
-        self.bias = iterative(self.hic_data[0], iterations=iterations,
-                              max_dev=max_dev, bads=self._zeros,
-                              verbose=not silent)
-        self.norm = [HiC_data([(i + j * size, float(self.hic_data[0][i, j]) /
-                                self.bias[i] /
-                                self.bias[j] * size)
-                               for i in self.bias for j in self.bias], size)]
-        # no need to use lists, tuples use less memory
+        compute = lambda: iterative(self.hic_data[0], iterations=iterations,
+                                    max_dev=max_dev, bads=self._zeros,
+                                    verbose=not silent, n_cpus=n_cpus)
+        self.bias, _ = cached(self.hic_data[0], 'biases', compute, cache=cache,
+                              iterations=iterations, max_dev=max_dev,
+                              bads=sorted(self._zeros or []), cis=False,
+                              engine='python')
+        # all the cells stored are divided at once by the biases of their row
+        # and column, cell (i, j) being stored in position i + j * size
+        bias = array([self.bias[i] for i in xrange(size)])
+        rows, cols, values = self.hic_data[0].get_coo()
+        values = values / bias[rows] / bias[cols] * size
         if factor:
             self._normalization = 'visibility_factor:' + str(factor)
-            factor = sum(self.norm[0].values()) / (self.size * self.size * factor)
-            for n in self.norm[0]:
-                self.norm[0][n] = self.norm[0][n] / factor
+            values /= values.sum() / (self.size * self.size * factor)
         else:
             self._normalization = 'visibility'
+        self.norm = [HiC_data.from_coo(cols, rows, values, size,
+                                       sum_duplicates=False)]
 
 
     def get_hic_zscores(self, normalized=True, zscored=True, remove_zeros=True):
@@ -611,6 +669,12 @@ class Experiment(object):
         Normalize the Hi-C raw data. The result will be stored into
         the private Experiment._zscore list.
 
+        The cells of the upper triangle of the matrix (diagonal excluded) are
+        all transformed at once, and kept in a
+        :class:`pytadbit.utils.tadmaths.ZScores` object (see
+        :func:`get_zscore_array`), that can still be used as a dictionary of
+        dictionaries (Experiment._zscores[str(i)][str(j)]).
+
         :param True normalized: whether to normalize the result using the
            weights (see :func:`normalize_hic`)
         :param True zscored: calculate the z-score of the data
@@ -618,43 +682,41 @@ class Experiment(object):
            interaction are informative.
 
         """
-        values = {}
-        zeros  = {}
-        self._zscores = {}
+        size = self.size
+        # zeros are rows or columns having a zero in the diagonal
+        good = ones(size, dtype=bool)
+        good[[i for i in self._zeros if 0 <= i < size]] = False
+        rows, cols = triu_indices(size, 1)
+        valid = good[rows] & good[cols]
         if normalized:
-            for i in xrange(self.size):
-                # zeros are rows or columns having a zero in the diagonal
-                if i in self._zeros:
-                    continue
-                for j in xrange(i + 1, self.size):
-                    if j in self._zeros:
-                        continue
-                    if (not self.norm[0][i * self.size + j]
-                        and remove_zeros):
-                        zeros[(i, j)] = None
-                        continue
-                    values[(i, j)] = self.norm[0][i * self.size + j]
+            values = self.norm[0].get_block(0, size, 0, size)[rows, cols]
+            if remove_zeros:
+                valid &= values != 0
         else:
-            for i in xrange(self.size):
-                if i in self._zeros:
-                    continue
-                for j in xrange(i + 1, self.size):
-                    if j in self._zeros:
-                        continue
-                    values[(i, j)] = self.hic_data[0][i * self.size + j]
+            values = self.hic_data[0].get_block(0, size, 0, size)[rows, cols]
         # compute Z-score
         if zscored:
-            zscore(values)
-        for i in xrange(self.size):
-            if i in self._zeros:
-                continue
-            for j in xrange(i + 1, self.size):
-                if j in self._zeros:
-                    continue
-                if (i, j) in zeros and remove_zeros:
-                    continue
-                self._zscores.setdefault(str(i), {})
-                self._zscores[str(i)][str(j)] = values[(i, j)]
+            values = values.astype(float)
+            values[valid] = zscore_array(values[valid])
+        values[~valid] = 0
+        # kept in double precision, converted to float32 for the modelling
+        self._zscores = ZScores(values, valid, size, dtype=float)
+
+    def get_zscore_array(self):
+        """
+        Z-scores computed by :func:`get_hic_zscores`, as arrays with one
+        element per cell of the upper triangle of the matrix (diagonal
+        excluded), in the order given by numpy.triu_indices(size, 1).
+
+        :returns: a NumPy array of values, and a NumPy array of booleans, True
+           for the cells with a Z-score
+        """
+        if not self._zscores:
+            raise Exception('ERROR: Z-scores not calculated for this ' +
+                            'experiment. Run Experiment.get_hic_zscores\n')
+        zscores = ZScores.from_dict(self._zscores, size=self.size, first=0,
+                                    dtype=float)
+        return zscores.data, zscores.mask
 
 
     def model_region(self, start=1, end=None, n_models=5000, n_keep=1000,
@@ -862,20 +924,20 @@ class Experiment(object):
                    # at its original value because it is inclusive
         siz = self.size
         try:
-            matrix = self.get_hic_matrix()
-            new_matrix = [[matrix[i][j] for i in xrange(start, end)]
-                          for j in xrange(start, end)]
+            matrix = self.get_hic_matrix(focus=(start + 1, end), as_array=True)
+            new_matrix = matrix.T.tolist()
             tmp = Chromosome('tmp')
             tmp.add_experiment('exp1', hic_data=[new_matrix],
                                resolution=self.resolution, filter_columns=False)
             exp = tmp.experiments[0]
             # We want the weights and zeros calculated in the full chromosome
-            exp.norm = [[self.norm[0][i + siz * j] for i in xrange(start, end)
-                         for j in xrange(start, end)]]
+            exp.norm = [self.get_hic_matrix(focus=(start + 1, end),
+                                            normalized=True,
+                                            as_array=True).T.ravel().tolist()]
         except TypeError: # no Hi-C data provided
-            matrix = self.get_hic_matrix(normalized=True)
-            new_matrix = [[matrix[i][j] for i in xrange(start, end)]
-                           for j in xrange(start, end)]
+            matrix = self.get_hic_matrix(focus=(start + 1, end),
+                                         normalized=True, as_array=True)
+            new_matrix = matrix.T.tolist()
             tmp = Chromosome('tmp')
             tmp.add_experiment('exp1', norm_data=[new_matrix],
                                resolution=self.resolution, filter_columns=False)
@@ -1016,7 +1078,8 @@ class Experiment(object):
         out.close()
 
 
-    def get_hic_matrix(self, focus=None, diagonal=True, normalized=False):
+    def get_hic_matrix(self, focus=None, diagonal=True, normalized=False,
+                       as_array=False):
         """
         Return the Hi-C matrix.
 
@@ -1025,6 +1088,7 @@ class Experiment(object):
         :param True diagonal: replace the values in the diagonal by one. Used
            for the filtering in order to smooth the distribution of mean values
         :para False normalized: returns normalized data instead of raw Hi-C
+        :param False as_array: returns a NumPy array instead of a list of lists
 
         :returns: list of lists representing the Hi-C data matrix of the
            current experiment
@@ -1043,15 +1107,14 @@ class Experiment(object):
         else:
             start = 0
             end   = siz
-        if diagonal:
-            return [[hic[i + siz * j] for i in xrange(start, end)]
-                    for j in xrange(start, end)]
+        if isinstance(hic, HiC_data):
+            mtrx = hic.get_block(start, end, start, end)
         else:
-            mtrx = [[hic[i + siz * j] for i in xrange(start, end)]
-                    for j in xrange(start, end)]
-            for i in xrange(start, end):
-                mtrx[i][i] = 1 if mtrx[i][i] else 0
-            return mtrx
+            mtrx = array(hic).reshape(siz, siz)[start:end, start:end]
+        if not diagonal:
+            mtrx = mtrx.copy()
+            mtrx[diag_indices_from(mtrx)] = mtrx.diagonal() != 0
+        return mtrx if as_array else mtrx.tolist()
             
 
     def print_hic_matrix(self, print_it=True, normalized=False, zeros=False):
@@ -6,6 +6,7 @@
 from pytadbit.imp.CONFIG           import CONFIG, NROUNDS, STEPS, LSTEPS
 from pytadbit.imp.structuralmodels import StructuralModels
 from pytadbit.imp.impmodel         import IMPmodel
+from pytadbit.utils.tadmaths       import ZScores
 from scipy                         import polyfit
 from math                          import fabs, pow as power
 from cPickle                       import load, dump
@@ -37,8 +38,9 @@ def generate_3d_models(zscores, resolution, nloci, start=1, n_models=5000,
     This function generates three-dimensional models starting from Hi-C data. 
     The final analysis will be performed on the n_keep top models.
     
-    :param zscores: the dictionary of the Z-score values calculated from the 
-       Hi-C pairwise interactions
+    :param zscores: the Z-score values calculated from the Hi-C pairwise
+       interactions, as a :class:`pytadbit.utils.tadmaths.ZScores` object or
+       as a dictionary of dictionaries
     :param resolution:  number of nucleotides per Hi-C bin. This will be the 
        number of nucleotides in each model's particle
     :param nloci: number of particles to model (may not all be present in
@@ -150,26 +152,29 @@ def generate_3d_models(zscores, resolution, nloci, start=1, n_models=5000,
              '   -> resolution times scale -- %s*%s)') % (
                 CONFIG['lowrdist'], resolution, CONFIG['scale']))
 
+    # Z-scores kept by index, in float32 (converted if given as a dictionary
+    # of dictionaries)
+    zscores = ZScores.from_dict(zscores)
+    rows, cols, zsc_vals = zscores.pairs()
+    seqdist = abs(rows - cols)
+
     # get SLOPE and regression for all particles of the z-score data
     global SLOPE, INTERCEPT
-    zsc_vals = [zscores[i][j] for i in zscores for j in zscores[i]
-                if abs(int(i) - int(j)) > 1] # condition is to avoid
-                                             # taking into account selfies
-                                             # and neighbors
-    SLOPE, INTERCEPT   = polyfit([min(zsc_vals), max(zsc_vals)],
+    zsc_vals = zsc_vals.astype(float)
+    xarray = zsc_vals[seqdist <= (close_bins + 1)]
+    zsc_vals = zsc_vals[seqdist > 1] # condition is to avoid taking into
+                                     # account selfies and neighbors
+    SLOPE, INTERCEPT   = polyfit([zsc_vals.min(), zsc_vals.max()],
                                  [CONFIG['maxdist'], CONFIG['lowrdist']], 1)
     # get SLOPE and regression for neighbors of the z-score data
     global NSLOPE, NINTERCEPT
-    xarray = [zscores[i][j] for i in zscores for j in zscores[i]
-              if abs(int(i) - int(j)) <= (close_bins + 1)]
     yarray = [RADIUS * 2 for _ in xrange(len(xarray))]
     NSLOPE, NINTERCEPT = polyfit(xarray, yarray, 1)
     
     global LOCI
     # if z-scores are generated outside TADbit they may not start at zero
     if first == None:
-        first = min([int(j) for i in zscores for j in zscores[i]] +
-                    [int(i) for i in zscores])
+        first = int(min(rows.min(), cols.min()))
     LOCI  = range(first, nloci + first)
     
     # Z-scores
@@ -533,11 +538,12 @@ def addHarmonicPair(model, p1, p2, x, y, j, dry=False):
     seqdist = num_loci2 - num_loci1
     restraint = ('no', 0, 0)
     freq = float('nan')
+    zsc = PDIST.get(num_loci1, num_loci2)
     # SHORT RANGE DISTANCE BETWEEN TWO CONSECUTIVE LOCI
     if seqdist == 1:
         kforce = CONFIG['kforce']
-        if x in PDIST and y in PDIST[x] and PDIST[x][y] > CONFIG['upfreq']:
-            dist = distConseq12(PDIST[p1.get_name()][p2.get_name()])
+        if zsc is not None and zsc > CONFIG['upfreq']:
+            dist = distConseq12(zsc)
             if not dry:
                 addHarmonicNeighborsRestraints(model, p1, p2, dist, kforce)
             else:
@@ -561,29 +567,31 @@ def addHarmonicPair(model, p1, p2, x, y, j, dry=False):
         else:
             return ("addHu", dist, kforce)
     # LONG RANGE DISTANCE DISTANCE BETWEEN TWO NON-CONSECUTIVE LOCI
-    elif x in PDIST and y in PDIST[x]:
-        freq = PDIST[x][y]
+    elif zsc is not None:
+        freq = zsc
         kforce = kForce(freq)
     # X IN PDIST BUT Y NOT IN PDIST[X]
-    elif x in PDIST:
-        prevy = str(num_loci2 - 1)
-        posty = str(num_loci2 + 1)
+    elif PDIST.has_row(num_loci1):
+        prevy = num_loci2 - 1
+        posty = num_loci2 + 1
         # mean dist to prev and next part are used with half weight
-        freq = (PDIST[x].get(prevy, PDIST[x].get(posty, float('nan'))) +
-                PDIST[x].get(posty, PDIST[x].get(prevy, float('nan')))) / 2
+        nan = float('nan')
+        get = PDIST.get
+        freq = (get(num_loci1, prevy, get(num_loci1, posty, nan)) +
+                get(num_loci1, posty, get(num_loci1, prevy, nan))) / 2
 
         kforce = 0.5 * kForce(freq)
     # X NOT IN PDIST
     else:
-        prevx = str(num_loci1 - 1)
-        postx = str(num_loci1 + 1)
-        prevx = prevx if prevx in PDIST else postx
-        postx = postx if postx in PDIST else prevx
-        try:
-            freq = (PDIST[prevx].get(y, PDIST[postx].get(y, float('nan'))) +
-                    PDIST[postx].get(y, PDIST[prevx].get(y, float('nan')))) / 2
-        except KeyError:
-            pass
+        prevx = num_loci1 - 1
+        postx = num_loci1 + 1
+        prevx = prevx if PDIST.has_row(prevx) else postx
+        postx = postx if PDIST.has_row(postx) else prevx
+        # NaN if none of them is in PDIST
+        nan = float('nan')
+        get = PDIST.get
+        freq = (get(prevx, num_loci2, get(postx, num_loci2, nan)) +
+                get(postx, num_loci2, get(prevx, num_loci2, nan))) / 2
         kforce = 0.5 * kForce(freq)
 
     # FREQUENCY > UPFREQ
@@ -5,7 +5,7 @@ from pytadbit.utils.three_dim_stats import calc_consistency, mass_center
 from pytadbit.utils.three_dim_stats import dihedral, calc_eqv_rmsd
 from pytadbit.utils.three_dim_stats import get_center_of_mass, distance
 from pytadbit.utils.tadmaths        import calinski_harabasz, nozero_log_list
-from pytadbit.utils.tadmaths        import mean_none
+from pytadbit.utils.tadmaths        import mean_none, ZScores
 from pytadbit.utils.extraviews      import plot_3d_model, setup_plot
 from pytadbit.utils.extraviews      import chimera_view, tadbit_savefig
 from pytadbit.utils.extraviews      import augmented_dendrogram, plot_hist_box
@@ -19,7 +19,7 @@ from numpy                          import median as np_median
 from numpy                          import mean as np_mean
 from numpy                          import std as np_std, log2
 from numpy                          import array, cross, dot, ma, isnan
-from numpy                          import histogram, linspace
+from numpy                          import histogram, linspace, errstate, empty
 from numpy.linalg                   import norm
 from scipy.cluster.hierarchy        import linkage, fcluster
 from scipy.stats                    import spearmanr, pearsonr, chisquare
@@ -104,7 +104,9 @@ class StructuralModels(object):
         self.clusters       = clusters or ClusterOfModels()
         self.resolution     = float(resolution)
         self._original_data = original_data # only used for correlation
-        self._zscores       = zscores       # only used for plotting
+        # only used for plotting (converted if loaded from an old file)
+        self._zscores       = (ZScores.from_dict(zscores) if zscores is not None
+                               else None)
         self._zeros         = zeros or {}   # filtered out columns
         self._config        = config or {}
         self.experiment     = experiment
@@ -1474,27 +1476,18 @@ class StructuralModels(object):
 
         """
 
-        zsc_mtrx = reduce(lambda x, y: x + y, [[k] + self._zscores[k].keys()
-                                               for k in self._zscores.keys()])
-        max_bin = max([int(i) for i in zsc_mtrx])
-        zsc_mtrx = [[float('nan') for _ in xrange(max_bin)]
-                    for _ in xrange(max_bin)]
-        for i in xrange(max_bin):
-            for j in xrange(max_bin):
-                try:
-                    zsc_mtrx[i][j] = self._zscores[str(i)][str(j)]
-                except KeyError:
-                    continue
-        for i in xrange(max_bin):
-            for j in xrange(max_bin):
-                if zsc_mtrx[i][j]:
-                    zsc_mtrx[j][i] = zsc_mtrx[i][j]
-        for i in xrange(max_bin):
-            for j in xrange(max_bin):
-                if (self._config['lowfreq'] < zsc_mtrx[i][j]
-                    < self._config['upfreq']):
-                    zsc_mtrx[j][i] = float('nan')
-                    zsc_mtrx[i][j] = float('nan')
+        rows, cols, zdata = self._zscores.pairs()
+        zdata = zdata.astype(float)
+        max_bin = max(rows.max(), cols.max())
+        zsc_mtrx = empty((max_bin, max_bin))
+        zsc_mtrx.fill(float('nan'))
+        inside = (rows < max_bin) & (cols < max_bin)
+        zsc_mtrx[rows[inside], cols[inside]] = zdata[inside]
+        inside &= zdata != 0
+        zsc_mtrx[cols[inside], rows[inside]] = zdata[inside]
+        with errstate(invalid='ignore'):
+            zsc_mtrx[(self._config['lowfreq'] < zsc_mtrx) &
+                     (zsc_mtrx < self._config['upfreq'])] = float('nan')
         masked_array = ma.array (zsc_mtrx, mask=isnan(zsc_mtrx))
         cmap = jet
         cmap.set_bad('w', 1.)
@@ -1512,17 +1505,14 @@ class StructuralModels(object):
         cbar.ax.set_ylabel('Z-score value')
         #
         ax = plt.axes([.43,0.11,.22,.61])
-        zdata = sorted(reduce(lambda x, y: x+y,
-                              [self._zscores[v].values()
-                               for v in self._zscores.keys()]))
+        zdata = sorted(zdata.tolist())
         _, _, patches = ax.hist(zdata, bins=25, linewidth=1,
                                 facecolor='none', edgecolor='k', normed=True)
         k2, pv = normaltest(zdata)
         normfit = sc_norm.pdf(zdata, np_mean(zdata), np_std(zdata))
         normplot = ax.plot(zdata, normfit, ':o', color='grey', ms=3, alpha=.4)
         ax.hist(
-            reduce(lambda x, y: x+y, [self._zscores[v].values()
-                                      for v in self._zscores.keys()]),
+            zdata,
             bins=25, linewidth=2, facecolor='none', edgecolor='k',
             histtype='stepfilled', normed=True)
         red = cmap(int(255 * (.8 + 1.2)/2.4))
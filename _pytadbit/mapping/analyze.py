@@ -8,6 +8,8 @@ from pytadbit.parsers.hic_parser import HiC_data
 from warnings                    import warn
 from collections                 import OrderedDict
 from pytadbit.parsers.hic_parser import load_hic_data_from_reads
+from pytadbit.parsers.pairs_parser import is_pairs_columns
+from pytadbit.parsers.pairs_parser import load_pairs_columns
 from pytadbit.utils.extraviews   import nicer
 from scipy.stats                 import norm as sc_norm, skew, kurtosis
 from scipy.stats                 import pearsonr, spearmanr, linregress
@@ -319,7 +321,9 @@ def plot_distance_vs_interactions(data, min_diff=1, max_diff=1000, show=False,
                                   genome_seq=None, resolution=None, axe=None,
                                   savefig=None, normalized=False):
     """
-    :param data: input file name, or HiC_data object or list of lists
+    :param data: input file name (or directory of pairs of reads stored by
+       columns, see :func:`pytadbit.parsers.pairs_parser.write_pairs_columns`),
+       or HiC_data object or list of lists
     :param 10 min_diff: lower limit (in number of bins)
     :param 1000 max_diff: upper limit (in number of bins) to look for
     :param 100 resolution: group reads that are closer than this resolution
@@ -329,11 +333,26 @@ def plot_distance_vs_interactions(data, min_diff=1, max_diff=1000, show=False,
     :param None savefig: path to a file where to save the image generated;
        if None, the image will be shown using matplotlib GUI (the extension
        of the file name will determine the desired format).
+    :param False normalized: for HiC_data objects, use the normalized values
+       (cells with non-finite values, e.g. in columns filtered out of the
+       normalization, are skipped)
     
     """
     resolution = resolution or 1
     dist_intr = dict([(i, 0) for i in xrange(min_diff, max_diff)])
-    if isinstance(data, str):
+    if isinstance(data, str) and is_pairs_columns(data):
+        pairs = load_pairs_columns(data)
+        for beg in xrange(0, pairs['nreads'], 2**22):
+            end = beg + 2**22
+            cis = pairs['crm1'][beg:end] == pairs['crm2'][beg:end]
+            diff = np.abs(
+                pairs['pos1'][beg:end][cis].astype(np.int64) / resolution -
+                pairs['pos2'][beg:end][cis].astype(np.int64) / resolution)
+            diff = diff[(diff >= min_diff) & (diff < max_diff)]
+            for i, cnt in enumerate(np.bincount(diff)):
+                if cnt:
+                    dist_intr[i] += int(cnt)
+    elif isinstance(data, str):
         fhandler = open(data)
         line = fhandler.next()
         while line.startswith('#'):
@@ -352,23 +371,11 @@ def plot_distance_vs_interactions(data, min_diff=1, max_diff=1000, show=False,
             pass
         fhandler.close()
     elif isinstance(data, HiC_data):
-        if normalized:
-            get_data = lambda x, y: data[x, y] / data.bias[x] / data.bias[y]
-        else:
-            get_data = lambda x, y: data[x, y]
+        # sums of the diagonals of all chromosomes, in one pass over the cells
         max_diff = min(len(data), max_diff)
-        if data.section_pos:
-            for crm in data.section_pos:
-                for diff in xrange(min_diff, min(
-                    (max_diff, 1 + data.chromosomes[crm]))):
-                    for i in xrange(data.section_pos[crm][0],
-                                    data.section_pos[crm][1] - diff):
-                        dist_intr[diff] += get_data(i, i + diff)
-        else:
-            for diff in xrange(min_diff, max_diff):
-                for i in xrange(len(data) - diff):
-                    if not np.isnan(data[i, i + diff]):
-                        dist_intr[diff] += get_data(i, diff)
+        for sums in data.get_diagonal_sums(normalized=normalized).itervalues():
+            for diff in xrange(min_diff, min(max_diff, len(sums))):
+                dist_intr[diff] += sums[diff]
     else:
         if genome_seq:
             max_diff = min(max(genome_seq.values()), max_diff)
@@ -571,7 +578,8 @@ def insert_sizes(fnam, savefig=None, nreads=None, max_size=99.9, axe=None,
                  xlog=False):
     """
     Plots the distribution of dangling-ends lengths
-    :param fnam: input file name
+    :param fnam: input file name (or directory of pairs of reads stored by
+       columns, see :func:`pytadbit.parsers.pairs_parser.write_pairs_columns`)
     :param None savefig: path where to store the output images.
     :param 99.9 max_size: top percentage of distances to consider, within the
        top 0.01% are usually found very long outliers.
@@ -579,32 +587,10 @@ def insert_sizes(fnam, savefig=None, nreads=None, max_size=99.9, axe=None,
 
     :returns: the median value and the percentile inputed as max_size.
     """
-    distr = {}
-    genome_seq = OrderedDict()
-    fhandler = open(fnam)
-    line = fhandler.next()
-    while line.startswith('#'):
-        if line.startswith('# CRM '):
-            crm, clen = line[6:].split()
-            genome_seq[crm] = int(clen)
-        line = fhandler.next()
-    des = []
-    if nreads:
-        nreads /= 2
-    try:
-        while True:
-            (crm1, pos1, dir1, _, re1, _,
-             crm2, pos2, dir2, _, re2) = line.strip().split('\t')[1:12]
-            if re1==re2 and crm1 == crm2 and dir1 != dir2:
-                pos1, pos2 = int(pos1), int(pos2)
-                if (pos2 > pos1) == int(dir1):
-                    des.append(abs(pos2 - pos1))
-                if len(des) == nreads:
-                    break
-            line = fhandler.next()
-    except StopIteration:
-        pass
-    fhandler.close()
+    if is_pairs_columns(fnam):
+        des = _dangling_ends_columns(fnam, nreads)
+    else:
+        des = _dangling_ends(fnam, nreads)
     ax = setup_plot(axe, figsize=(10, 5.5))
     max_perc = np.percentile(des, max_size)
     perc99   = np.percentile(des, 99)
@@ -638,11 +624,66 @@ def insert_sizes(fnam, savefig=None, nreads=None, max_size=99.9, axe=None,
     plt.close('all')
     return perc50, max_perc
 
+
+def _dangling_ends(fnam, nreads=None):
+    """
+    lengths of the dangling-ends found in a file of pairs of reads (up to
+    half of nreads)
+    """
+    fhandler = open(fnam)
+    line = fhandler.next()
+    while line.startswith('#'):
+        line = fhandler.next()
+    des = []
+    if nreads:
+        nreads /= 2
+    try:
+        while True:
+            (crm1, pos1, dir1, _, re1, _,
+             crm2, pos2, dir2, _, re2) = line.strip().split('\t')[1:12]
+            if re1==re2 and crm1 == crm2 and dir1 != dir2:
+                pos1, pos2 = int(pos1), int(pos2)
+                if (pos2 > pos1) == int(dir1):
+                    des.append(abs(pos2 - pos1))
+                if len(des) == nreads:
+                    break
+            line = fhandler.next()
+    except StopIteration:
+        pass
+    fhandler.close()
+    return des
+
+
+def _dangling_ends_columns(fnam, nreads=None, chunk_size=2**22):
+    """
+    same as _dangling_ends, for pairs of reads stored by columns
+    """
+    pairs = load_pairs_columns(fnam)
+    des = []
+    ndes = 0
+    if nreads:
+        nreads /= 2
+    for beg in xrange(0, pairs['nreads'], chunk_size):
+        col = lambda name: pairs[name][beg:beg + chunk_size]
+        pos1 = col('pos1').astype(np.int64)
+        pos2 = col('pos2').astype(np.int64)
+        dir1 = col('sd1')
+        found = ((col('rs1') == col('rs2')) & (col('crm1') == col('crm2')) &
+                 (dir1 != col('sd2')) & ((pos2 > pos1) == (dir1 == 1)))
+        if nreads and ndes + found.sum() >= nreads:
+            found[np.flatnonzero(found)[nreads - ndes]:] = False
+        des.extend(np.abs(pos2[found] - pos1[found]).tolist())
+        ndes += int(found.sum())
+        if nreads and ndes >= nreads:
+            break
+    return des
+
 def plot_genomic_distribution(fnam, first_read=True, resolution=10000,
                               axe=None, ylim=None, savefig=None,
                               chr_names=None, nreads=None):
     """
-    :param fnam: input file name
+    :param fnam: input file name (or directory of pairs of reads stored by
+       columns, see :func:`pytadbit.parsers.pairs_parser.write_pairs_columns`)
     :param True first_read: uses first read.
     :param 100 resolution: group reads that are closer than this resolution
        parameter
@@ -656,13 +697,57 @@ def plot_genomic_distribution(fnam, first_read=True, resolution=10000,
     
     """
 
+    if chr_names:
+        chr_names = set(chr_names)
+    if is_pairs_columns(fnam):
+        distr, genome_seq = _genomic_distribution_columns(
+            fnam, first_read, resolution, chr_names, nreads)
+    else:
+        distr, genome_seq = _genomic_distribution(
+            fnam, first_read, resolution, chr_names, nreads)
+    if not axe:
+        _ = plt.figure(figsize=(15, 3 + 3 * len(distr.keys())))
+
+    max_y = max([max(distr[c].values()) for c in distr])
+    max_x = max([len(distr[c].values()) for c in distr])
+    ncrms = len(genome_seq if genome_seq else distr)
+    for i, crm in enumerate(chr_names if chr_names else genome_seq
+                            if genome_seq else distr):
+        plt.subplot(ncrms, 1, i + 1)
+        try:
+            plt.plot(range(max(distr[crm])),
+                     [distr[crm].get(j, 0) for j in xrange(max(distr[crm]))],
+                     color='red', lw=1.5, alpha=0.7)
+        except KeyError:
+            pass
+        if ylim:
+            plt.vlines(genome_seq[crm] / resolution, ylim[0], ylim[1])
+        else:
+            plt.vlines(genome_seq[crm] / resolution, 0, max_y)
+        plt.xlim((0, max_x))
+        plt.ylim(ylim or (0, max_y))
+        plt.title(crm)
+
+    if savefig:
+        tadbit_savefig(savefig)
+    elif not axe:
+        plt.show()
+    plt.close('all')
+
+
+def _genomic_distribution(fnam, first_read, resolution, chr_names, nreads):
+    """
+    number of reads by bin in each chromosome, in a file of pairs of reads
+
+    :returns: a dictionary with, for each chromosome, the number of reads by
+       bin (only for bins with reads), and the chromosome lengths
+    """
     distr = {}
     idx1, idx2 = (1, 3) if first_read else (7, 9)
     genome_seq = OrderedDict()
     fhandler = open(fnam)
     line = fhandler.next()
     if chr_names:
-        chr_names = set(chr_names)
         cond1 = lambda x: x not in chr_names
     else:
         cond1 = lambda x: False
@@ -698,34 +783,39 @@ def plot_genomic_distribution(fnam, first_read=True, resolution=10000,
     except StopIteration:
         pass
     fhandler.close()
-    if not axe:
-        _ = plt.figure(figsize=(15, 3 + 3 * len(distr.keys())))
+    return distr, genome_seq
 
-    max_y = max([max(distr[c].values()) for c in distr])
-    max_x = max([len(distr[c].values()) for c in distr])
-    ncrms = len(genome_seq if genome_seq else distr)
-    for i, crm in enumerate(chr_names if chr_names else genome_seq
-                            if genome_seq else distr):
-        plt.subplot(ncrms, 1, i + 1)
-        try:
-            plt.plot(range(max(distr[crm])),
-                     [distr[crm].get(j, 0) for j in xrange(max(distr[crm]))],
-                     color='red', lw=1.5, alpha=0.7)
-        except KeyError:
-            pass
-        if ylim:
-            plt.vlines(genome_seq[crm] / resolution, ylim[0], ylim[1])
-        else:
-            plt.vlines(genome_seq[crm] / resolution, 0, max_y)
-        plt.xlim((0, max_x))
-        plt.ylim(ylim or (0, max_y))
-        plt.title(crm)
 
-    if savefig:
-        tadbit_savefig(savefig)
-    elif not axe:
-        plt.show()
-    plt.close('all')
+def _genomic_distribution_columns(fnam, first_read, resolution, chr_names,
+                                  nreads, chunk_size=2**22):
+    """
+    same as _genomic_distribution, for pairs of reads stored by columns
+    """
+    pairs = load_pairs_columns(fnam)
+    crms = pairs['chromosomes']
+    crm_col, pos_col = ('crm1', 'pos1') if first_read else ('crm2', 'pos2')
+    # reads after the first one out of chr_names, once nreads are reached,
+    # are not counted
+    last = pairs['nreads']
+    if chr_names and nreads:
+        skip = np.array([crm not in chr_names for crm in crms] or [False])
+        for beg in xrange(nreads - 1, last, chunk_size):
+            stop = np.flatnonzero(skip[pairs[crm_col][beg:beg + chunk_size]])
+            if len(stop):
+                last = beg + int(stop[0])
+                break
+    distr = {}
+    for beg in xrange(0, last, chunk_size):
+        end = min(beg + chunk_size, last)
+        # chromosome index in the highest bits, bin in the lowest 40
+        bins, cnts = np.unique(
+            pairs[crm_col][beg:end].astype(np.int64) << 40 |
+            pairs[pos_col][beg:end] / resolution, return_counts=True)
+        for pos, cnt in zip(bins.tolist(), cnts.tolist()):
+            crm = distr.setdefault(crms[pos >> 40], {})
+            pos &= 2**40 - 1
+            crm[pos] = crm.get(pos, 0) + cnt
+    return distr, pairs['crm_lens']
 
 
 def correlate_matrices(hic_data1, hic_data2, max_dist=10, intra=False,
@@ -805,8 +895,8 @@ def eig_correlate_matrices(hic_data1, hic_data2, nvect=6,
 
     :returns: matrix of correlations
     """
-    data1 = hic_data1.get_matrix()
-    data2 = hic_data2.get_matrix()
+    data1 = hic_data1.get_array()
+    data2 = hic_data2.get_array()
     # get the log
     size = len(data1)
     data1 = nozero_log(data1, np.log2)
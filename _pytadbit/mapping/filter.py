@@ -4,15 +4,39 @@
 
 """
 from pytadbit.mapping.restriction_enzymes import count_re_fragments
+from pytadbit.parsers.pairs_parser        import is_pairs_columns, read_ids
+from pytadbit.parsers.pairs_parser        import load_pairs_columns
+from pytadbit.parsers.pairs_parser        import PAIRS_COLUMNS, _ColumnsWriter
+from pytadbit.parsers.pairs_parser        import _read_range, _split_pairs
+from pytadbit.parsers.pairs_parser        import _ints
+from itertools                            import islice, compress
+from os                                   import path, remove
+from shutil                               import copyfileobj
+from math                                 import ceil
 import multiprocessing as mu
+import numpy as np
+
+MASKED = {1 : 'self-circle'       ,
+          2 : 'dangling-end'      ,
+          3 : 'error'             ,
+          4 : 'extra dangling-end',
+          5 : 'too close from RES',
+          6 : 'too short'         ,
+          7 : 'too large'         ,
+          8 : 'over-represented'  ,
+          9 : 'duplicated'        ,
+          10: 'random breaks'     }
 
 def apply_filter(fnam, outfile, masked, filters=None, reverse=False, old=False,
                  verbose=True):
     """
     Create a new file with reads filtered
 
-    :param fnam: input file path, where non-filtered read are stored
-    :param outfile: output file path, where filtered read will be stored
+    :param fnam: input file path, where non-filtered read are stored (or
+       directory of pairs of reads stored by columns, see
+       :func:`pytadbit.parsers.pairs_parser.write_pairs_columns`)
+    :param outfile: output file path, where filtered read will be stored (a
+       directory of columns if fnam is one)
     :param masked: dictionary given by the
        :func:`pytadbit.mapping.filter.filter_reads`
     :param None filters: list of numbers corresponding to the filters we want
@@ -20,16 +44,19 @@ def apply_filter(fnam, outfile, masked, filters=None, reverse=False, old=False,
     :param False reverse: if set, the resulting outfile will only contain the
        reads filtered, not the valid pairs.
     :param False verbose:
+
+    If the filters were applied with
+    :func:`pytadbit.mapping.filter.filter_reads`, lines are selected by their
+    number, from the flags of each line of the input file (one bit per
+    filter), otherwise from the IDs of the reads removed by each filter.
     """
-    masked_reads = set()
-    filters = filters or masked.keys()
-    if old:
-        for filt in filters:
-            masked_reads.update(masked[filt]['reads'])
-    else:
-        for k in masked:
-            if k in filters:
-                masked_reads.update(open(masked[k]['fnam']).read().split())
+    filters = list(filters or masked.keys())
+    if is_pairs_columns(fnam):
+        return _apply_columns(fnam, outfile, masked, filters, reverse, old,
+                              verbose)
+    if not old and all('flags' in masked[k] for k in filters):
+        return _apply_flags(fnam, outfile, masked, filters, reverse, verbose)
+    masked_reads = _masked_reads(masked, filters, old)
     out = open(outfile, 'w')
     fhandler = open(fnam)
     while True:
@@ -56,6 +83,96 @@ def apply_filter(fnam, outfile, masked, filters=None, reverse=False, old=False,
     out.close()
 
 
+def _masked_reads(masked, filters, old):
+    """
+    set of the IDs of the reads removed by any of the given filters
+    """
+    masked_reads = set()
+    if old:
+        for filt in filters:
+            masked_reads.update(masked[filt]['reads'])
+    else:
+        for k in masked:
+            if k in filters:
+                masked_reads.update(open(masked[k]['fnam']).read().split())
+    return masked_reads
+
+
+def _apply_columns(fnam, outfile, masked, filters, reverse, old, verbose,
+                   chunk_size=2**20):
+    """
+    writes the pairs of reads stored by columns flagged (reverse) or not by
+    any of the given filters to a new directory of columns
+    """
+    pairs = load_pairs_columns(fnam)
+    nreads = pairs['nreads']
+    if not old and all('flags' in masked[k] for k in filters):
+        flags = np.load(masked[filters[0]]['flags'], mmap_mode='r')
+        if len(flags) != nreads:
+            raise Exception('ERROR: %d pairs of reads in %s, and %d flags in '
+                            '%s' % (nreads, fnam, len(flags),
+                                    masked[filters[0]]['flags']))
+        bits = np.uint16(sum(1 << (k - 1) for k in set(filters)))
+        found = lambda beg, end, _: (flags[beg:end] & bits) != 0
+    else:
+        masked_reads = _masked_reads(masked, filters, old)
+        found = lambda beg, end, reads: np.array(
+            [read in masked_reads for read in reads], dtype=bool)
+    out = _ColumnsWriter(outfile, pairs['header'], pairs['crm_lens'],
+                         pairs['chromosomes'])
+    count = 0
+    for beg in xrange(0, nreads, chunk_size):
+        end = min(beg + chunk_size, nreads)
+        reads = read_ids(pairs, beg, end)
+        keep = found(beg, end, reads)
+        if not reverse:
+            keep = ~keep
+        count += int(keep.sum())
+        out.append(list(compress(reads, keep)),
+                   [pairs[col][beg:end][keep] for col, _ in PAIRS_COLUMNS])
+    out.close()
+    if verbose:
+        print '   %d reads written to file' % count
+
+
+def _apply_flags(fnam, outfile, masked, filters, reverse, verbose,
+                 chunk_size=2**18):
+    """
+    writes the lines of a file of pairs of reads flagged (reverse) or not by
+    any of the given filters, streaming by chunks of lines along the flags
+    saved by filter_reads
+    """
+    flags = np.load(masked[filters[0]]['flags'], mmap_mode='r')
+    bits = np.uint16(sum(1 << (k - 1) for k in set(filters)))
+    out = open(outfile, 'w')
+    fhandler = open(fnam)
+    line = fhandler.readline()
+    while line.startswith('#'):
+        out.write(line)
+        line = fhandler.readline()
+    lines = [line] + list(islice(fhandler, chunk_size - 1)) if line else []
+    count = 0
+    nline = 0
+    while lines:
+        keep = (flags[nline:nline + len(lines)] & bits) != 0
+        if len(keep) != len(lines):
+            raise Exception('ERROR: more lines in %s than flags in %s' % (
+                fnam, masked[filters[0]]['flags']))
+        if not reverse:
+            keep = ~keep
+        count += int(keep.sum())
+        out.writelines(compress(lines, keep))
+        nline += len(lines)
+        lines = list(islice(fhandler, chunk_size))
+    fhandler.close()
+    out.close()
+    if nline != len(flags):
+        raise Exception('ERROR: less lines in %s than flags in %s' % (
+            fnam, masked[filters[0]]['flags']))
+    if verbose:
+        print '   %d reads written to file' % count
+
+
 def filter_reads_OLD(fnam, max_molecule_length=500, over_represented=0.005,
                  max_frag_size=100000, min_frag_size=100, re_proximity=5,
                  verbose=True, savedata=None, min_dist_to_re=750):
@@ -227,7 +344,8 @@ def filter_reads_OLD(fnam, max_molecule_length=500, over_represented=0.005,
 def filter_reads(fnam, output=None, max_molecule_length=500,
                  over_represented=0.005, max_frag_size=100000,
                  min_frag_size=100, re_proximity=5, verbose=True,
-                 savedata=None, min_dist_to_re=750):
+                 savedata=None, min_dist_to_re=750, n_cpus=1,
+                 chunk_size=2**25, max_memory=None):
     """
     Filter mapped pair of reads in order to remove experimental artifacts (e.g.
     dangling-ends, self-circle, PCR artifacts...)
@@ -258,7 +376,9 @@ def filter_reads(fnam, output=None, max_molecule_length=500,
           enzyme activity or random physical breakage of the chromatin.
     
     :param fnam: path to file containing the pair of reads in tsv format, file
-       generated by :func:`pytadbit.mapping.mapper.get_intersection`
+       generated by :func:`pytadbit.mapping.mapper.get_intersection` (or
+       directory of pairs of reads stored by columns, see
+       :func:`pytadbit.parsers.pairs_parser.write_pairs_columns`)
     :param None output: PATH where to write files containing IDs of filtered
        reads. Uses fnam by default.
     :param 500 max_molecule_length: facing reads that are within
@@ -275,40 +395,138 @@ def filter_reads(fnam, output=None, max_molecule_length=500,
        from a RE site (usually 1.5 times the insert size). Applied in filter 10
     :param None savedata: PATH where to write the number of reads retained by
        each filter
+    :param 1 n_cpus: number of processes. The file is split in ranges of
+       lines, each parsed once by one process applying the filters that only
+       depend on each pair of reads, and counting reads by RE fragment and
+       pairs of positions for the two others (over-represented and
+       duplicated), applied once all ranges are done. Only the IDs of the
+       reads removed by these two filters are read a second time
+    :param 33554432 chunk_size: number of bytes parsed at once (all the
+       filters are applied on arrays holding the values of a chunk of lines)
+    :param None max_memory: maximum memory (in bytes) used to find duplicated
+       pairs of reads. If set, the positions of the pairs are written to
+       temporary files, split by position in as many groups as needed, each
+       group being searched separately. By default all are searched at once.
+       The number of groups depends on the number of pairs of reads, counted
+       beforehand in one more pass over fnam (unless stored by columns).
+       Whatever the budget, the flags of each pair of reads, the index of the
+       RE fragment of each read and a mark for the duplicated ones are kept
+       in memory (about 11 bytes by pair of reads)
 
     :return: dicitonary with, as keys, the kind of filter applied, and as values
-       a set of read IDs to be removed
+       its name, the number of reads removed, the path to the file with
+       their IDs and the path to the NumPy file with the flags of each line
+       of fnam (bit k-1 set if the pair is removed by filter k)
 
     *Note: Filtering is not exclusive, one read can be filtered several times.*
     """
-
     if not output:
         output = fnam
+    masked = dict((k, {'name': name, 'reads': 0,
+                       'fnam': output + '_' + name.replace(' ', '_') + '.tsv'})
+                  for k, name in MASKED.iteritems())
+    ranges = _ranges(fnam, n_cpus * 4 if n_cpus > 1 else 1)
+    tmpfil = lambda k, r: '%s_%d' % (masked[k]['fnam'], r)
+    if max_memory:
+        # about 100 bytes by pair of reads to sort the pairs of positions
+        nbuckets = int(ceil(100. * _count_pairs(fnam, ranges, chunk_size) /
+                            max_memory))
+    else:
+        nbuckets = 1
+    bucket = lambda r, b: '%s_pairs_%d_%d.bin' % (output, r, b)
+    if n_cpus > 1:
+        pool = mu.Pool(n_cpus)
+        mapper = pool.map
+    else:
+        mapper = map
+
+    try:
+        # each line is parsed once, in parallel by ranges of lines: filters
+        # depending only on each pair of reads, and counts of reads by RE
+        # fragment and first occurrence of each pair of positions in the range
+        params = (max_molecule_length, max_frag_size, min_frag_size,
+                  re_proximity, min_dist_to_re)
+        results = mapper(_filter_range, [
+            (fnam, beg, end, chunk_size, params,
+             dict((k, tmpfil(k, r)) for k in masked if not k in (8, 9)),
+             [bucket(r, b) for b in xrange(nbuckets)] if nbuckets > 1 else [])
+            for r, (beg, end) in enumerate(ranges)])
+        flags = [res[0] for res in results]
+        total = sum(len(flag) for flag in flags)
+        offsets = np.cumsum([0] + [len(flag) for flag in flags])
 
-    # a = _filter_same_frag(fnam, max_molecule_length, output)
-    # b = _filter_from_res(fnam, max_frag_size, min_dist_to_re,
-    #                      re_proximity, min_frag_size, output)
-    # c = _filter_over_represented(fnam, over_represented, output)
-    # d = _filter_duplicates(fnam,output)
-
-    pool = mu.Pool(4)
-
-    a = pool.apply_async(_filter_same_frag,
-                         args=(fnam, max_molecule_length, output))
-    b = pool.apply_async(_filter_from_res,
-                         args=(fnam, max_frag_size, min_dist_to_re,
-                               re_proximity, min_frag_size, output))
-    c = pool.apply_async(_filter_over_represented,
-                         args=(fnam, over_represented, output))
-    d = pool.apply_async(_filter_duplicates,
-                         args=(fnam,output))
-    pool.close()
-    pool.join()
-
-    masked, total = d.get()
-    masked.update(b.get())
-    masked.update(c.get())
-    masked.update(a.get())
+        # reduce: over-represented fragments from the sum of the counts of all
+        # ranges, and pairs of positions found in a previous range
+        if total:
+            # same chromosome index in all ranges
+            crm_ids = {}
+            for res in results:
+                for crm in res[1]:
+                    crm_ids.setdefault(crm, len(crm_ids))
+            gids = [np.array([crm_ids[crm] for crm in res[1]] or [0],
+                             dtype=np.int64) for res in results]
+            frags, inverse = np.unique(np.concatenate([
+                gid[res[2] >> 40] << 40 | res[2] & (2**40 - 1)
+                for gid, res in zip(gids, results)]), return_inverse=True)
+            counts = np.bincount(inverse, weights=np.concatenate(
+                [res[3] for res in results])).astype(int)
+            num_frags = len(frags)
+            cut = int((1 - over_represented) * num_frags + 0.5)
+            # use cut-1 because it represents the length of the list
+            cut = np.sort(counts)[cut - 1]
+            over = counts > cut
+            # all pairs but the first with the same positions
+            dups = np.ones(total, dtype=bool)
+            if nbuckets == 1:
+                dups[_first_lines(np.concatenate([
+                    _global_keys(res[6], gid, off)
+                    for gid, res, off in zip(gids, results, offsets)]))
+                     ] = False
+            for b in xrange(nbuckets if nbuckets > 1 else 0):
+                dups[_first_lines(np.concatenate([
+                    _global_keys(np.fromfile(bucket(r, b), dtype=np.int64
+                                             ).reshape(-1, 3), gid, off)
+                    for r, (gid, off) in enumerate(zip(gids, offsets))]))
+                     ] = False
+            off_frags = 0
+            for r, (flag, res) in enumerate(zip(flags, results)):
+                _, _, rfrags, _, idx1, idx2, _ = res
+                rover = over[inverse[off_frags:off_frags + len(rfrags)]]
+                flag |= ((rover[idx1] | rover[idx2]).astype(np.uint16)
+                         << (8 - 1))
+                flag |= (dups[offsets[r]:offsets[r + 1]].astype(np.uint16)
+                         << (9 - 1))
+                off_frags += len(rfrags)
+            del(dups)
+        del(results)
+
+        # IDs of the reads removed by these two filters
+        mapper(_write_range, [
+            (fnam, beg, end, chunk_size, dict(
+                (k, ((flag >> (k - 1)) & 1).astype(bool)) for k in (8, 9)),
+             dict((k, tmpfil(k, r)) for k in (8, 9)))
+            for r, ((beg, end), flag) in enumerate(zip(ranges, flags))])
+    finally:
+        if n_cpus > 1:
+            pool.close()
+            pool.join()
+        for r in xrange(len(ranges)):
+            for b in xrange(nbuckets if nbuckets > 1 else 0):
+                if path.exists(bucket(r, b)):
+                    remove(bucket(r, b))
+    # one bit per filter for each line of the file (see apply_filter)
+    flags = np.concatenate(flags)
+    np.save(output + '_flags.npy', flags)
+    for k in masked:
+        masked[k]['reads'] = int(((flags >> (k - 1)) & 1).sum())
+        masked[k]['flags'] = output + '_flags.npy'
+        out = open(masked[k]['fnam'], 'w')
+        for r in xrange(len(ranges)):
+            tmp = open(tmpfil(k, r))
+            copyfileobj(tmp, out)
+            tmp.close()
+            remove(tmpfil(k, r))
+        out.close()
 
     # if savedata or verbose:
     #     bads = len(frozenset().union(*[masked[k]['reads'] for k in masked]))
@@ -332,173 +550,275 @@ def filter_reads(fnam, output=None, max_molecule_length=500,
         #         total) * 100)
     return masked
 
-def _filter_same_frag(fnam, max_molecule_length, output):
-    # t0 = time()
-    masked = {1 : {'name': 'self-circle'       , 'reads': 0}, 
-              2 : {'name': 'dangling-end'      , 'reads': 0},
-              3 : {'name': 'error'             , 'reads': 0},
-              4 : {'name': 'extra dangling-end', 'reads': 0}}
-    outfil = {}
-    for k in masked:
-        masked[k]['fnam'] = output + '_' + masked[k]['name'].replace(' ', '_') + '.tsv'
-        outfil[k] = open(masked[k]['fnam'], 'w')
-    fhandler = open(fnam)
-    line = fhandler.next()
-    while line.startswith('#'):
-        line = fhandler.next()
-    try:
-        while True:
-            (read,
-             cr1, pos1, sd1, _, _, re1,
-             cr2, pos2, sd2, _, _, re2) = line.split('\t')
-            ps1, ps2, sd1, sd2 = map(int, (pos1, pos2, sd1, sd2))
-            if cr1 == cr2:
-                if re1 == re2.rstrip():
-                    if sd1 != sd2:
-                        if (ps2 > ps1) == sd2:
-                            # ----<===---===>---                   self-circles
-                            masked[1]["reads"] += 1
-                            outfil[1].write(read + '\n')
-                        else:
-                            # ----===>---<===---                   dangling-ends
-                            masked[2]["reads"] += 1
-                            outfil[2].write(read + '\n')
-                    else:
-                        # --===>--===>-- or --<===--<===-- or same errors
-                        masked[3]["reads"] += 1
-                        outfil[3].write(read + '\n')
-                elif (abs(ps1 - ps2) < max_molecule_length
-                      and sd2 != sd1
-                      and (ps2 > ps1) != sd2):
-                    # different fragments but facing and very close
-                    masked[4]["reads"] += 1
-                    outfil[4].write(read + '\n')
-            line = fhandler.next()
-    except StopIteration:
-        pass
-    # print 'done 1', time() - t0
-    for k in masked:
-        masked[k]['fnam'] = output + '_' + masked[k]['name'].replace(' ', '_') + '.tsv'
-        outfil[k].close()
-    return masked
+def _ranges(fnam, nranges):
+    """
+    splits a file of pairs of reads (without the header) in ranges of bytes
+    starting and ending at the beginning of a line, or pairs of reads stored
+    by columns in ranges of pairs
 
-def _filter_duplicates(fnam, output):
-    # t0 = time()
-    total = 0
-    masked = {9 : {'name': 'duplicated'        , 'reads': 0}}
-    outfil = {}
-    for k in masked:
-        masked[k]['fnam'] = output + '_' + masked[k]['name'].replace(' ', '_') + '.tsv'
-        outfil[k] = open(masked[k]['fnam'], 'w')
-    uniq_check = set()
-    fhandler = open(fnam)
-    line = fhandler.next()
-    while line.startswith('#'):
-        line = fhandler.next()
-    try:
-        while True:
-            (read,
-             cr1, pos1, _, _, _, _,
-             cr2, pos2, _, _, _, _) = line.split('\t')
-            uniq_key = tuple(sorted((cr1 + pos1, cr2 + pos2)))
-            if uniq_key in uniq_check:
-                masked[9]["reads"] += 1
-                outfil[9].write(read + '\n')
-            else:
-                uniq_check.add(uniq_key)
-            total += 1
-            line = fhandler.next()
-    except StopIteration:
-        pass
-    del uniq_check
-    # print 'done 4', time() - t0
-    for k in masked:
-        masked[k]['fnam'] = output + '_' + masked[k]['name'].replace(' ', '_') + '.tsv'
-        outfil[k].close()
-    return masked, total
-
-def _filter_from_res(fnam, max_frag_size, min_dist_to_re,
-                     re_proximity, min_frag_size, output):
-    # t0 = time()
-    masked = {5 : {'name': 'too close from RES', 'reads': 0},
-              6 : {'name': 'too short'         , 'reads': 0},
-              7 : {'name': 'too large'         , 'reads': 0},
-              10: {'name': 'random breaks'     , 'reads': 0}}
-    outfil = {}
-    for k in masked:
-        masked[k]['fnam'] = output + '_' + masked[k]['name'].replace(' ', '_') + '.tsv'
-        outfil[k] = open(masked[k]['fnam'], 'w')
+    :returns: a list of (start, end) positions in the file
+    """
+    if is_pairs_columns(fnam):
+        nreads = load_pairs_columns(fnam)['nreads']
+        bounds = sorted(set(nreads * k / nranges for k in xrange(nranges + 1)))
+        return zip(bounds[:-1], bounds[1:]) or [(0, 0)]
     fhandler = open(fnam)
-    line = fhandler.next()
+    beg = 0
+    line = fhandler.readline()
     while line.startswith('#'):
-        line = fhandler.next()
-    try:
-        while True:
-            (read,
-             _, pos1, _, _, rs1, re1,
-             _, pos2, _, _, rs2, re2) = line.split('\t')
-            ps1, ps2, re1, rs1, re2, rs2 = map(int, (pos1, pos2, re1, rs1, re2, rs2))
-            diff11 = re1 - ps1
-            diff12 = ps1 - rs1
-            diff21 = re2 - ps2
-            diff22 = ps2 - rs2
-            if ((diff11 < re_proximity) or
-                (diff12 < re_proximity) or 
-                (diff21 < re_proximity) or
-                (diff22 < re_proximity)):
-                masked[5]["reads"] += 1
-                outfil[5].write(read + '\n')
-            if (((diff11 > min_dist_to_re) and
-                 (diff12 > min_dist_to_re)) or 
-                ((diff21 > min_dist_to_re) and
-                 (diff22 > min_dist_to_re))):
-                masked[10]["reads"] += 1
-                outfil[10].write(read + '\n')
-            dif1 = re1 - rs1
-            dif2 = re2 - rs2
-            if (dif1 < min_frag_size) or (dif2 < min_frag_size):
-                masked[6]["reads"] += 1
-                outfil[6].write(read + '\n')
-            if (dif1 > max_frag_size) or (dif2 > max_frag_size):
-                masked[7]["reads"] += 1
-                outfil[7].write(read + '\n')
-            line = fhandler.next()
-    except StopIteration:
-        pass
-    # print 'done 2', time() - t0
-    for k in masked:
-        masked[k]['fnam'] = output + '_' + masked[k]['name'].replace(' ', '_') + '.tsv'
+        beg += len(line)
+        line = fhandler.readline()
+    size = path.getsize(fnam)
+    bounds = [beg]
+    for k in xrange(1, nranges):
+        pos = beg + (size - beg) * k / nranges
+        if pos <= bounds[-1]:
+            continue
+        # to the beginning of the next line
+        fhandler.seek(pos - 1)
+        fhandler.readline()
+        if bounds[-1] < fhandler.tell() < size:
+            bounds.append(fhandler.tell())
+    fhandler.close()
+    bounds.append(max(size, beg))
+    return zip(bounds[:-1], bounds[1:])
+
+
+def _count_pairs(fnam, ranges, chunk_size):
+    """
+    number of pairs of reads in the given ranges (see _ranges)
+    """
+    if is_pairs_columns(fnam):
+        return sum(end - beg for beg, end in ranges)
+    return sum(text.count('\n') + (not text.endswith('\n'))
+               for beg, end in ranges
+               for text in _read_range(fnam, beg, end, chunk_size))
+
+
+def _pair_chunks(fnam, beg, end, chunk_size, crm_ids):
+    """
+    pairs of reads of a range (see _ranges) by chunks: read IDs, and index of
+    the chromosomes (in crm_ids, that is updated), positions, strands and RE
+    sites as NumPy arrays
+    """
+    if is_pairs_columns(fnam):
+        pairs = load_pairs_columns(fnam)
+        for crm in pairs['chromosomes']:
+            crm_ids.setdefault(crm, len(crm_ids))
+        # about 40 bytes by pair of reads
+        step = max(1, chunk_size / 40)
+        for pos in xrange(beg, end, step):
+            yield (read_ids(pairs, pos, min(pos + step, end)),) + tuple(
+                pairs[col][pos:min(pos + step, end)].astype(np.int64)
+                for col in ('crm1', 'crm2', 'pos1', 'pos2', 'sd1', 'sd2',
+                            'rs1', 're1', 'rs2', 're2'))
+        return
+    for text in _read_range(fnam, beg, end, chunk_size):
+        (reads,
+         cr1, ps1, sd1, _, rs1, re1,
+         cr2, ps2, sd2, _, rs2, re2) = _split_pairs(text)
+        for crm in set(cr1) | set(cr2):
+            crm_ids.setdefault(crm, len(crm_ids))
+        yield (reads,
+               np.array([crm_ids[crm] for crm in cr1], dtype=np.int64),
+               np.array([crm_ids[crm] for crm in cr2], dtype=np.int64),
+               _ints(ps1), _ints(ps2), _ints(sd1), _ints(sd2),
+               _ints(rs1), _ints(re1), _ints(rs2), _ints(re2))
+
+
+def _pair_ids(fnam, beg, end, chunk_size):
+    """
+    read IDs of the pairs of reads of a range (see _ranges), by chunks
+    """
+    if is_pairs_columns(fnam):
+        pairs = load_pairs_columns(fnam)
+        step = max(1, chunk_size / 40)
+        for pos in xrange(beg, end, step):
+            yield read_ids(pairs, pos, min(pos + step, end))
+        return
+    for text in _read_range(fnam, beg, end, chunk_size):
+        reads = [l.split('\t', 1)[0] for l in text.split('\n')]
+        if text.endswith('\n'):
+            reads.pop()
+        yield reads
+
+
+def _filter_range(args):
+    """
+    applies the filters depending only on each pair of reads to a range of
+    a file of pairs of reads (writing the IDs of the reads removed),
+    and collects what is needed for the other filters
+
+    :returns: the flags of the local filters (see _local_filters), the names
+       of the chromosomes found, the RE fragments found (index of the
+       chromosome in the highest bits, RE site in the lowest 40) with the
+       number of reads in each, the index of the fragment of the first and
+       second read of each pair, and the first occurrence in the range of
+       each pair of positions (see _pair_keys), unless they are written to
+       the given files, split by position
+    """
+    fnam, beg, end, chunk_size, params, outfiles, buckets = args
+    outfil = dict((k, open(outfiles[k], 'w')) for k in outfiles)
+    buckets = [open(bucket, 'wb') for bucket in buckets]
+    crm_ids = {}
+    flags = []
+    frags1 = []
+    frags2 = []
+    keys = []
+    nline = 0
+    for cols in _pair_chunks(fnam, beg, end, chunk_size, crm_ids):
+        flag = _local_filters(cols, *params)
+        reads = cols[0]
+        for k in outfil:
+            found = (flag >> (k - 1)) & 1
+            if found.any():
+                outfil[k].write('\n'.join(compress(reads, found)) + '\n')
+        flags.append(flag)
+        _, cr1, cr2, ps1, ps2, _, _, rs1, _, rs2, _ = cols
+        frags1.append(cr1 << 40 | rs1)
+        frags2.append(cr2 << 40 | rs2)
+        key = np.column_stack(_pair_keys(cr1, ps1, cr2, ps2) +
+                              (np.arange(nline, nline + len(flag)),))
+        if buckets:
+            _split_keys(key, buckets)
+        else:
+            keys.append(key)
+        nline += len(flag)
+    for k in outfil:
         outfil[k].close()
-    return masked
+    for out in buckets:
+        out.close()
+    crms = sorted(crm_ids, key=crm_ids.get)
+    keys = np.concatenate(keys) if keys else np.zeros((0, 3), dtype=np.int64)
+    if not flags:
+        empty = np.zeros(0, dtype=np.int64)
+        return (np.zeros(0, dtype=np.uint16), crms, empty, empty, empty, empty,
+                keys)
+    flags = np.concatenate(flags)
+    frags, inverse, counts = np.unique(np.concatenate(frags1 + frags2),
+                                       return_inverse=True, return_counts=True)
+    # indexes of the fragments of the range, kept until all ranges are done
+    inverse = inverse.astype(np.int32)
+    return (flags, crms, frags, counts, inverse[:len(flags)],
+            inverse[len(flags):], keys[np.sort(_first_lines(keys))])
 
-def _filter_over_represented(fnam, over_represented, output):
-    # t0 = time()
-    frag_count = count_re_fragments(fnam)
-    num_frags = len(frag_count)
-    cut = int((1 - over_represented) * num_frags + 0.5)
-    # use cut-1 because it represents the length of the list
-    cut = sorted([frag_count[crm] for crm in frag_count])[cut - 1]
-    masked = {8 : {'name': 'over-represented'  , 'reads': 0}}
-    outfil = {}
-    for k in masked:
-        masked[k]['fnam'] = output + '_' + masked[k]['name'].replace(' ', '_') + '.tsv'
-        outfil[k] = open(masked[k]['fnam'], 'w')
-    fhandler = open(fnam)
-    line = fhandler.next()
-    while line.startswith('#'):
-        line = fhandler.next()
-    try:
-        while True:
-            read, cr1,  _, _, _, rs1, _, cr2, _, _, _, rs2, _ = line.split('\t')
-            if (frag_count.get((cr1, rs1), 0) > cut or
-                  frag_count.get((cr2, rs2), 0) > cut):
-                masked[8]["reads"] += 1
-                outfil[8].write(read + '\n')
-            line = fhandler.next()
-    except StopIteration:
-        pass
-    # print 'done 3', time() - t0
-    for k in masked:
-        masked[k]['fnam'] = output + '_' + masked[k]['name'].replace(' ', '_') + '.tsv'
+
+def _write_range(args):
+    """
+    writes the IDs of the reads of a range of a file of pairs of reads that
+    are removed by the given filters
+    """
+    fnam, beg, end, chunk_size, found, outfiles = args
+    outfil = dict((k, open(outfiles[k], 'w')) for k in outfiles)
+    if any(found[k].any() for k in found):
+        line = 0
+        for reads in _pair_ids(fnam, beg, end, chunk_size):
+            for k in outfil:
+                sel = found[k][line:line + len(reads)]
+                if sel.any():
+                    outfil[k].write('\n'.join(compress(reads, sel)) + '\n')
+            line += len(reads)
+    for k in outfil:
         outfil[k].close()
-    return masked
+
+
+def _pair_keys(ids1, pos1, ids2, pos2):
+    """
+    start positions of the reads of each pair as integers (index of the
+    chromosome in the highest bits, position in the lowest 32), the same
+    whatever the order of the reads (used to find duplicates, filter 9)
+
+    :returns: two NumPy arrays, the lowest and the highest of the two
+    """
+    key1 = ids1 << 32 | pos1
+    key2 = ids2 << 32 | pos2
+    return np.minimum(key1, key2), np.maximum(key1, key2)
+
+
+def _global_keys(keys, gids, offset):
+    """
+    pairs of positions of a range of lines (see _pair_keys) with the index of
+    the chromosomes and the number of the lines in the whole file
+
+    :param keys: NumPy array with the two positions and the line number in
+       the range of each pair, as rows
+    :param gids: index in the whole file of each chromosome of the range
+    :param offset: number of lines before the range
+    """
+    low = 2**32 - 1
+    key1 = gids[keys[:, 0] >> 32] << 32 | keys[:, 0] & low
+    key2 = gids[keys[:, 1] >> 32] << 32 | keys[:, 1] & low
+    return np.column_stack((np.minimum(key1, key2), np.maximum(key1, key2),
+                            keys[:, 2] + offset))
+
+
+def _first_lines(keys):
+    """
+    :param keys: NumPy array with the two positions and the line number of
+       each pair, as rows sorted by line number (see _global_keys)
+
+    :returns: the line numbers of the first occurrence of each pair of
+       positions
+    """
+    # stable sorts, by the second position and then by the first: pairs with
+    # the same positions are left in the order of the lines
+    order = np.argsort(keys[:, 1], kind='mergesort')
+    order = order[np.argsort(keys[order, 0], kind='mergesort')]
+    keys = keys[order]
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = ((keys[1:, 0] != keys[:-1, 0]) |
+                 (keys[1:, 1] != keys[:-1, 1]))
+    return keys[first, 2]
+
+
+def _split_keys(keys, outfiles):
+    """
+    appends pairs of positions (see _global_keys) to a file depending on the
+    sum of the positions (the same pairs always go to the same file)
+    """
+    low = 2**32 - 1
+    which = ((keys[:, 0] & low) + (keys[:, 1] & low)) % len(outfiles)
+    order = np.argsort(which, kind='mergesort')
+    bounds = np.searchsorted(which[order], np.arange(len(outfiles) + 1))
+    for b, out in enumerate(outfiles):
+        keys[order[bounds[b]:bounds[b + 1]]].tofile(out)
+
+
+def _local_filters(cols, max_molecule_length, max_frag_size, min_frag_size,
+                   re_proximity, min_dist_to_re):
+    """
+    filters that only depend on each pair of reads (1 to 7 and 10, see
+    :func:`filter_reads`), for a chunk of pairs (see _pair_chunks)
+
+    :returns: a NumPy array with, for each pair, the bit k-1 set if it is
+       removed by filter k
+    """
+    _, cr1, cr2, ps1, ps2, sd1, sd2, rs1, re1, rs2, re2 = cols
+    flags = np.zeros(len(ps1), dtype=np.uint16)
+    set_flag = lambda k, cond: np.bitwise_or(flags, cond.astype(np.uint16)
+                                             << (k - 1), out=flags)
+    same_crm  = cr1 == cr2
+    same_frag = same_crm & (re1 == re2)
+    facing    = (sd1 != sd2) & ((ps2 > ps1) != sd2)
+    # ----<===---===>---                                       self-circles
+    set_flag(1, same_frag & (sd1 != sd2) & ((ps2 > ps1) == sd2))
+    # ----===>---<===---                                       dangling-ends
+    set_flag(2, same_frag & facing)
+    # --===>--===>-- or --<===--<===-- or same errors
+    set_flag(3, same_frag & (sd1 == sd2))
+    # different fragments but facing and very close
+    set_flag(4, same_crm & ~same_frag & facing &
+             (np.abs(ps1 - ps2) < max_molecule_length))
+    diff11 = re1 - ps1
+    diff12 = ps1 - rs1
+    diff21 = re2 - ps2
+    diff22 = ps2 - rs2
+    set_flag(5, (diff11 < re_proximity) | (diff12 < re_proximity) |
+             (diff21 < re_proximity) | (diff22 < re_proximity))
+    set_flag(10, ((diff11 > min_dist_to_re) & (diff12 > min_dist_to_re)) |
+             ((diff21 > min_dist_to_re) & (diff22 > min_dist_to_re)))
+    dif1 = re1 - rs1
+    dif2 = re2 - rs2
+    set_flag(6, (dif1 < min_frag_size) | (dif2 < min_frag_size))
+    set_flag(7, (dif1 > max_frag_size) | (dif2 > max_frag_size))
+    return flags
@@ -12,6 +12,7 @@ import pysam
 from warnings import warn
 from itertools import combinations
 from re import findall, compile as recompile
+from pytadbit.parsers.pairs_parser import write_pairs_columns
 try:
     import gem
 except ImportError:
@@ -20,7 +21,7 @@ except ImportError:
 N_WINDOWS = 0
 
 
-def get_intersection(fname1, fname2, out_path, verbose=False):
+def get_intersection(fname1, fname2, out_path, verbose=False, columns=None):
     """
     Merges the two files corresponding to each reads sides. Reads found in both
        files are merged and written in an output file.
@@ -41,6 +42,9 @@ def get_intersection(fname1, fname2, out_path, verbose=False):
        :func:`pytadbit.parsers.sam_parser.parse_sam`
     :param out_path: path to an outfile. It will written in a similar format as
        the inputs
+    :param None columns: path to a directory where to also store the pairs of
+       reads by columns (see
+       :func:`pytadbit.parsers.pairs_parser.write_pairs_columns`)
     """
     reads_fh = open(out_path, 'w')
     reads1 = open(fname1)
@@ -139,6 +143,8 @@ def get_intersection(fname1, fname2, out_path, verbose=False):
         reads1.close()
         reads2.close()
     reads_fh.close()
+    if columns:
+        write_pairs_columns(out_path, columns)
     if verbose:
         print 'Found %d pair of reads mapping uniquely' % count
 
@@ -5,9 +5,13 @@ Definition and mapping of restriction enymes
 """
 
 from re import compile
+from pytadbit.parsers.pairs_parser import is_pairs_columns, load_pairs_columns
+import numpy as np
 
 
 def count_re_fragments(fnam):
+    if is_pairs_columns(fnam):
+        return _count_re_fragments_columns(fnam)
     frag_count = {}
     fhandler = open(fnam)
     line = fhandler.next()
@@ -30,6 +34,28 @@ def count_re_fragments(fnam):
     return frag_count
 
 
+def _count_re_fragments_columns(fnam, chunk_size=2**22):
+    """
+    same as count_re_fragments, for pairs of reads stored by columns
+    """
+    pairs = load_pairs_columns(fnam)
+    counts = []
+    for beg in xrange(0, pairs['nreads'], chunk_size):
+        # chromosome index in the highest bits, RE site in the lowest 40
+        frags = np.concatenate([
+            pairs['crm' + r][beg:beg + chunk_size].astype(np.int64) << 40 |
+            pairs['rs' + r][beg:beg + chunk_size] for r in '12'])
+        counts.append(np.unique(frags, return_counts=True))
+    if not counts:
+        return {}
+    frags, idx = np.unique(np.concatenate([f for f, _ in counts]),
+                           return_inverse=True)
+    counts = np.bincount(idx, weights=np.concatenate([c for _, c in counts]))
+    crms = pairs['chromosomes']
+    return dict(((crms[frag >> 40], str(frag & (2**40 - 1))), int(cnt))
+                for frag, cnt in zip(frags.tolist(), counts.tolist()))
+
+
 def map_re_sites(enzyme_name, genome_seq, frag_chunk=100000, verbose=False):
     """
     map all restriction enzyme (RE) sites of a given enzyme in a genome.
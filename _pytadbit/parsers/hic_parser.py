@@ -4,15 +4,37 @@ November 7, 2013.
 """
 
 from warnings import warn
+from sys import stderr
 from math import sqrt, isnan
 from pytadbit.parsers.gzopen import gzopen
 from pytadbit.utils.hic_filtering   import filter_by_mean, filter_by_zero_count
 from collections import OrderedDict
-from pytadbit.utils.normalize_hic  import iterative
+from copy import deepcopy
+from bisect import bisect_right
+from itertools import chain, islice
+from cPickle import dumps, loads
+from pytadbit.utils.normalize_hic  import iterative, iterative_by_chunks
+from pytadbit.utils.norm_cache     import cached
 from pytadbit.parsers.genome_parser import parse_fasta
+from pytadbit.parsers.pairs_parser  import is_pairs_columns
+from pytadbit.parsers.pairs_parser  import load_pairs_columns
+from os import path, close, remove
+from tempfile import mkstemp
+from hashlib import sha1
+import multiprocessing as mu
+import numpy as np
 
 HIC_DATA = True
 
+# first bytes of the files written by HiC_data.save_hic_data
+BINARY_MAGIC = 'TADbit_HiC_data\x01'
+
+# first line of the files written by HiC_data.write_matrix in sparse format
+SPARSE_MAGIC = '# TADbit sparse matrix'
+
+# attributes of HiC_data stored in the header of the binary files
+_HEADER_ATTRS = ('chromosomes', 'sections', 'resolution', 'bias', 'bads')
+
 # Exception to handle failed autoread.
 class AutoReadFail(Exception):
     pass
@@ -45,29 +67,56 @@ def autoreader(f):
     :returns: A tuple with integer values and the dimension of
        the matrix.
     """
+    rows, cols, values, size, header = sparse_autoreader(f)
+    matrix = np.zeros(size * size, dtype=values.dtype)
+    matrix[rows.astype(np.int64) * size + cols] = values
+    return tuple(matrix.tolist()), size, header
+
 
-    # Skip initial comment lines and read in the whole file
-    # as a list of lists.
+def _count_lines(f):
+    """
+    number of lines of a file, without counting the initial comment lines
+    """
+    nrow = 0
     for line in f:
+        if line.strip() and (nrow or line[0] != '#'):
+            nrow += 1
+    return nrow
+
+
+def sparse_autoreader(f, nrow=None, chunk_size=2**22):
+    """
+    Auto-detect matrix format of HiC data file (same formats as
+    :func:`pytadbit.parsers.hic_parser.autoreader`), and read it by chunks of
+    rows, keeping only the non-zero values.
+
+    :param f: an iterable (typically an open file).
+    :param None nrow: number of lines in f (initial comment lines excluded).
+       If not given, all the lines of f are first loaded in memory
+    :param 4194304 chunk_size: approximate number of cells parsed at once
+
+    :returns: NumPy arrays with rows, columns and values of the non-zero cells,
+       the dimension of the matrix, and the header
+    """
+    # Skip initial comment lines (and empty lines).
+    lines = (line for line in f if line.strip())
+    for line in lines:
         if line[0] != '#':
             break
-    items = [line.split()] + [line.split() for line in f]
-
-    # Count the number of elements per line after the first.
-    # Wrapping in a set is a trick to make sure that every line
-    # has the same number of elements.
-    S = set([len(line) for line in items[1:]])
-    ncol = S.pop()
-    # If the set 'S' is not empty, at least two lines have a
-    # different number of items.
-    if S:
-        raise AutoReadFail('ERROR: unequal column number')
-
-    nrow = len(items)
+    first = line.split()
+    if nrow is None:
+        lines = list(lines)
+        nrow  = len(lines) + 1
+        lines = iter(lines)
+    try:
+        second = lines.next().split()
+    except StopIteration:
+        raise AutoReadFail('ERROR: non square matrix')
+    ncol = len(second)
     # Auto-detect the format, there are only 4 cases.
     if ncol == nrow:
         try:
-            _ = [float(item) for item in items[0]
+            _ = [float(item) for item in first
                  if not item.lower() in ['na', 'nan']]
             # Case 1: pure number matrix.
             header = False
@@ -78,7 +127,7 @@ def autoreader(f):
             trim = 1
             warn('WARNING: found header')
     else:
-        if len(items[0]) == len(items[1]):
+        if len(first) == len(second):
             # Case 3: matrix with row information.
             header = False
             trim = ncol - nrow
@@ -89,48 +138,98 @@ def autoreader(f):
             trim = ncol - nrow + 1
             warn('WARNING: found header and %d colum(s) of row names' % trim)
     # Remove header line if needed.
-    if header and not trim:
-        header = items.pop(0)
+    if header:
         nrow -= 1
-    elif not trim:
-        header = range(1, nrow + 1)
-    elif not header:
-        header = [tuple([a for a in line[:trim]]) for line in items]
+        lines = chain([second], (line.split() for line in lines))
+        if not trim:
+            header = first
     else:
-        del(items[0])
-        nrow -= 1
-        header = [tuple([a for a in line[:trim]]) for line in items]
-    # Get the numeric values and remove extra columns
-    what = int if HIC_DATA else float
+        lines = chain([first, second], (line.split() for line in lines))
+        if not trim:
+            header = range(1, nrow + 1)
+    if trim:
+        header = []
+    # Check that the matrix is square.
+    size = ncol - trim
+    if size != nrow:
+        raise AutoReadFail('ERROR: non square matrix')
+    # Get the numeric values by chunks of rows, and keep non-zeros
+    state = {}
+    nrows = max(1, chunk_size / ncol)
+    rows, cols, values = [], [], []
+    row = 0
+    while row < size:
+        chunk = list(islice(lines, nrows))
+        if not chunk:
+            raise AutoReadFail('ERROR: non square matrix')
+        if any(len(items) != ncol for items in chunk):
+            raise AutoReadFail('ERROR: unequal column number')
+        if trim:
+            header.extend(tuple(items[:trim]) for items in chunk)
+        matrix = _parse_numbers([items[trim:] for items in chunk], state)
+        nzrows, nzcols = np.nonzero(matrix)
+        rows.append(nzrows.astype(np.int32) + row)
+        cols.append(nzcols.astype(np.int32))
+        values.append(matrix[nzrows, nzcols])
+        row += len(chunk)
+    rows   = np.concatenate(rows)
+    cols   = np.concatenate(cols)
+    values = np.concatenate(values)
+    # Symmetrize
+    keys  = rows.astype(np.int64) * size + cols
+    tkeys = cols.astype(np.int64) * size + rows
+    order = np.argsort(tkeys)
+    tvals = values[order]
+    diff  = values != tvals
+    if values.dtype.kind == 'f':
+        diff &= ~(np.isnan(values) & np.isnan(tvals))
+    if (keys != tkeys[order]).any() or diff.any():
+        warn('WARNING: input matrix not symmetric: symmetrizing')
+        off = rows != cols
+        matrix = HiC_data.from_coo(np.concatenate((rows, cols[off])),
+                                   np.concatenate((cols, rows[off])),
+                                   np.concatenate((values, values[off])),
+                                   size)
+        rows, cols, values = matrix.get_coo()
+        nonzero = values != 0
+        rows, cols, values = rows[nonzero], cols[nonzero], values[nonzero]
+    return rows, cols, values, size, header
+
+
+def _parse_numbers(items, state):
+    """
+    converts a list of lists of strings into a NumPy array of numbers, rounded
+    to integers for Hi-C data. Warnings about values found are only issued
+    once per file (stored in state)
+    """
     try:
-        items = [[what(a) for a in line[trim:]] for line in items]
+        values = np.array(items, dtype=np.float64)
     except ValueError:
         if not HIC_DATA:
             raise AutoReadFail('ERROR: non numeric values')
+        # Some data may contain 'NaN' or 'NA'
         try:
-            # Dekker data 2009, uses integer but puts a comma... 
-            items = [[int(float(a)+.5) for a in line[trim:]] for line in items]
-            warn('WARNING: non integer values')
+            values = np.array([[float('nan') if a.lower() in ['na', 'nan']
+                                else float(a) for a in line]
+                               for line in items])
         except ValueError:
-            try:
-                # Some data may contain 'NaN' or 'NA'
-                items = [
-                    [0 if a.lower() in ['na', 'nan']
-                     else int(float(a)+.5) for a in line[trim:]]
-                for line in items]
-                warn('WARNING: NA or NaN founds, set to zero')
-            except ValueError:
-                raise AutoReadFail('ERROR: non numeric values')
-
-    # Check that the matrix is square.
-    ncol -= trim
-    if ncol != nrow:
-        raise AutoReadFail('ERROR: non square matrix')
-
-    if is_asymmetric(items):
-        warn('WARNING: input matrix not symmetric: symmetrizing')
-        symmetrize(items)
-    return tuple([a for line in items for a in line]), ncol, header
+            raise AutoReadFail('ERROR: non numeric values')
+    if not HIC_DATA:
+        return values
+    nans = np.isnan(values)
+    if nans.any():
+        values[nans] = 0
+        if not 'nan' in state:
+            state['nan'] = True
+            warn('WARNING: NA or NaN founds, set to zero')
+    integers = values == np.floor(values)
+    if not integers.all():
+        # Dekker data 2009, uses integer but puts a comma... 
+        if not 'float' in state:
+            state['float'] = True
+            warn('WARNING: non integer values')
+        values[~integers] += .5
+    return values.astype(np.int64)
 
 def _header_to_section(header, resolution):
     """
@@ -167,11 +266,14 @@ def _header_to_section(header, resolution):
 def read_matrix(things, parser=None, hic=True, resolution=1, **kwargs):
     """
     Read and checks a matrix from a file (using
-    :func:`pytadbit.parser.hic_parser.autoreader`) or a list.
+    :func:`pytadbit.parser.hic_parser.sparse_autoreader`) or a list.
 
     :param things: might be either a file name, a file handler or a list of
-        list (all with same length)
-    :param None parser: a parser function that returns a tuple of lists
+        list (all with same length). Files written by
+        :func:`HiC_data.write_matrix` in sparse or npz format, or by
+        :func:`HiC_data.save_hic_data`, are also recognized
+    :param None parser: a parser function (instead of the default one, that
+       reads text files by chunks) that returns a tuple of lists
        representing the data matrix,
        with this file example.tsv:
        ::
@@ -196,7 +298,6 @@ def read_matrix(things, parser=None, hic=True, resolution=1, **kwargs):
     one = kwargs.get('one', True)
     global HIC_DATA
     HIC_DATA = hic
-    parser = parser or autoreader
     if not isinstance(things, list):
         things = [things]
     matrices = []
@@ -204,29 +305,41 @@ def read_matrix(things, parser=None, hic=True, resolution=1, **kwargs):
         if isinstance(thing, HiC_data):
             matrices.append(thing)
         elif isinstance(thing, file):
-            matrix, size, header = parser(thing)
+            nrow = None
+            if not parser:
+                pos = thing.tell()
+                sparse = _is_sparse_text(thing)
+                thing.seek(pos)
+                if sparse:
+                    matrices.append(_sparse_text_to_hic_data(thing, resolution))
+                    thing.close()
+                    continue
+                nrow = _count_lines(thing)
+                thing.seek(pos)
+            matrices.append(_text_to_hic_data(thing, parser, resolution, nrow))
             thing.close()
-            chromosomes, sections, resolution = _header_to_section(header,
-                                                                   resolution)
-            matrices.append(HiC_data([(i, matrix[i]) for i in xrange(size**2)
-                                      if matrix[i]], size, dict_sec=sections,
-                                     chromosomes=chromosomes,
-                                     resolution=resolution))
+        elif isinstance(thing, str) and _is_binary_hic(thing):
+            matrices.append(load_hic_data(thing))
+        elif isinstance(thing, str) and not parser and _is_npz(thing):
+            matrices.append(_npz_to_hic_data(thing, resolution))
         elif isinstance(thing, str):
             try:
-                matrix, size, header = parser(gzopen(thing))
+                if not parser and _is_sparse_text(gzopen(thing)):
+                    matrices.append(_sparse_text_to_hic_data(gzopen(thing),
+                                                             resolution))
+                    continue
+                nrow = None if parser else _count_lines(gzopen(thing))
+                matrices.append(_text_to_hic_data(gzopen(thing), parser,
+                                                  resolution, nrow))
             except IOError:
-                if len(thing.split('\n')) > 1:
-                    matrix, size, header = parser(thing.split('\n'))
+                lines = thing.split('\n')
+                if len(lines) > 1 and not parser and _is_sparse_text(lines):
+                    matrices.append(_sparse_text_to_hic_data(lines, resolution))
+                elif len(lines) > 1:
+                    matrices.append(_text_to_hic_data(lines, parser,
+                                                      resolution))
                 else:
                     raise IOError('\n   ERROR: file %s not found\n' % thing)
-            sections = dict([(h, i) for i, h in enumerate(header)])
-            chromosomes, sections, resolution = _header_to_section(header,
-                                                                   resolution)
-            matrices.append(HiC_data([(i, matrix[i]) for i in xrange(size**2)
-                                      if matrix[i]], size, dict_sec=sections,
-                                     chromosomes=chromosomes,
-                                     resolution=resolution))
         elif isinstance(thing, list):
             if all([len(thing)==len(l) for l in thing]):
                 matrix  = reduce(lambda x, y: x+y, thing)
@@ -262,61 +375,558 @@ def read_matrix(things, parser=None, hic=True, resolution=1, **kwargs):
     else:
         return matrices
 
-def load_hic_data_from_reads(fnam, resolution, **kwargs):
+def _text_to_hic_data(f, parser, resolution, nrow=None):
+    """
+    builds a HiC_data object from the lines of a text matrix, read with the
+    parser given, or with :func:`pytadbit.parsers.hic_parser.sparse_autoreader`
+    """
+    if parser:
+        matrix, size, header = parser(f)
+    else:
+        rows, cols, values, size, header = sparse_autoreader(f, nrow=nrow)
+    chromosomes, sections, resolution = _header_to_section(header, resolution)
+    if parser:
+        return HiC_data([(i, matrix[i]) for i in xrange(size**2)
+                         if matrix[i]], size, dict_sec=sections,
+                        chromosomes=chromosomes, resolution=resolution)
+    return HiC_data.from_coo(rows, cols, values, size, sum_duplicates=False,
+                             dict_sec=sections, chromosomes=chromosomes,
+                             resolution=resolution)
+
+def _is_sparse_text(f):
+    """
+    checks if the first line of f is the one written by HiC_data.write_matrix
+    in sparse format
+    """
+    for line in f:
+        return line.startswith(SPARSE_MAGIC)
+    return False
+
+def _sparse_text_to_hic_data(f, resolution, chunk_size=2**20):
+    """
+    builds a HiC_data object from a file written by HiC_data.write_matrix in
+    sparse format, parsing chunk_size cells at once
+    """
+    lines = iter(f)
+    size, res, crms, upper, line = _sparse_text_header(lines)
+    if resolution == 1:
+        resolution = res
+    rows, cols, values = [], [], []
+    for crows, ccols, cvalues, _ in _sparse_text_cells(chain([line], lines),
+                                                       chunk_size):
+        rows.append(crows)
+        cols.append(ccols)
+        values.append(cvalues)
+    if values:
+        rows, cols, values = [np.concatenate(arrs)
+                              for arrs in (rows, cols, values)]
+    else:
+        rows = cols = np.zeros(0, dtype=np.int32)
+        values = np.zeros(0, dtype=np.int64 if HIC_DATA else np.float64)
+    return _sparse_to_hic_data(rows, cols, values, size, upper, crms,
+                               resolution)
+
+def _sparse_text_header(lines):
+    """
+    reads the header of a file written by HiC_data.write_matrix in sparse
+    format, up to the first line of cells (returned with the size, resolution,
+    chromosome fragments and triangle written)
+    """
+    crms = []
+    size = None
+    resolution = 1
+    upper = True
+    for line in lines:
+        if not line.strip():
+            continue
+        if line[0] != '#':
+            break
+        items = line[1:].split()
+        if items[0] == 'size':
+            size = int(items[1])
+        elif items[0] == 'resolution':
+            resolution = int(items[1])
+        elif items[0] == 'chromosome':
+            crms.append((items[1], int(items[2]), int(items[3])))
+        elif items[0] == 'triangle':
+            upper = items[1] == 'upper'
+    else:
+        line = ''
+    if size is None:
+        raise AutoReadFail('ERROR: matrix size not found in header')
+    return size, resolution, crms, upper, line
+
+def _sparse_text_cells(lines, chunk_size):
     """
-    :param fnam: tsv file with reads1 and reads2
+    yields the rows, columns and values of the cells found in the lines of a
+    sparse file (after its header), chunk_size lines at a time, with the
+    number of bytes parsed
+    """
+    state = {}
+    while True:
+        text  = ' '.join(islice(lines, chunk_size))
+        cells = text.split()
+        if not cells:
+            break
+        if len(cells) % 3:
+            raise AutoReadFail('ERROR: expected 3 columns (row, column and ' +
+                               'value)')
+        # numbers parsed at once, unless some value is not understood by NumPy
+        numbers = np.fromstring(text, sep=' ')
+        if len(numbers) == len(cells) and (numbers[0::3] % 1 == 0).all() and (
+            numbers[1::3] % 1 == 0).all():
+            yield (numbers[0::3].astype(np.int32),
+                   numbers[1::3].astype(np.int32),
+                   _parse_numbers(numbers[2::3], state), len(text))
+            continue
+        try:
+            rows = np.array(cells[0::3], dtype=np.int32)
+            cols = np.array(cells[1::3], dtype=np.int32)
+        except ValueError:
+            raise AutoReadFail('ERROR: non integer row or column index')
+        yield rows, cols, _parse_numbers([cells[2::3]], state)[0], len(text)
+
+def _file_cells(fname, chunk_size=2**20):
+    """
+    yields, by chunks, the rows, columns and values of the cells stored in a
+    file written by HiC_data.save_hic_data (one chunk per block), or by
+    HiC_data.write_matrix in sparse format (both triangles of the matrix are
+    yielded), with the number of bytes read for each chunk
+    """
+    if _is_binary_hic(fname):
+        for cells in load_hic_data(fname)._iter_blocks():
+            yield cells
+        return
+    lines = iter(gzopen(fname))
+    _, _, _, upper, line = _sparse_text_header(lines)
+    for rows, cols, values, nbytes in _sparse_text_cells(chain([line], lines),
+                                                         chunk_size):
+        if upper:
+            off = rows != cols
+            rows, cols = (np.concatenate((rows, cols[off])),
+                          np.concatenate((cols, rows[off])))
+            values = np.concatenate((values, values[off]))
+        yield rows, cols, values, nbytes
+
+def _file_size(fname):
+    """
+    number of rows of the matrix stored in a file written by
+    HiC_data.save_hic_data or by HiC_data.write_matrix in sparse format
+    """
+    if _is_binary_hic(fname):
+        return len(load_hic_data(fname))
+    return _sparse_text_header(iter(gzopen(fname)))[0]
+
+def _is_npz(fname):
+    """
+    checks if a file is a NumPy archive (zip file)
+    """
+    try:
+        fhandler = open(fname, 'rb')
+    except (IOError, TypeError, ValueError):
+        return False
+    magic = fhandler.read(4)
+    fhandler.close()
+    return magic == 'PK\x03\x04'
+
+def _npz_to_hic_data(fname, resolution):
+    """
+    builds a HiC_data object from a file written by HiC_data.write_matrix in
+    npz format
+    """
+    archive = np.load(fname)
+    try:
+        rows, cols, values = (archive['rows'], archive['cols'],
+                              archive['values'])
+        size = int(archive['size'])
+        if resolution == 1:
+            resolution = int(archive['resolution'])
+        upper = str(archive['triangle']) == 'upper'
+        crms = zip(archive['crm_names'].tolist(), archive['crm_first'].tolist(),
+                   archive['crm_bins'].tolist())
+    except KeyError:
+        raise AutoReadFail('ERROR: %s is not a npz file written by TADbit' %
+                           fname)
+    finally:
+        archive.close()
+    if HIC_DATA and values.dtype.kind == 'f':
+        values = _parse_numbers(values, {})
+    return _sparse_to_hic_data(rows, cols, values, size, upper, crms,
+                               resolution)
+
+def _sparse_to_hic_data(rows, cols, values, size, upper, crms, resolution):
+    """
+    builds a HiC_data object from the cells found in a sparse file (mirrored
+    if only the upper triangle was written) and the chromosome fragments of
+    its header
+    """
+    if upper:
+        off = rows != cols
+        rows, cols = (np.concatenate((rows, cols[off])),
+                      np.concatenate((cols, rows[off])))
+        values = np.concatenate((values, values[off]))
+    chromosomes = None
+    sections = {}
+    if crms:
+        chromosomes = OrderedDict()
+        for crm, first, nbins in crms:
+            for pos in xrange(first, first + nbins):
+                sections[(crm, pos)] = len(sections)
+            chromosomes.setdefault(crm, 0)
+            chromosomes[crm] += nbins
+    return HiC_data.from_coo(rows, cols, values, size, sum_duplicates=False,
+                             dict_sec=sections, chromosomes=chromosomes,
+                             resolution=resolution)
+
+def _is_binary_hic(fname):
+    """
+    checks if a file was written by HiC_data.save_hic_data
+    """
+    try:
+        fhandler = open(fname, 'rb')
+    except (IOError, TypeError, ValueError):
+        return False
+    magic = fhandler.read(len(BINARY_MAGIC))
+    fhandler.close()
+    return magic == BINARY_MAGIC
+
+
+def load_hic_data(fname):
+    """
+    Opens a HiC_data object saved with :func:`HiC_data.save_hic_data`.
+
+    Only the header is read, interactions are memory-mapped and each
+    chromosome pair is read from disk when accessed (i.e. with
+    ``get_matrix(focus=('chr3', 'chr3'))`` only the block of chr3 is loaded).
+    Modifying a cell loads the whole matrix in memory.
+
+    :param fname: path to the file
+
+    :returns: a HiC_data object
+    """
+    if not _is_binary_hic(fname):
+        raise IOError('ERROR: %s is not a binary HiC_data file\n' % fname)
+    fhandler = open(fname, 'rb')
+    fhandler.seek(-8, 2)
+    hstart = int(np.fromstring(fhandler.read(8), dtype='<u8')[0])
+    fhandler.seek(hstart)
+    header = loads(fhandler.read()[:-8])
+    fhandler.close()
+    hic = HiC_data((), header['size'], chromosomes=header['chromosomes'],
+                   dict_sec=header['sections'],
+                   resolution=header['resolution'], dtype=header['dtype'])
+    hic.bias = header['bias']
+    hic.bads = header['bads']
+    mmap  = np.memmap(fname, dtype=np.uint8, mode='r')
+    dtype = np.dtype(header['values'])
+    bounds = header['bounds']
+    blocks = {}
+    for _, _, k1, k2, offset, nnz in header['blocks']:
+        nrows = bounds[k1 + 1] - bounds[k1]
+        indptr = mmap[offset:offset + 8 * (nrows + 1)].view('<i8')
+        offset += 8 * (nrows + 1)
+        indices = mmap[offset:offset + 4 * nnz].view('<i4')
+        offset += _padded(4 * nnz)
+        data = mmap[offset:offset + dtype.itemsize * nnz].view(dtype)
+        blocks[k1, k2] = indptr, indices, data
+    hic._bounds = bounds
+    hic._blocks = blocks
+    hic._data   = np.zeros(0, dtype=dtype)
+    # to be pickled as a reference to the file (see HiC_data.__reduce__)
+    hic._origin = (path.abspath(fname),
+                   dict((k, header[k]) for k in _HEADER_ATTRS))
+    return hic
+
+
+def _attach_hic_data(fname, state):
+    """
+    opens memory-mapped a HiC_data pickled as a reference to its file, and
+    restores the attributes changed since it was opened
+    """
+    hic = load_hic_data(fname)
+    hic.__dict__.update(state)
+    return hic
+
+
+def _padded(nbytes):
+    """
+    number of bytes rounded up to a multiple of 8
+    """
+    return nbytes + (-nbytes % 8)
+
+
+def _block_coo(indptr, indices, data, row_off, col_off,
+               start1, end1, start2, end2):
+    """
+    coordinates (relative to start1 and start2) and values of the cells of a
+    CSR matrix (itself being a block, starting at row_off and col_off, of a
+    larger matrix) that fall in the rows start1 to end1 and columns start2 to
+    end2
+    """
+    beg1 = max(start1 - row_off, 0)
+    end1 = min(end1 - row_off, len(indptr) - 1)
+    if beg1 >= end1:
+        return (np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32),
+                np.zeros(0, dtype=data.dtype))
+    beg, end = indptr[beg1], indptr[end1]
+    rows = np.repeat(np.arange(beg1 + row_off - start1, end1 + row_off - start1,
+                               dtype=np.int32),
+                     np.diff(indptr[beg1:end1 + 1]))
+    cols = indices[beg:end] + (col_off - start2)
+    keep = (cols >= 0) & (cols < end2 - start2)
+    return rows[keep], cols[keep], data[beg:end][keep]
+
+
+def load_hic_data_from_reads(fnam, resolution, n_cpus=1, **kwargs):
+    """
+    :param fnam: tsv file with reads1 and reads2 (or directory of pairs of
+       reads stored by columns, see
+       :func:`pytadbit.parsers.pairs_parser.write_pairs_columns`)
     :param resolution: the resolution of the experiment (size of a bin in
-       bases)
+       bases). It can also be a list of resolutions, in which case the file is
+       read only once, and all of them are binned at the same time
     :param genome_seq: a dictionary containing the genomic sequence by
        chromosome
     :param False get_sections: for very very high resolution, when the column
        index does not fit in memory
+    :param 1 n_cpus: number of processes used to parse chunks of the file in
+       parallel (the counts of each chunk are summed at the end)
+    :param 1048576 chunk_size: number of reads parsed at once
+
+    :returns: a HiC_data object, or, if a list of resolutions is passed, a
+       dictionary of HiC_data objects with resolutions as keys
+    """
+    resolutions = (resolution if isinstance(resolution, (list, tuple))
+                   else [resolution])
+    chunk_size  = kwargs.get('chunk_size', 2**20)
+    # chromosome lengths from the header
+    columns  = is_pairs_columns(fnam)
+    if columns:
+        crm_lens = load_pairs_columns(fnam)['crm_lens']
+    else:
+        crm_lens = OrderedDict()
+        fhandler = open(fnam)
+        for line in fhandler:
+            if not line.startswith('#'):
+                break
+            if line.startswith('# CRM '):
+                crm, clen = line[6:].split()
+                crm_lens[crm] = int(clen)
+        fhandler.close()
+    crm_ids = dict((crm, i) for i, crm in enumerate(crm_lens))
+    binning = {}
+    for reso in resolutions:
+        nbins = np.array([clen / reso + 1 for clen in crm_lens.values()],
+                         dtype=np.int64)
+        offsets = np.cumsum(nbins) - nbins
+        binning[reso] = (nbins, offsets, int(nbins.sum()))
+    args = (fnam, crm_ids, binning, kwargs.get('get_sections', True),
+            chunk_size)
+    # bytes of the file, or pairs of reads if stored by columns
+    bin_reads = _bin_columns if columns else _bin_reads
+    if n_cpus > 1:
+        fsize = (load_pairs_columns(fnam)['nreads'] if columns else
+                 path.getsize(fnam))
+        bounds = [fsize * i / n_cpus for i in xrange(n_cpus + 1)]
+        pool = mu.Pool(n_cpus)
+        procs = [pool.apply_async(bin_reads, args=args + (beg, end))
+                 for beg, end in zip(bounds[:-1], bounds[1:])]
+        pool.close()
+        pool.join()
+        counts = [proc.get() for proc in procs]
+    else:
+        counts = [bin_reads(*args)]
+    counts, dropped = zip(*counts)
+    hic_datas = {}
+    for reso in resolutions:
+        nbins, _, size = binning[reso]
+        ndropped = sum(drop[reso] for drop in dropped)
+        if ndropped:
+            warn(('WARNING: %d reads outside the matrix at resolution %d, ' +
+                  'not stored') % (ndropped, reso))
+        genome_seq = OrderedDict(zip(crm_lens, nbins.tolist()))
+        sections = []
+        if kwargs.get('get_sections', True):
+            for crm in genome_seq:
+                sections.extend([(crm, i) for i in xrange(genome_seq[crm])])
+        dict_sec = dict([(j, i) for i, j in enumerate(sections)])
+        keys = np.concatenate([cnt[reso][0] for cnt in counts])
+        vals = np.concatenate([cnt[reso][1] for cnt in counts])
+        hic_datas[reso] = HiC_data.from_coo(keys / size, keys % size, vals,
+                                            size, chromosomes=genome_seq,
+                                            dict_sec=dict_sec, resolution=reso)
+    if isinstance(resolution, (list, tuple)):
+        return hic_datas
+    return hic_datas[resolution]
+
+
+def _bin_reads(fnam, crm_ids, binning, get_sections, chunk_size,
+               beg=0, end=None):
+    """
+    Parses the reads of a file, or of the lines starting between the bytes beg
+    and end, by chunks, and counts the interactions at each resolution.
+
+    :returns: a dictionary with, for each resolution, an array of cell
+       positions (row * size + column) and an array of counts, and a
+       dictionary with the number of reads outside the matrix at each
+       resolution
     """
-    sections = []
-    genome_seq = OrderedDict()
     fhandler = open(fnam)
-    line = fhandler.next()
-    size = 0
-    while line.startswith('#'):
-        if line.startswith('# CRM '):
-            crm, clen = line[6:].split()
-            genome_seq[crm] = int(clen) / resolution + 1
-            size += genome_seq[crm]
-        line = fhandler.next()
-    section_sizes = {}
-    if kwargs.get('get_sections', True):
-        for crm in genome_seq:
-            len_crm = genome_seq[crm]
-            section_sizes[(crm,)] = len_crm
-            sections.extend([(crm, i) for i in xrange(len_crm)])
-    dict_sec = dict([(j, i) for i, j in enumerate(sections)])
-    imx = HiC_data((), size, genome_seq, dict_sec, resolution=resolution)
-    while True:
-        _, cr1, ps1, _, _, _, _, cr2, ps2, _ = line.split('\t', 9)
-        try:
-            ps1 = dict_sec[(cr1, int(ps1) / resolution)]
-            ps2 = dict_sec[(cr2, int(ps2) / resolution)]
-        except KeyError:
-            ps1 = int(ps1) / resolution
-            ps2 = int(ps2) / resolution
-        imx[ps1, ps2] += 1
-        imx[ps2, ps1] += 1
-        try:
-            line = fhandler.next()
-        except StopIteration:
+    if beg:
+        fhandler.seek(beg - 1)
+        beg += len(fhandler.readline()) - 1
+    counts = dict((reso, []) for reso in binning)
+    dropped = dict((reso, 0) for reso in binning)
+    nstored = 0
+    lines = []
+    while end is None or beg < end:
+        line = fhandler.readline()
+        if not line:
             break
-    return imx
+        beg += len(line)
+        if line.startswith('#'):
+            continue
+        lines.append(line)
+        if len(lines) < chunk_size:
+            continue
+        nstored += _count_chunk(lines, crm_ids, binning, get_sections, counts,
+                                dropped)
+        lines = []
+        # sum counts from different chunks before they use too much memory
+        if nstored > 4 * chunk_size:
+            nstored = 0
+            for reso in counts:
+                counts[reso] = [_sum_counts(counts[reso])]
+                nstored += len(counts[reso][0][0])
+    fhandler.close()
+    if lines:
+        _count_chunk(lines, crm_ids, binning, get_sections, counts, dropped)
+    return dict((reso, _sum_counts(counts[reso])) for reso in counts), dropped
+
+
+def _bin_columns(fnam, crm_ids, binning, get_sections, chunk_size,
+                 beg=0, end=None):
+    """
+    Same as _bin_reads, for pairs of reads stored by columns (beg and end are
+    numbers of pairs of reads)
+    """
+    pairs = load_pairs_columns(fnam)
+    end = pairs['nreads'] if end is None else end
+    # index of the chromosomes of the file in the header
+    ids = np.array([crm_ids.get(crm, -1) for crm in pairs['chromosomes']] or
+                   [-1], dtype=np.int64)
+    counts = dict((reso, []) for reso in binning)
+    dropped = dict((reso, 0) for reso in binning)
+    nstored = 0
+    for pos in xrange(beg, end, chunk_size):
+        last = min(pos + chunk_size, end)
+        crms = ids[np.concatenate((pairs['crm1'][pos:last],
+                                   pairs['crm2'][pos:last]))]
+        poss = np.concatenate((pairs['pos1'][pos:last],
+                               pairs['pos2'][pos:last])).astype(np.int64)
+        nstored += _count_positions(crms, poss, binning, get_sections, counts,
+                                    dropped)
+        # sum counts from different chunks before they use too much memory
+        if nstored > 4 * chunk_size:
+            nstored = 0
+            for reso in counts:
+                counts[reso] = [_sum_counts(counts[reso])]
+                nstored += len(counts[reso][0][0])
+    return dict((reso, _sum_counts(counts[reso])) for reso in counts), dropped
+
+
+def _count_chunk(lines, crm_ids, binning, get_sections, counts, dropped):
+    """
+    bins a list of reads at all resolutions, the number of cells counted is
+    appended to counts and their number returned (see _count_positions)
+    """
+    _, cr1, ps1, _, _, _, _, cr2, ps2 = zip(*[line.split('\t', 9)[:9]
+                                              for line in lines])
+    crms, crms_idx = np.unique(cr1 + cr2, return_inverse=True)
+    crms = np.array([crm_ids.get(crm, -1) for crm in crms],
+                    dtype=np.int64)[crms_idx]
+    poss = np.array(ps1 + ps2, dtype=np.int64)
+    return _count_positions(crms, poss, binning, get_sections, counts,
+                            dropped)
+
+
+def _count_positions(crms, poss, binning, get_sections, counts, dropped):
+    """
+    bins reads at all resolutions, from the index of the chromosome (-1 if
+    unknown) and the position of the first reads followed by those of the
+    second reads. The cells counted are appended to counts and their number
+    returned, reads falling outside the matrix are added to dropped
+    """
+    nreads = len(poss) / 2
+    nstored = 0
+    for reso, (nbins, offsets, size) in binning.iteritems():
+        bins = poss / reso
+        if get_sections:
+            # positions outside known chromosomes are kept as bin numbers
+            known = crms >= 0
+            known[known] = bins[known] < nbins[crms[known]]
+            bins[known] += offsets[crms[known]]
+        bin1, bin2 = bins[:nreads], bins[nreads:]
+        valid = (bin1 >= 0) & (bin1 < size) & (bin2 >= 0) & (bin2 < size)
+        dropped[reso] += nreads - int(np.count_nonzero(valid))
+        bin1, bin2 = bin1[valid], bin2[valid]
+        keys = np.concatenate((bin1 * size + bin2, bin2 * size + bin1))
+        keys, cnts = np.unique(keys, return_counts=True)
+        counts[reso].append((keys, cnts))
+        nstored += len(keys)
+    return nstored
+
+
+def _sum_counts(counts):
+    """
+    merges lists of cell positions and counts, summing duplicated cells
+    """
+    if not counts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    keys = np.concatenate([k for k, _ in counts])
+    cnts = np.concatenate([c for _, c in counts])
+    keys, idx = np.unique(keys, return_inverse=True)
+    return keys, np.bincount(idx, weights=cnts).astype(np.int64)
 
 
 class HiC_data(dict):
     """
     This may also hold the print/write-to-file matrix functions
+
+    Interactions are not stored as dictionary items, but as a sparse matrix
+    in compressed sparse row format (NumPy arrays of row pointers, int32
+    column indices and values). Cells that do not exist yet when they are
+    set are buffered in a small dictionary, merged into the arrays by blocks.
+    Dictionary methods (get, keys, values, iteritems...) work as before, with
+    keys being row * size + column.
+
+    :param items: list of (position, value) pairs, with position equal to
+       row * size + column
+    :param size: number of rows (and columns) of the matrix
+    :param None dtype: NumPy type of the values stored (e.g. 'float32' to
+       halve the memory used by normalized data). By default int32 is used
+       for counts and float64 for any other value
     """
+    # minimum number of new cells to buffer before merging them in the arrays
+    _buffer_size = 2**20
+
     def __init__(self, items, size, chromosomes=None, dict_sec=None,
-                 resolution=1):
-        super(HiC_data, self).__init__(items)
+                 resolution=1, dtype=None):
+        super(HiC_data, self).__init__()
         self.__size = size
         self._size2 = size**2
+        self._dtype = dtype
+        self._indptr  = np.zeros(size + 1, dtype=np.int64)
+        self._indices = np.zeros(0, dtype=np.int32)
+        self._data    = np.zeros(0, dtype=dtype or np.int32)
+        self._pending = {}
+        self._deleted = set()
+        self._blocks  = None
+        self._bounds  = None
+        self._bindex  = None
+        self._stats   = None
+        self._expected = None
+        self._origin  = None
         self.bias = None
         self.bads = None
         self.chromosomes = chromosomes
@@ -328,6 +938,202 @@ class HiC_data(dict):
             for crm in self.chromosomes:
                 self.section_pos[crm] = (total, total + self.chromosomes[crm])
                 total += self.chromosomes[crm]
+        if isinstance(items, dict):
+            items = items.items()
+        if items:
+            pos = np.fromiter((p for p, _ in items), dtype=np.int64,
+                              count=len(items))
+            val = np.array([v for _, v in items])
+            self._set_coo(pos // size, pos % size, val, sum_duplicates=False)
+
+    @classmethod
+    def from_coo(cls, rows, cols, values, size, sum_duplicates=True, **kwargs):
+        """
+        Creates a HiC_data object directly from arrays of coordinates.
+
+        :param rows: array of row indexes
+        :param cols: array of column indexes
+        :param values: array of values
+        :param size: number of rows (and columns) of the matrix
+        :param True sum_duplicates: values of cells found more than once are
+           summed, otherwise the last one is kept
+        :param kwargs: any other argument of HiC_data (chromosomes, dict_sec,
+           resolution, dtype)
+
+        :returns: a HiC_data object
+        """
+        hic = cls((), size, **kwargs)
+        hic._set_coo(np.asarray(rows), np.asarray(cols), np.asarray(values),
+                     sum_duplicates=sum_duplicates)
+        return hic
+
+    def _value_dtype(self, values):
+        """
+        smallest NumPy type able to store the given values
+        """
+        if self._dtype:
+            return self._dtype
+        if values.dtype.kind in 'biu':
+            if len(values) and (values.max() > 2147483647 or
+                                values.min() < -2147483648):
+                return np.int64
+            return np.int32
+        return np.float64
+
+    def _set_coo(self, rows, cols, values, sum_duplicates=True):
+        """
+        replace the content of the matrix by the given coordinates and values
+        """
+        size = self.__size
+        keys = rows.astype(np.int64) * size + cols
+        order = np.argsort(keys, kind='mergesort')
+        keys = keys[order]
+        values = values[order]
+        if len(keys):
+            uniq = np.concatenate(([True], keys[1:] != keys[:-1]))
+            if not uniq.all():
+                if sum_duplicates:
+                    values = np.add.reduceat(values, np.flatnonzero(uniq))
+                else: # as in a dictionary, last value set is kept
+                    values = values[np.concatenate((uniq[1:], [True]))]
+                keys = keys[uniq]
+        rows = keys // size
+        self._indices = (keys % size).astype(np.int32)
+        self._data    = values.astype(self._value_dtype(values))
+        self._bindex  = None
+        self._stats   = None
+        self._expected = None
+        self._indptr  = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=size)[:size],
+                  out=self._indptr[1:])
+
+    def _rows(self):
+        """
+        row index of each of the values stored in the arrays
+        """
+        return np.repeat(np.arange(self.__size, dtype=np.int32),
+                         np.diff(self._indptr))
+
+    def _materialize(self):
+        """
+        load in memory all the blocks of a HiC_data opened with load_hic_data
+        """
+        bounds = self._bounds
+        rows, cols, values = [], [], []
+        for (k1, k2), (indptr, indices, data) in self._blocks.iteritems():
+            rows.append(np.repeat(np.arange(bounds[k1], bounds[k1 + 1],
+                                            dtype=np.int32), np.diff(indptr)))
+            cols.append(indices + bounds[k2])
+            values.append(np.array(data))
+        self._blocks = self._bounds = None
+        if rows:
+            self._set_coo(np.concatenate(rows), np.concatenate(cols),
+                          np.concatenate(values), sum_duplicates=False)
+
+    def _block_bounds(self):
+        """
+        first row of each chromosome, plus the size of the matrix
+        """
+        return sorted(set([0, self.__size] +
+                          [beg for beg, _ in self.section_pos.values()
+                           if beg < self.__size]))
+
+    def _block_index(self):
+        """
+        stored cells grouped by pair of chromosomes: the boundaries of the
+        chromosomes, the order of the cells sorted by block (and by row and
+        column within a block), and the offset of each block in this order.
+        Computed once, until the cells or the chromosomes change
+        """
+        self._compact()
+        bounds = self._block_bounds()
+        bindex = getattr(self, '_bindex', None)
+        if bindex is not None and bindex[0] == bounds:
+            return bindex
+        nblk = len(bounds) - 1
+        krow = np.repeat(np.arange(nblk), np.diff(self._indptr[bounds]))
+        kcol = np.searchsorted(bounds, self._indices, side='right') - 1
+        keys = krow * nblk + kcol
+        order = np.argsort(keys, kind='mergesort')
+        if len(order) < 2**31:
+            order = order.astype(np.int32)
+        offsets = np.zeros(nblk**2 + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys, minlength=nblk**2), out=offsets[1:])
+        self._bindex = bounds, order, offsets
+        return self._bindex
+
+    def _block_get(self, pos):
+        """
+        value of a cell read from the blocks of a HiC_data opened with
+        load_hic_data, None if absent
+        """
+        row, col = divmod(pos, self.__size)
+        if row >= self.__size:
+            return None
+        k1 = bisect_right(self._bounds, row) - 1
+        k2 = bisect_right(self._bounds, col) - 1
+        try:
+            indptr, indices, data = self._blocks[k1, k2]
+        except KeyError:
+            return None
+        row -= self._bounds[k1]
+        col -= self._bounds[k2]
+        beg, end = indptr[row], indptr[row + 1]
+        idx = beg + indices[beg:end].searchsorted(col)
+        if idx < end and indices[idx] == col:
+            return data[idx].item()
+        return None
+
+    def _compact(self):
+        """
+        merge buffered cells into the arrays, and drop deleted ones
+        """
+        if self._blocks is not None:
+            self._materialize()
+        if not self._pending and not self._deleted:
+            return
+        size = self.__size
+        rows, cols, values = self._rows(), self._indices, self._data
+        if self._deleted:
+            keep = np.in1d(rows.astype(np.int64) * size + cols,
+                           np.fromiter(self._deleted, dtype=np.int64,
+                                       count=len(self._deleted)),
+                           invert=True)
+            rows, cols, values = rows[keep], cols[keep], values[keep]
+        if self._pending:
+            pos = np.fromiter(self._pending.iterkeys(), dtype=np.int64,
+                              count=len(self._pending))
+            rows   = np.concatenate((rows, pos // size))
+            cols   = np.concatenate((cols, pos % size))
+            values = np.concatenate((values,
+                                     np.array(self._pending.values())))
+        self._pending = {}
+        self._deleted = set()
+        self._set_coo(rows, cols, values, sum_duplicates=False)
+
+    def _resize(self, size):
+        """
+        change the number of rows/columns, keeping the cells that fit in
+        """
+        self._compact()
+        rows = self._rows()
+        keep = (rows < size) & (self._indices < size)
+        self.__size = size
+        self._size2 = size**2
+        self._set_coo(rows[keep], self._indices[keep], self._data[keep])
+
+    def _find(self, pos):
+        """
+        index, in the arrays, of the cell at a given position, -1 if absent
+        """
+        row, col = divmod(pos, self.__size)
+        if row >= self.__size:
+            return -1
+        beg, end = self._indptr[row], self._indptr[row + 1]
+        idx = beg + self._indices[beg:end].searchsorted(col)
+        if idx < end and self._indices[idx] == col:
+            return idx
+        return -1
 
     def __len__(self):
         return self.__size
@@ -356,19 +1162,813 @@ class HiC_data(dict):
         slow one... for user
         for fast item getting, use self.get()
         """
+        if not '_indptr' in self.__dict__: # unpickling an old HiC_data
+            return super(HiC_data, self).__setitem__(row_col, val)
         try:
             row, col = row_col
             pos = row * self.__size + col
             if pos > self._size2:
                 raise IndexError(
                     'ERROR: row or column larger than %s' % self.__size)
-            super(HiC_data, self).__setitem__(pos, val)
         except TypeError:
             if row_col > self._size2:
                 raise IndexError(
                     'ERROR: position %d larger than %s^2' % (row_col,
                                                              self.__size))
-            super(HiC_data, self).__setitem__(row_col, val)
+            pos = row_col
+        if self._blocks is not None:
+            self._materialize()
+        self._stats = None
+        self._expected = None
+        if pos in self._pending:
+            self._pending[pos] = val
+            return
+        idx = self._find(pos)
+        if idx < 0:
+            self._pending[pos] = val
+            if len(self._pending) > max(self._buffer_size,
+                                        len(self._data) / 4):
+                self._compact()
+            return
+        if self._deleted:
+            self._deleted.discard(pos)
+        if self._data.dtype.kind in 'iu' and not self._dtype:
+            if isinstance(val, (float, np.floating)):
+                self._data = self._data.astype(np.float64)
+            elif not -2147483648 <= val <= 2147483647:
+                self._data = self._data.astype(np.int64)
+        self._data[idx] = val
+
+    def __delitem__(self, pos):
+        if self._blocks is not None:
+            self._materialize()
+        self._stats = None
+        self._expected = None
+        if pos in self._pending:
+            del(self._pending[pos])
+        elif self._find(pos) >= 0 and not pos in self._deleted:
+            self._deleted.add(pos)
+        else:
+            raise KeyError(pos)
+
+    def __contains__(self, pos):
+        if self._blocks is not None:
+            return self._block_get(pos) is not None
+        if pos in self._pending:
+            return True
+        return self._find(pos) >= 0 and not pos in self._deleted
+
+    def has_key(self, pos):
+        return pos in self
+
+    def get(self, pos, default=None):
+        if self._blocks is not None:
+            val = self._block_get(pos)
+            return default if val is None else val
+        try:
+            return self._pending[pos]
+        except KeyError:
+            pass
+        idx = self._find(pos)
+        if idx < 0 or (self._deleted and pos in self._deleted):
+            return default
+        return self._data[idx].item()
+
+    def keys(self):
+        self._compact()
+        return (self._rows().astype(np.int64) * self.__size +
+                self._indices).tolist()
+
+    def values(self):
+        self._compact()
+        return self._data.tolist()
+
+    def items(self):
+        return zip(self.keys(), self.values())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def iterkeys(self):
+        return iter(self.keys())
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def pop(self, pos, *default):
+        try:
+            val = self.get(pos) if pos in self else default[0]
+        except IndexError:
+            raise KeyError(pos)
+        if pos in self:
+            del(self[pos])
+        return val
+
+    def setdefault(self, pos, default=None):
+        if not pos in self:
+            self[pos] = default
+        return self.get(pos)
+
+    def update(self, other=(), **kwargs):
+        if hasattr(other, 'keys'):
+            other = ((k, other[k]) for k in other.keys())
+        for pos, val in other:
+            self[pos] = val
+        for pos, val in kwargs.iteritems():
+            self[pos] = val
+
+    def clear(self):
+        self._pending = {}
+        self._deleted = set()
+        self._indptr  = np.zeros(self.__size + 1, dtype=np.int64)
+        self._indices = np.zeros(0, dtype=np.int32)
+        self._data    = np.zeros(0, dtype=self._dtype or np.int32)
+        self._bindex  = None
+        self._stats   = None
+        self._expected = None
+
+    def copy(self):
+        return deepcopy(self)
+
+    def __eq__(self, other):
+        if not isinstance(other, dict):
+            return NotImplemented
+        return dict(self.iteritems()) == dict(other.iteritems())
+
+    def __ne__(self, other):
+        if not isinstance(other, dict):
+            return NotImplemented
+        return not self == other
+
+    def __repr__(self):
+        return repr(dict(self.iteritems()))
+
+    def __reduce__(self):
+        origin = getattr(self, '_origin', None)
+        if self._blocks is not None and origin:
+            # still memory-mapped: only the name of the file and the
+            # attributes modified since it was opened are pickled
+            fname, header = origin
+            state = dict((k, v) for k, v in self.__dict__.iteritems()
+                         if not k in ['_indptr', '_indices', '_data', '_blocks',
+                                      '_bounds', '_bindex', '_stats',
+                                      '_expected', '_origin']
+                         and not (k in header and header[k] is v))
+            return (_attach_hic_data, (fname, state))
+        self._compact()
+        state = dict(self.__dict__)
+        state['_origin'] = None
+        state['_bindex'] = None
+        state['_stats']  = None
+        state['_expected'] = None
+        return (HiC_data, ((), self.__size), state)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if '_indptr' in state:
+            return
+        # HiC_data pickled before values were stored in arrays
+        items = super(HiC_data, self).items()
+        super(HiC_data, self).clear()
+        size = self.__size
+        self._dtype = None
+        self._pending = {}
+        self._deleted = set()
+        self._blocks  = None
+        self._bounds  = None
+        self._set_coo(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                      np.zeros(0, dtype=np.int32))
+        if items:
+            pos = np.array([p for p, _ in items], dtype=np.int64)
+            self._set_coo(pos // size, pos % size,
+                          np.array([v for _, v in items]),
+                          sum_duplicates=False)
+
+    def get_coo(self):
+        """
+        Coordinates and values of the cells stored (views on the internal
+        arrays, should not be modified).
+
+        :returns: three NumPy arrays with rows, columns and values, sorted by
+           row and column
+        """
+        if self._blocks is not None:
+            # memory-mapped (e.g. shared with HiC_data.share): copies of the
+            # cells of all blocks, leaving them on disk
+            rows, cols, values = [np.concatenate(arrs) for arrs in
+                                  zip(*self._iter_coo())] or [
+                np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32),
+                self._data]
+            order = np.argsort(rows.astype(np.int64) * self.__size + cols,
+                               kind='mergesort')
+            return (rows[order].astype(np.int32), cols[order].astype(np.int32),
+                    values[order])
+        self._compact()
+        return self._rows(), self._indices, self._data
+
+    def fingerprint(self):
+        """
+        Hash of the content of the matrix: size, resolution, chromosomes and
+        non-zero cells (read block by block for a HiC_data opened with
+        :func:`pytadbit.parsers.hic_parser.load_hic_data`).
+
+        :returns: an hexadecimal string
+        """
+        sha = sha1(repr((self.__size, self.resolution,
+                         self.chromosomes.items() if self.chromosomes else None,
+                         sorted(self.section_pos.items())
+                         if self.section_pos else None)))
+        for rows, cols, values in self._iter_coo():
+            nonzero = values != 0
+            if not nonzero.all():
+                rows, cols, values = (rows[nonzero], cols[nonzero],
+                                      values[nonzero])
+            # cells are sorted by row: number of cells of each row instead of
+            # their rows
+            sha.update(np.bincount(rows, minlength=self.__size))
+            sha.update(np.ascontiguousarray(cols, dtype=np.int32))
+            sha.update(np.ascontiguousarray(values, dtype=np.float64))
+        return sha.hexdigest()
+
+    def get_row(self, row, start=0, end=None):
+        """
+        Dense row of the matrix.
+
+        :param row: index of the row
+        :param 0 start: first column
+        :param None end: last column (not included), by default the size of
+           the matrix
+
+        :returns: a NumPy array
+        """
+        return self.get_block(row, row + 1, start,
+                              self.__size if end is None else end)[0]
+
+    def get_block(self, start1, end1, start2, end2):
+        """
+        Dense rectangular region of the matrix, only the cells stored in the
+        rows requested are visited.
+
+        :param start1: first row
+        :param end1: last row (not included)
+        :param start2: first column
+        :param end2: last column (not included)
+
+        :returns: a NumPy array of shape (end1 - start1, end2 - start2)
+        """
+        rows, cols, values = self._get_block_coo(start1, end1, start2, end2)
+        block = np.zeros((end1 - start1, end2 - start2), dtype=values.dtype)
+        block[rows, cols] = values
+        return block
+
+    def _get_block_coo(self, start1, end1, start2, end2):
+        """
+        coordinates (relative to start1 and start2) and values of the cells
+        stored in a rectangular region of the matrix
+        """
+        if self._blocks is None:
+            self._compact()
+            bounds = self._block_bounds()
+            if (len(bounds) > 2 and start1 in bounds and end1 in bounds and
+                start2 in bounds and end2 in bounds):
+                return self._index_coo(start1, end1, start2, end2)
+            return _block_coo(self._indptr, self._indices, self._data, 0, 0,
+                              start1, end1, start2, end2)
+        bounds = self._bounds
+        coos = [_block_coo(indptr, indices, data, bounds[k1], bounds[k2],
+                           start1, end1, start2, end2)
+                for (k1, k2), (indptr, indices, data)
+                in sorted(self._blocks.iteritems())
+                if (bounds[k1] < end1 and bounds[k1 + 1] > start1 and
+                    bounds[k2] < end2 and bounds[k2 + 1] > start2)]
+        if not coos:
+            return (np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32),
+                    np.zeros(0, dtype=self._data.dtype))
+        return tuple(np.concatenate(arrs) for arrs in zip(*coos))
+
+    def _index_coo(self, start1, end1, start2, end2):
+        """
+        same as _get_block_coo, for a region limited by chromosome boundaries,
+        only the cells of the corresponding blocks are visited
+        """
+        bounds, order, offsets = self._block_index()
+        nblk = len(bounds) - 1
+        idx = [order[offsets[k1 * nblk + k2]:offsets[k1 * nblk + k2 + 1]]
+               for k1 in xrange(bounds.index(start1), bounds.index(end1))
+               for k2 in xrange(bounds.index(start2), bounds.index(end2))]
+        idx = np.concatenate(idx) if idx else np.zeros(0, dtype=np.int32)
+        rows = np.searchsorted(self._indptr, idx, side='right') - 1 - start1
+        return (rows.astype(np.int32), self._indices[idx] - start2,
+                self._data[idx])
+
+    def get_block_sums(self, normalized=False, diagonal=True):
+        """
+        Sum of the values, and number of cells stored, of each block of the
+        matrix corresponding to a pair of chromosomes (all blocks are computed
+        in a single pass over the cells stored).
+
+        :param False normalized: sum normalized values
+        :param True diagonal: if False, values in the diagonal are replaced by
+           ones (zero if no interaction)
+
+        :returns: a dictionary with pairs of chromosome names as keys, and
+           tuples (sum, number of cells) as values. Blocks without any cell
+           stored are not reported
+        """
+        if normalized and not self.bias:
+            raise Exception('ERROR: experiment not normalized yet')
+        if self._blocks is None:
+            bounds, order, offsets = self._block_index()
+            nblk = len(bounds) - 1
+            blocks = [divmod(k, nblk) for k in xrange(nblk**2)]
+            rows, cols, values = self._rows(), self._indices, self._data
+        else:
+            bounds = self._bounds
+            blocks = sorted(self._blocks)
+            if not blocks:
+                return {}
+            order = None
+            rows, cols, values = [], [], []
+            for k1, k2 in blocks:
+                indptr, indices, data = self._blocks[k1, k2]
+                rows.append(np.repeat(np.arange(bounds[k1], bounds[k1 + 1]),
+                                      np.diff(indptr)))
+                cols.append(indices + bounds[k2])
+                values.append(data)
+            offsets = np.cumsum([0] + [len(data) for data in values])
+            rows, cols, values = (np.concatenate(rows), np.concatenate(cols),
+                                  np.concatenate(values))
+        if normalized:
+            bias = self._bias_array(0, self.__size)
+            values = values / bias[rows] / bias[cols]
+        if not diagonal:
+            diag = rows == cols
+            values = np.array(values)
+            values[diag] = values[diag] != 0
+        if order is not None:
+            values = values[order]
+        counts = np.diff(offsets)
+        sums = np.bincount(np.repeat(np.arange(len(blocks)), counts),
+                           weights=values, minlength=len(blocks))
+        if values.dtype.kind in 'iu':
+            sums = sums.round().astype(np.int64)
+        names = dict((beg, crm) for crm, (beg, _) in self.section_pos.items())
+        return dict(((names.get(bounds[k1]), names.get(bounds[k2])),
+                     (sums[i].item(), counts[i].item()))
+                    for i, (k1, k2) in enumerate(blocks) if counts[i])
+
+    def _focus_coords(self, focus):
+        """
+        converts the focus parameter of get_matrix, yield_matrix or
+        write_matrix into start and end rows and columns
+        """
+        if focus:
+            if isinstance(focus, tuple) and isinstance(focus[0], int):
+                if len(focus) == 2:
+                    start1, end1 = focus
+                    start2, end2 = focus
+                    start1 -= 1
+                    start2 -= 1
+                else:
+                    start1, end1, start2, end2 = focus
+                    start1 -= 1
+                    start2 -= 1
+            elif isinstance(focus, tuple) and isinstance(focus[0], str):
+                start1, end1 = self.section_pos[focus[0]]
+                start2, end2 = self.section_pos[focus[1]]
+            else:
+                start1, end1 = self.section_pos[focus]
+                start2, end2 = self.section_pos[focus]
+        else:
+            start1 = start2 = 0
+            end1   = end2   = len(self)
+        return start1, end1, start2, end2
+
+    def get_array(self, focus=None, diagonal=True, normalized=False,
+                  sparse=False):
+        """
+        returns a matrix as a NumPy array, built directly from the cells stored
+        (normalization is applied to the whole block at once)
+
+        :param None focus: a tuple with the (start, end) position of the desired
+           window of data (start, starting at 1, and both start and end are
+           inclusive). Alternatively a chromosome name can be input or a tuple
+           of chromosome name, in order to retrieve a specific inter-chromosomal
+           region. Rows of the matrix returned correspond to the first element
+           of the tuple and columns to the second
+        :param True diagonal: if False, values in the diagonal are replaced by
+           ones (zero if no interaction)
+        :param False normalized: get normalized data
+        :param False sparse: returns a scipy.sparse.csr_matrix instead of a
+           dense array
+
+        :returns: a NumPy array (or a scipy sparse matrix)
+        """
+        if normalized and not self.bias:
+            raise Exception('ERROR: experiment not normalized yet')
+        start1, end1, start2, end2 = self._focus_coords(focus)
+        return self._array(start1, end1, start2, end2, diagonal=diagonal,
+                           normalized=normalized, sparse=sparse)
+
+    def _array(self, start1, end1, start2, end2, diagonal=True,
+               normalized=False, sparse=False):
+        """
+        rows start1 to end1 and columns start2 to end2 of the matrix as a NumPy
+        array (see get_array)
+        """
+        rows, cols, values = self._get_block_coo(start1, end1, start2, end2)
+        if normalized:
+            values = (values / self._bias_array(start1, end1)[rows]
+                      / self._bias_array(start2, end2)[cols])
+        if not diagonal and start1 == start2:
+            diag = rows == cols
+            values = values.copy()
+            values[diag] = values[diag] != 0
+        shape = (end1 - start1, end2 - start2)
+        if sparse:
+            from scipy.sparse import csr_matrix
+            return csr_matrix((values, (rows, cols)), shape=shape)
+        mtrx = np.zeros(shape, dtype=values.dtype)
+        mtrx[rows, cols] = values
+        return mtrx
+
+    def _iter_coo(self):
+        """
+        rows, columns and values of the cells stored, by pieces (one per block
+        of a HiC_data opened with load_hic_data, that is not loaded in memory)
+        """
+        for rows, cols, values, _ in self._iter_blocks():
+            yield rows, cols, values
+
+    def _iter_blocks(self):
+        """
+        same as _iter_coo, also yielding the number of bytes read from the file
+        of a HiC_data opened with load_hic_data (zero if in memory)
+        """
+        if self._blocks is None:
+            self._compact()
+            yield self._rows(), self._indices, self._data, 0
+            return
+        bounds = self._bounds
+        for (k1, k2), (indptr, indices, data) in self._blocks.iteritems():
+            yield (np.repeat(np.arange(bounds[k1], bounds[k1 + 1]),
+                             np.diff(indptr)), indices + bounds[k2], data,
+                   indptr.nbytes + indices.nbytes + data.nbytes)
+
+    def _coverage(self):
+        """
+        sum of each row, number of non-zero cells of each row, diagonal and
+        total of the matrix. Computed in a single pass over the cells stored,
+        and kept until a cell or the sections are modified
+        """
+        stats = getattr(self, '_stats', None)
+        if stats is not None:
+            return stats
+        size = self.__size
+        marginals = np.zeros(size)
+        nonzeros  = np.zeros(size, dtype=np.int64)
+        diagonal  = np.zeros(size, dtype=self._data.dtype)
+        for rows, cols, values in self._iter_coo():
+            marginals += np.bincount(rows, weights=values, minlength=size)
+            nonzeros  += np.bincount(rows[values != 0], minlength=size)
+            diag = rows == cols
+            diagonal[rows[diag]] = values[diag]
+        if diagonal.dtype.kind in 'iu':
+            marginals = marginals.round().astype(np.int64)
+        self._stats = {'marginals': marginals, 'nonzeros': nonzeros,
+                       'diagonal' : diagonal , 'total'   : marginals.sum()}
+        return self._stats
+
+    def get_marginals(self, skip=None):
+        """
+        Sum of the values of each row (equal to the sum of each column, the
+        matrix being symmetric).
+
+        :param None skip: list of rows whose interactions are not counted in
+           the sums of the columns (one pass over the cells stored)
+
+        :returns: a NumPy array of length equal to the size of the matrix
+        """
+        marginals = self._coverage()['marginals'].copy()
+        if not skip:
+            return marginals
+        size = self.__size
+        skipped = np.zeros(size, dtype=bool)
+        skipped[list(skip)] = True
+        removed = np.zeros(size)
+        for rows, cols, values in self._iter_coo():
+            sel = skipped[rows]
+            removed += np.bincount(cols[sel], weights=values[sel],
+                                   minlength=size)
+        if marginals.dtype.kind in 'iu':
+            removed = removed.round().astype(marginals.dtype)
+        return marginals - removed
+
+    def get_nonzeros(self):
+        """
+        Number of cells with interactions in each row.
+
+        :returns: a NumPy array of length equal to the size of the matrix
+        """
+        return self._coverage()['nonzeros'].copy()
+
+    def get_diagonal(self):
+        """
+        Values in the diagonal of the matrix.
+
+        :returns: a NumPy array of length equal to the size of the matrix
+        """
+        return self._coverage()['diagonal'].copy()
+
+    def get_total(self):
+        """
+        Sum of all the values of the matrix.
+        """
+        return self._coverage()['total'].item()
+
+    def _sections(self, chromosomes=None):
+        """
+        names, start and end of the chromosomes (the whole matrix, named None,
+        if no chromosome is defined), sorted by position
+        """
+        if not self.section_pos:
+            if chromosomes:
+                raise Exception('ERROR: no chromosome defined in HiC_data')
+            return [(None, 0, self.__size)]
+        if chromosomes is None:
+            chromosomes = self.section_pos.keys()
+        for crm in chromosomes:
+            if not crm in self.section_pos:
+                raise Exception('ERROR: chromosome %s not found' % crm)
+        return sorted([(crm, ) + self.section_pos[crm] for crm in chromosomes],
+                      key=lambda x: x[1])
+
+    def get_diagonal_sums(self, normalized=False):
+        """
+        Sum of the values of each diagonal of the upper triangle of the
+        intra-chromosomal matrices. All chromosomes are computed in a single
+        pass over the cells stored, and kept until a cell, the sections or the
+        biases are modified (see also :func:`HiC_data.get_expected`).
+
+        :param False normalized: use normalized values (cells with non-finite
+           values, e.g. in columns filtered out of the normalization, are
+           skipped)
+
+        :returns: a dictionary with chromosome names as keys (None if the
+           HiC_data has no chromosome defined), and NumPy arrays as values (one
+           value per distance, in bins, from the diagonal). The arrays are
+           shared with the cache, and read-only
+        """
+        if normalized and not self.bias:
+            raise Exception('ERROR: experiment not normalized yet')
+        cache = getattr(self, '_expected', None)
+        if cache is None:
+            cache = self._expected = {}
+        key = (normalized, 'sums')
+        if key in cache and (not normalized or cache[key][0] == self.bias):
+            return cache[key][1]
+        # biases modified, expected computed from them are outdated
+        for k in cache.keys():
+            if k[0] == normalized:
+                del(cache[k])
+        sections = self._sections()
+        lengths  = [end - beg for _, beg, end in sections]
+        longest  = max(lengths) if lengths else 0
+        crm_of = np.repeat(np.arange(len(sections)), lengths)
+        if normalized:
+            bias = self._bias_array(0, self.__size)
+        sums = np.zeros(len(sections) * longest)
+        for rows, cols, values in self._iter_coo():
+            keep = (cols >= rows) & (crm_of[rows] == crm_of[cols])
+            rows, cols, values = rows[keep], cols[keep], values[keep]
+            if normalized:
+                values = values / bias[rows] / bias[cols]
+                # filtered columns
+                finite = np.isfinite(values)
+                rows, cols, values = rows[finite], cols[finite], values[finite]
+            sums += np.bincount(crm_of[rows] * longest + cols - rows,
+                                weights=values, minlength=len(sums))
+        sums = dict((crm, sums[k * longest:k * longest + lengths[k]])
+                    for k, (crm, _, _) in enumerate(sections))
+        for crm in sums:
+            sums[crm].flags.writeable = False
+        cache[key] = (dict(self.bias) if normalized else None, sums)
+        return sums
+
+    def get_expected(self, normalized=False, chromosomes=None, pooled=False):
+        """
+        Expected interactions as a function of the distance between bins: mean
+        value of each diagonal of the intra-chromosomal matrices. Computed in a
+        single pass over the cells stored, and kept (for each set of
+        chromosomes) until a cell, the sections or the biases are modified.
+
+        :param False normalized: use normalized values
+        :param None chromosomes: list of chromosome names (all by default)
+        :param False pooled: if True, a single expected is computed for all the
+           chromosomes, summing their diagonals
+
+        :returns: a dictionary with chromosome names as keys (None if the
+           HiC_data has no chromosome defined), and NumPy arrays as values (one
+           value per distance, in bins, from the diagonal). If pooled, a
+           single NumPy array, as long as the longest chromosome. The arrays
+           are shared with the cache, and read-only
+        """
+        sections = self._sections(chromosomes)
+        key = (normalized, tuple(crm for crm, _, _ in sections), pooled)
+        sums = self.get_diagonal_sums(normalized)
+        cache = self._expected
+        if key in cache:
+            return cache[key]
+        if pooled:
+            longest = max(end - beg for _, beg, end in sections)
+            total  = np.zeros(longest)
+            ncells = np.zeros(longest)
+            for crm, beg, end in sections:
+                total[:end - beg]  += sums[crm]
+                ncells[:end - beg] += np.arange(end - beg, 0, -1)
+            expected = total / ncells
+            expected.flags.writeable = False
+        else:
+            expected = dict((crm, sums[crm] / np.arange(end - beg, 0, -1))
+                            for crm, beg, end in sections)
+            for crm in expected:
+                expected[crm].flags.writeable = False
+        cache[key] = expected
+        return expected
+
+    def get_oe_array(self, focus=None, normalized=False, pooled=False,
+                     sparse=False):
+        """
+        Observed over expected interactions (see :func:`HiC_data.get_expected`)
+        of an intra-chromosomal region, as a NumPy array. Only the cells stored
+        are divided, cells with nothing expected are left to zero.
+
+        :param None focus: a chromosome name, or a tuple with the (start, end)
+           position of the desired window of data (start, starting at 1, and
+           both start and end are inclusive), inside a single chromosome. By
+           default the whole matrix, if no chromosome is defined
+        :param False normalized: use normalized values
+        :param False pooled: divide by the expected computed from all the
+           chromosomes
+        :param False sparse: returns a scipy.sparse.csr_matrix instead of a
+           dense array
+
+        :returns: a NumPy array (or a scipy sparse matrix)
+        """
+        if isinstance(focus, tuple) and not isinstance(focus[0], int):
+            if focus[0] != focus[1]:
+                raise Exception('ERROR: observed/expected only defined for '
+                                'intra-chromosomal regions')
+            focus = focus[0]
+        start1, end1, start2, end2 = self._focus_coords(focus)
+        for crm, beg, end in self._sections():
+            if beg <= start1 and end1 <= end and beg <= start2 and end2 <= end:
+                break
+        else:
+            raise Exception('ERROR: observed/expected only defined for '
+                            'intra-chromosomal regions')
+        if pooled:
+            expected = self.get_expected(normalized=normalized, pooled=True)
+        else:
+            expected = self.get_expected(
+                normalized=normalized,
+                chromosomes=None if crm is None else [crm])[crm]
+        rows, cols, values = self._get_block_coo(start1, end1, start2, end2)
+        if normalized:
+            values = (values / self._bias_array(start1, end1)[rows]
+                      / self._bias_array(start2, end2)[cols])
+        expected = expected[np.abs(rows + start1 - cols - start2)]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = np.where(expected > 0, values / expected, 0.)
+        shape = (end1 - start1, end2 - start2)
+        if sparse:
+            from scipy.sparse import csr_matrix
+            return csr_matrix((values, (rows, cols)), shape=shape)
+        mtrx = np.zeros(shape)
+        mtrx[rows, cols] = values
+        return mtrx
+
+    def rebin(self, factor):
+        """
+        Sums the cells of the matrix by square groups of factor x factor bins
+        (all the cells stored are visited once, by array operations).
+
+        :param factor: number of bins merged into one, the last bin may be
+           smaller
+
+        :returns: a new HiC_data object, with resolution multiplied by factor
+        """
+        rows, cols, values = self.get_coo()
+        keep = values != 0
+        values = values[keep]
+        if values.dtype.kind in 'iu': # avoid overflows when summing counts
+            values = values.astype(np.int64)
+        return HiC_data.from_coo(rows[keep] / factor, cols[keep] / factor,
+                                 values, -(-self.__size / factor),
+                                 resolution=self.resolution * factor,
+                                 dtype=self._dtype)
+
+    def save_hic_data(self, fname):
+        """
+        Saves the HiC_data object in a binary file, that can be opened with
+        :func:`pytadbit.parsers.hic_parser.load_hic_data` (or passed to
+        :func:`pytadbit.parsers.hic_parser.read_matrix`).
+
+        Interactions are stored by blocks, one per pair of chromosomes (sparse
+        matrices with row pointers, column indexes and values), followed by a
+        header with the chromosomes, sections, resolution, biases, filtered
+        columns and the offset of each block in the file.
+
+        :param fname: path to the output file
+        """
+        self._compact()
+        size   = self.__size
+        bounds = self._block_bounds()
+        names  = dict((beg, crm) for crm, (beg, _) in self.section_pos.items())
+        out = open(fname, 'wb')
+        out.write(BINARY_MAGIC)
+        offset = len(BINARY_MAGIC)
+        blocks = []
+        for k1 in xrange(len(bounds) - 1):
+            beg, end = self._indptr[bounds[k1]], self._indptr[bounds[k1 + 1]]
+            nrows = bounds[k1 + 1] - bounds[k1]
+            rows = np.repeat(np.arange(nrows, dtype=np.int32),
+                             np.diff(self._indptr[bounds[k1]:bounds[k1 + 1] + 1]))
+            cols = self._indices[beg:end]
+            vals = self._data[beg:end]
+            # columns grouped by chromosome, sorted by row and column within
+            kcol  = np.searchsorted(bounds, cols, side='right') - 1
+            order = np.argsort(kcol, kind='mergesort')
+            kcol  = kcol[order]
+            for k2 in np.unique(kcol):
+                sel = order[kcol.searchsorted(k2):
+                            kcol.searchsorted(k2, side='right')]
+                indptr = np.zeros(nrows + 1, dtype='<i8')
+                np.cumsum(np.bincount(rows[sel], minlength=nrows),
+                          out=indptr[1:])
+                indices = (cols[sel] - bounds[k2]).astype('<i4')
+                data = vals[sel].astype(vals.dtype.newbyteorder('<'))
+                blocks.append((names.get(bounds[k1]), names.get(bounds[k2]),
+                               k1, int(k2), offset, len(sel)))
+                for arr in (indptr, indices, data):
+                    out.write(arr.tostring())
+                    out.write('\0' * (_padded(arr.nbytes) - arr.nbytes))
+                    offset += _padded(arr.nbytes)
+        header = {'size'       : size,
+                  'chromosomes': self.chromosomes,
+                  'sections'   : self.sections,
+                  'resolution' : self.resolution,
+                  'bias'       : self.bias,
+                  'bads'       : self.bads,
+                  'dtype'      : self._dtype,
+                  'values'     : self._data.dtype.newbyteorder('<').str,
+                  'bounds'     : bounds,
+                  'blocks'     : blocks}
+        out.write(dumps(header, 2))
+        out.write(np.array([offset], dtype='<u8').tostring())
+        out.close()
+
+    def share(self, tmp_dir=None):
+        """
+        Publishes the matrix to be used by several processes: it is saved in a
+        temporary binary file (see :func:`HiC_data.save_hic_data`), by default
+        in shared memory (/dev/shm) if available, and opened memory-mapped.
+
+        The HiC_data object returned is pickled as the name of this file (plus
+        the attributes, like biases, replaced since), so that passing it to
+        the workers of a multiprocessing Pool does not copy the interactions:
+        all of them map the same pages. Attributes modified in place (e.g. a
+        single bias changed) are not seen by workers.
+
+        The file is removed with :func:`HiC_data.unshare`.
+
+        :param None tmp_dir: directory where to write the file
+
+        :returns: a HiC_data object
+        """
+        if tmp_dir is None and path.isdir('/dev/shm'):
+            tmp_dir = '/dev/shm'
+        fd, fname = mkstemp(prefix='tadbit_hic_', dir=tmp_dir)
+        close(fd)
+        self.save_hic_data(fname)
+        return load_hic_data(fname)
+
+    def unshare(self):
+        """
+        Loads in memory a HiC_data object returned by :func:`HiC_data.share`,
+        and removes its file (to be called once all processes are done).
+        """
+        origin = getattr(self, '_origin', None)
+        if not origin:
+            return
+        if self._blocks is not None:
+            self._materialize()
+        self._origin = None
+        if path.exists(origin[0]):
+            remove(origin[0])
 
     def add_sections_from_fasta(self, fasta):
         """
@@ -392,6 +1992,8 @@ class HiC_data(dict):
         dict_sec = dict([(j, i) for i, j in enumerate(sections)])
         self.chromosomes = genome_seq
         self.sections = dict_sec
+        self._stats = None
+        self._expected = None
         if self.chromosomes:
             total = 0
             for crm in self.chromosomes:
@@ -400,8 +2002,7 @@ class HiC_data(dict):
         if size != self.__size:
             warn('WARNING: different sizes (%d, now:%d), ' % (self.__size, size)
                  + 'should adjust the resolution')
-        self.__size = size
-        self._size2 = size**2
+            self._resize(size)
 
     def add_sections(self, lengths, chr_names=None, binned=False):
         """
@@ -428,6 +2029,8 @@ class HiC_data(dict):
         dict_sec = dict([(j, i) for i, j in enumerate(sections)])
         self.chromosomes = genome_seq
         self.sections = dict_sec
+        self._stats = None
+        self._expected = None
         if self.chromosomes:
             total = 0
             for crm in self.chromosomes:
@@ -436,8 +2039,7 @@ class HiC_data(dict):
         if size != self.__size:
             warn('WARNING: different sizes (%d, now:%d), ' % (self.__size, size)
                  + 'should adjust the resolution')
-        self.__size = size
-        self._size2 = size**2
+            self._resize(size)
 
     def cis_trans_ratio(self, normalized=False, exclude=None, diagonal=True,
                         equals=None, verbose=False):
@@ -464,21 +2066,17 @@ class HiC_data(dict):
         intra = inter = 0
         if not self.chromosomes:
             return float('nan')
+        sums = self.get_block_sums(normalized=normalized, diagonal=diagonal)
         for crm1 in self.chromosomes:
             for crm2 in self.chromosomes:
                 if crm1 in exclude or crm2 in exclude:
                     continue
+                val = sums.get((crm1, crm2), (0, 0))[0]
                 if crm1 == crm2:
-                    mtrx = self.get_matrix(
-                        focus=(crm1, crm2), normalized=normalized, diagonal=diagonal)
-                    val = sum([sum([mtrx[i][j] for j in xrange(len(mtrx))])
-                               for i in xrange(len(mtrx))])
                     if verbose:
                         print 'INTRA', crm1, crm2, val
                     intra += val
                 else:
-                    val = sum([sum(d) for d in self.get_matrix(
-                        focus=(crm1, crm2), normalized=normalized, diagonal=diagonal)])
                     if equals(crm1, crm2):
                         if verbose:
                             print '  INTRA', crm1, crm2, val
@@ -512,28 +2110,83 @@ class HiC_data(dict):
         self.bads.update(filter_by_mean(self, draw_hist=draw_hist,
                                         savefig=savefig, bads=self.bads))
 
-    def normalize_hic(self, iterations=0, max_dev=0.1, silent=False):
+    def normalize_hic(self, iterations=0, max_dev=0.1, silent=False,
+                      from_file=None, chunk_size=2**20, cis=False, n_cpus=1,
+                      engine='python', cache=False):
         """
         Normalize the Hi-C data.
 
         It fills the Experiment.norm variable with the Hi-C values divided by
         the calculated weight.
 
+        For matrices that do not fit in memory, the interactions can be read
+        by chunks from a file at each iteration (see
+        :func:`pytadbit.utils.normalize_hic.iterative_by_chunks`), keeping
+        only the biases in memory. This is done by default for HiC_data opened
+        with :func:`pytadbit.parsers.hic_parser.load_hic_data`. The number of
+        bytes read at each iteration is reported. Biases are applied when the
+        normalized matrix is extracted.
+
         :param 0 iteration: number of iterations
         :param 0.1 max_dev: iterative process stops when the maximum deviation
            between the sum of row is equal to this number (0.1 means 10%)
         :param False silent: does not warn when overwriting weights
+        :param None from_file: path to a file with the same interactions,
+           written with :func:`HiC_data.save_hic_data` or with
+           :func:`HiC_data.write_matrix` in sparse format (sorted by row)
+        :param 1048576 chunk_size: number of lines read at once from a file in
+           sparse format
+        :param False cis: normalize each chromosome independently, using only
+           intra-chromosomal interactions (not available when reading from a
+           file)
+        :param 1 n_cpus: number of threads used to normalize chromosomes in
+           parallel (if cis), or to compute sums of rows by stripes
+        :param 'python' engine: 'python' or 'native' to compute the
+           correction with the compiled norm_lib module (see
+           :func:`pytadbit.utils.normalize_hic.iterative`), loading all the
+           interactions in memory (not available when reading from a file)
+        :param False cache: keep the biases in the cache of normalizations
+           (see :mod:`pytadbit.utils.norm_cache`), and use the ones already
+           computed with the same interactions and parameters (not used
+           when reading from a file)
         """
-        self.bias = iterative(self, iterations=iterations,
-                              max_dev=max_dev, bads=self.bads,
-                              verbose=not silent)
+        if cis and from_file:
+            raise NotImplementedError('ERROR: cis normalization not available' +
+                                      ' reading from a file')
+        if engine != 'python' and from_file:
+            raise NotImplementedError('ERROR: %s engine not available ' % (
+                engine) + 'reading from a file')
+        if from_file:
+            if _file_size(from_file) != len(self):
+                raise Exception('ERROR: matrix in %s is not of size %d' % (
+                    from_file, len(self)))
+            cells = lambda: _file_cells(from_file, chunk_size)
+            self.bias = iterative_by_chunks(cells, len(self),
+                                            iterations=iterations,
+                                            max_dev=max_dev, bads=self.bads,
+                                            verbose=not silent)
+            return
+        if (self._blocks is not None and not cis and n_cpus == 1 and
+            engine == 'python'):
+            compute = lambda: iterative_by_chunks(
+                self._iter_blocks, len(self), iterations=iterations,
+                max_dev=max_dev, bads=self.bads, verbose=not silent)
+        else:
+            compute = lambda: iterative(
+                self, iterations=iterations, max_dev=max_dev, bads=self.bads,
+                verbose=not silent, cis=cis, n_cpus=n_cpus, engine=engine)
+        self.bias, found = cached(self, 'biases', compute, cache=cache,
+                                  iterations=iterations, max_dev=max_dev,
+                                  bads=sorted(self.bads or []), cis=cis,
+                                  engine=engine)
+        if found and not silent:
+            stderr.write('WARNING: biases loaded from cache\n')
 
     def get_as_tuple(self):
-        return tuple([self[i, j]
-                      for j in xrange(len(self))
-                      for i in xrange(len(self))])
+        return tuple(self.get_block(0, len(self), 0, len(self)).T.ravel().tolist())
 
-    def write_matrix(self, fname, focus=None, diagonal=True, normalized=False):
+    def write_matrix(self, fname, focus=None, diagonal=True, normalized=False,
+                     format='matrix', chunk=256):
         """
         writes the matrix to a file
         :param None focus: a tuple with the (start, end) position of the desired
@@ -543,45 +2196,135 @@ class HiC_data(dict):
            region
         :param True diagonal: if False, diagonal is replaced by zeroes
         :param False normalized: get normalized data
+        :param 'matrix' format: 'matrix' to write all the cells in a tab
+           separated matrix, 'sparse' to write only the non-zero cells, one per
+           line (row, column and value, only the upper triangle for regions
+           centered on the diagonal), or 'npz' to write the same cells in
+           a compressed NumPy archive. Sparse formats keep the chromosomes and
+           resolution in their header, and can be read back with
+           :func:`pytadbit.parsers.hic_parser.read_matrix`
+        :param 256 chunk: number of rows extracted at once from the matrix for
+           sparse formats
         """
-        if focus:
-            if isinstance(focus, tuple) and isinstance(focus[0], int):
-                if len(focus) == 2:
-                    start1, end1 = focus
-                    start2, end2 = focus
-                    start1 -= 1
-                    start2 -= 1
-                else:
-                    start1, end1, start2, end2 = focus
-                    start1 -= 1
-                    start2 -= 1
-            elif isinstance(focus, tuple) and isinstance(focus[0], str):
-                start1, end1 = self.section_pos[focus[0]]
-                start2, end2 = self.section_pos[focus[1]]
-            else:
-                start1, end1 = self.section_pos[focus]
-                start2, end2 = self.section_pos[focus]
-        else:
-            start1 = start2 = 0
-            end1   = end2   = len(self)
+        if not format in ['matrix', 'sparse', 'npz']:
+            raise NotImplementedError(('ERROR: format %s not supported, use ' +
+                                       'matrix, sparse or npz') % format)
+        start1, end1, start2, end2 = self._focus_coords(focus)
+        if format != 'matrix':
+            self._write_sparse(fname, start1, end1, start2, end2, format,
+                               diagonal=diagonal, normalized=normalized,
+                               chunk=chunk)
+            return
         out = open(fname, 'w')
         rownam = ['%s\t%d-%d' % (k[0],
                                  k[1] * self.resolution,
                                  (k[1] + 1) * self.resolution)
-                  for k in sorted(self.sections,
+                  for k in sorted(self.sections or {},
                                   key=lambda x: self.sections[x])
                   if start2 <= self.sections[k] < end2]
+        lines = self.yield_matrix(focus=focus, diagonal=diagonal,
+                                  normalized=normalized)
         if rownam:
-            for line in self.yield_matrix(focus=focus, diagonal=diagonal,
-                                          normalized=normalized):
-                out.write(rownam.pop(0) + '\t' +
-                          '\t'.join([str(i) for i in line]) + '\n')
+            for nam, line in zip(rownam, lines):
+                out.write(nam + '\t' + '\t'.join([str(i) for i in line]) + '\n')
         else:
-            for line in self.yield_matrix(focus=focus, diagonal=diagonal,
-                                          normalized=normalized):
+            for line in lines:
                 out.write('\t'.join([str(i) for i in line]) + '\n')
         out.close()
 
+    def _write_sparse(self, fname, start1, end1, start2, end2, format,
+                      diagonal=True, normalized=False, chunk=256,
+                      max_cells=2**20):
+        """
+        writes the non-zero cells of rows start2 to end2 and columns start1 to
+        end1 in sparse text format, or in a NumPy archive (see write_matrix)
+        """
+        if normalized and not self.bias:
+            raise Exception('ERROR: experiment not normalized yet')
+        size = end2 - start2
+        if end1 - start1 != size:
+            raise Exception('ERROR: only square regions can be written in ' +
+                            'sparse format')
+        upper = start1 == start2
+        if normalized:
+            bias1 = self._bias_array(start2, end2)
+            bias2 = self._bias_array(start1, end1)
+        crms = self._section_runs(start2, end2)
+        if format == 'sparse':
+            out = open(fname, 'w')
+            out.write('%s\n# size\t%d\n# resolution\t%d\n' % (
+                SPARSE_MAGIC, size, self.resolution))
+            out.write(''.join('# chromosome\t%s\t%d\t%d\n' % crm
+                              for crm in crms))
+            out.write('# triangle\t%s\n' % ('upper' if upper else 'full'))
+        else:
+            pieces = []
+        for beg in xrange(start2, end2, chunk):
+            rows, cols, values = self._get_block_coo(
+                beg, min(beg + chunk, end2), start1, end1)
+            rows = rows + (beg - start2)
+            keep = values != 0
+            if upper:
+                keep &= cols >= rows
+                if not diagonal:
+                    keep &= cols != rows
+            rows, cols, values = rows[keep], cols[keep], values[keep]
+            keys = rows.astype(np.int64) * size + cols
+            if (keys[1:] < keys[:-1]).any():
+                order = np.argsort(keys, kind='mergesort')
+                rows, cols, values = rows[order], cols[order], values[order]
+            if normalized:
+                values = values / bias1[rows] / bias2[cols]
+            if format == 'npz':
+                pieces.append((rows, cols, values))
+                continue
+            # formatting done at once for many cells (repr keeps all the
+            # digits of floats)
+            fmt = '%s\t%s\t' + ('%s\n' if values.dtype.kind in 'iu' else
+                                '%r\n')
+            for pos in xrange(0, len(rows), max_cells):
+                cells = [None] * (3 * len(rows[pos:pos + max_cells]))
+                cells[0::3] = rows[pos:pos + max_cells].tolist()
+                cells[1::3] = cols[pos:pos + max_cells].tolist()
+                cells[2::3] = values[pos:pos + max_cells].tolist()
+                out.write((fmt * (len(cells) / 3)) % tuple(cells))
+        if format == 'sparse':
+            out.close()
+            return
+        if pieces:
+            rows, cols, values = [np.concatenate(arrs) for arrs in zip(*pieces)]
+        else:
+            rows = cols = np.zeros(0, dtype=np.int32)
+            values = np.zeros(0, dtype=self._data.dtype)
+        out = open(fname, 'wb')
+        np.savez_compressed(
+            out, rows=rows.astype(np.int32), cols=cols.astype(np.int32),
+            values=values, size=size, resolution=self.resolution,
+            triangle='upper' if upper else 'full',
+            crm_names=np.array([crm for crm, _, _ in crms], dtype=str),
+            crm_first=np.array([first for _, first, _ in crms], dtype=np.int64),
+            crm_bins=np.array([nbins for _, _, nbins in crms], dtype=np.int64))
+        out.close()
+
+    def _section_runs(self, start, end):
+        """
+        chromosome name, first bin and number of consecutive bins of each
+        chromosome fragment found between rows start and end (empty if some of
+        these rows have no section)
+        """
+        names = dict((i, sec) for sec, i in (self.sections or {}).iteritems()
+                     if start <= i < end)
+        if len(names) != end - start:
+            return []
+        runs = []
+        for i in xrange(start, end):
+            crm, pos = names[i]
+            if runs and runs[-1][0] == crm and runs[-1][1] + runs[-1][2] == pos:
+                runs[-1][2] += 1
+            else:
+                runs.append([crm, pos, 1])
+        return [tuple(run) for run in runs]
+
     def get_matrix(self, focus=None, diagonal=True, normalized=False):
         """
         returns a matrix
@@ -595,55 +2338,14 @@ class HiC_data(dict):
 
         :returns: matrix (a list of lists of values)
         """
-        siz = len(self)
         if normalized and not self.bias:
             raise Exception('ERROR: experiment not normalized yet')
-        if focus:
-            if isinstance(focus, tuple) and isinstance(focus[0], int):
-                if len(focus) == 2:
-                    start1, end1 = focus
-                    start2, end2 = focus
-                    start1 -= 1
-                    start2 -= 1
-                else:
-                    start1, end1, start2, end2 = focus
-                    start1 -= 1
-                    start2 -= 1
-            elif isinstance(focus, tuple) and isinstance(focus[0], str):
-                start1, end1 = self.section_pos[focus[0]]
-                start2, end2 = self.section_pos[focus[1]]
-            else:
-                start1, end1 = self.section_pos[focus]
-                start2, end2 = self.section_pos[focus]
-        else:
-            start1 = start2 = 0
-            end1   = end2   = siz
-        if normalized:
-            if diagonal:
-                return [[self[i, j] / self.bias[i] / self.bias[j]
-                         for i in xrange(start2, end2)]
-                        for j in xrange(start1, end1)]
-            else:
-                mtrx = [[self[i, j] / self.bias[i] / self.bias[j]
-                         for i in xrange(start2, end2)]
-                        for j in xrange(start1, end1)]
-                if start1 == start2:
-                    for i in xrange(len(mtrx)):
-                        mtrx[i][i] = 1 if mtrx[i][i] else 0
-                return mtrx
-        else:
-            if diagonal:
-                return [[self[i, j] for i in xrange(start2, end2)]
-                        for j in xrange(start1, end1)]
-            else:
-                mtrx = [[self[i, j] for i in xrange(start2, end2)]
-                        for j in xrange(start1, end1)]
-                if start1 == start2:
-                    for i in xrange(len(mtrx)):
-                        mtrx[i][i] = 1 if mtrx[i][i] else 0
-                return mtrx
+        start1, end1, start2, end2 = self._focus_coords(focus)
+        return self._array(start2, end2, start1, end1, diagonal=diagonal,
+                           normalized=normalized).T.tolist()
 
-    def yield_matrix(self, focus=None, diagonal=True, normalized=False):
+    def yield_matrix(self, focus=None, diagonal=True, normalized=False,
+                     chunk=256):
         """
         yields a matrix line by line
         :param None focus: a tuple with the (start, end) position of the desired
@@ -653,54 +2355,30 @@ class HiC_data(dict):
            region
         :param True diagonal: if False, diagonal is replaced by zeroes
         :param False normalized: get normalized data
+        :param 256 chunk: number of lines extracted at once from the matrix
 
         :yields: matrix line by line (a line being a list of values)
         """
-        siz = len(self)
         if normalized and not self.bias:
             raise Exception('ERROR: experiment not normalized yet')
-        if focus:
-            if isinstance(focus, tuple) and isinstance(focus[0], int):
-                if len(focus) == 2:
-                    start1, end1 = focus
-                    start2, end2 = focus
-                    start1 -= 1
-                    start2 -= 1
-                else:
-                    start1, end1, start2, end2 = focus
-                    start1 -= 1
-                    start2 -= 1
-            elif isinstance(focus, tuple) and isinstance(focus[0], str):
-                start1, end1 = self.section_pos[focus[0]]
-                start2, end2 = self.section_pos[focus[1]]
-            else:
-                start1, end1 = self.section_pos[focus]
-                start2, end2 = self.section_pos[focus]
-        else:
-            start1 = start2 = 0
-            end1   = end2   = siz
-        if normalized:
-            for i in xrange(start2, end2):
-                # if we want the diagonal, or we don't but are looking at a
-                # region that is not symmetric
-                if diagonal or start1 != start2:
-                    yield [self[i, j] / self.bias[i] / self.bias[j]
-                           for j in xrange(start1, end1)]
+        start1, end1, start2, end2 = self._focus_coords(focus)
+        # rows are extracted by chunks, to keep memory low
+        for beg in xrange(start2, end2, chunk):
+            lines = self._array(beg, min(beg + chunk, end2), start1, end1,
+                                normalized=normalized)
+            # if we want the diagonal, or we don't but are looking at a
+            # region that is not symmetric
+            if not diagonal and start1 == start2:
                 # diagonal replaced by zeroes
-                else:
-                    yield ([self[i, j] / self.bias[i] / self.bias[j]
-                            for j in xrange(start1, i)] +
-                           [0] + 
-                           [self[i, j] / self.bias[i] / self.bias[j]
-                            for j in xrange(i + 1, end1)])
-        else:
-            for i in xrange(start2, end2):
-                # if we want the diagonal, or we don't but are looking at a
-                # region that is not symmetric
-                if diagonal or start1 != start2:
-                    yield [self[i, j] for j in xrange(start1, end1)]
-                # diagonal replaced by zeroes
-                else:
-                    yield ([self[i, j] for j in xrange(start1, i)] +
-                           [0] + 
-                           [self[i, j] for j in xrange(i + 1, end1)])
+                for i in xrange(len(lines)):
+                    if start1 <= beg + i < end1:
+                        lines[i, beg + i - start1] = 0
+            for line in lines.tolist():
+                yield line
+
+    def _bias_array(self, start, end):
+        """
+        biases of a range of rows as a NumPy array
+        """
+        return np.array([self.bias[i] for i in xrange(start, end)],
+                        dtype=float)
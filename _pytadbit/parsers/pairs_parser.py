@@ -0,0 +1,221 @@
+"""
+18 oct. 2026
+
+Columnar storage of pairs of reads (as written by
+:func:`pytadbit.mapping.mapper.get_intersection`): each column is stored in its
+own binary file, as a typed NumPy array, and the read IDs in a separate file,
+with the offset of each one.
+"""
+
+from collections import OrderedDict
+from cPickle     import dump, load, HIGHEST_PROTOCOL
+from itertools   import imap
+from os          import path, mkdir
+import numpy as np
+
+# columns of the pairs of reads (read ID apart), and their types
+PAIRS_COLUMNS = (('crm1', '<i4'), ('pos1', '<i4'), ('sd1', '<i1'),
+                 ('len1', '<i4'), ('rs1', '<i4'), ('re1', '<i4'),
+                 ('crm2', '<i4'), ('pos2', '<i4'), ('sd2', '<i1'),
+                 ('len2', '<i4'), ('rs2', '<i4'), ('re2', '<i4'))
+
+
+def is_pairs_columns(fnam):
+    """
+    :returns: True if fnam is a directory with pairs of reads stored by
+       columns (see :func:`write_pairs_columns`)
+    """
+    return path.isdir(fnam) and path.exists(path.join(fnam, 'header'))
+
+
+def write_pairs_columns(fnam, outdir, chunk_size=2**25):
+    """
+    Converts a tab-separated file of pairs of reads to columns, that can be
+    read back memory-mapped with :func:`load_pairs_columns`. Chromosomes are
+    stored as indexes (in the order of the header, followed by those only
+    found in the reads).
+
+    The path to the directory can be passed instead of the tab-separated
+    file to :func:`pytadbit.mapping.filter.filter_reads`,
+    :func:`pytadbit.mapping.filter.apply_filter`,
+    :func:`pytadbit.mapping.restriction_enzymes.count_re_fragments`,
+    :func:`pytadbit.parsers.hic_parser.load_hic_data_from_reads`,
+    :func:`pytadbit.mapping.analyze.insert_sizes`,
+    :func:`pytadbit.mapping.analyze.plot_genomic_distribution` and
+    :func:`pytadbit.mapping.analyze.plot_distance_vs_interactions`.
+
+    :param fnam: path to the file of pairs of reads
+    :param outdir: path to the output directory
+    :param 33554432 chunk_size: number of bytes parsed at once
+    """
+    header = ''
+    crm_lens = OrderedDict()
+    fhandler = open(fnam)
+    line = fhandler.readline()
+    while line.startswith('#'):
+        header += line
+        if line.startswith('# CRM '):
+            crm, clen = line[6:].split()
+            crm_lens[crm] = int(clen)
+        line = fhandler.readline()
+    fhandler.close()
+    out = _ColumnsWriter(outdir, header, crm_lens)
+    for text in _read_range(fnam, len(header), path.getsize(fnam),
+                            chunk_size):
+        out.append_text(_split_pairs(text))
+    out.close()
+
+
+def load_pairs_columns(dirname):
+    """
+    Opens pairs of reads stored with :func:`write_pairs_columns`, all columns
+    are memory-mapped.
+
+    :param dirname: path to the directory
+
+    :returns: a dictionary with the columns (see PAIRS_COLUMNS), the offsets
+       of the read IDs and the read IDs ('offsets' and 'reads', see
+       :func:`read_ids`), the names of the chromosomes by index, their
+       lengths, the header of the tab-separated file and the number of pairs
+       of reads ('chromosomes', 'crm_lens', 'header' and 'nreads')
+    """
+    if not is_pairs_columns(dirname):
+        raise IOError('ERROR: %s is not a directory of pairs of reads\n' %
+                      dirname)
+    fhandler = open(path.join(dirname, 'header'), 'rb')
+    pairs = load(fhandler)
+    fhandler.close()
+    for col, dtype in PAIRS_COLUMNS + (('offsets', '<i8'), ('reads', 'u1')):
+        pairs[col] = _memmap(path.join(dirname, col), dtype)
+    return pairs
+
+
+def read_ids(pairs, beg=0, end=None):
+    """
+    :param pairs: dictionary returned by :func:`load_pairs_columns`
+    :param 0 beg: first pair of reads
+    :param None end: last pair of reads (not included)
+
+    :returns: the list of read IDs of the pairs of reads between beg and end
+    """
+    offsets = pairs['offsets']
+    end = pairs['nreads'] if end is None else end
+    if end <= beg:
+        return []
+    return pairs['reads'][offsets[beg]:offsets[end]].tostring().split(
+        '\n')[:-1]
+
+
+def _memmap(fnam, dtype):
+    """
+    memory-mapped file, or empty array if the file is empty
+    """
+    if not path.getsize(fnam):
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(fnam, dtype=dtype, mode='r')
+
+
+class _ColumnsWriter(object):
+    """
+    appends pairs of reads to a directory of columns (see
+    :func:`write_pairs_columns`), the header is written when closed
+    """
+    def __init__(self, outdir, header, crm_lens, chromosomes=None):
+        if not path.exists(outdir):
+            mkdir(outdir)
+        self.outdir   = outdir
+        self.header   = header
+        self.crm_lens = crm_lens
+        self.crm_ids  = OrderedDict(
+            (crm, i) for i, crm in enumerate(chromosomes or crm_lens))
+        self.columns  = OrderedDict((col, open(path.join(outdir, col), 'wb'))
+                                    for col, _ in PAIRS_COLUMNS)
+        self.reads    = open(path.join(outdir, 'reads'), 'wb')
+        self.offsets  = open(path.join(outdir, 'offsets'), 'wb')
+        np.zeros(1, dtype='<i8').tofile(self.offsets)
+        self.nreads   = 0
+        self.nbytes   = 0
+
+    def append(self, reads, columns):
+        """
+        :param reads: list of read IDs
+        :param columns: list of arrays, in the order of PAIRS_COLUMNS
+        """
+        if not reads:
+            return
+        for (col, dtype), values in zip(PAIRS_COLUMNS, columns):
+            np.asarray(values).astype(dtype).tofile(self.columns[col])
+        # one read ID by line
+        ends = np.cumsum(np.fromiter(imap(len, reads), dtype=np.int64,
+                                     count=len(reads)) + 1) + self.nbytes
+        ends.astype('<i8').tofile(self.offsets)
+        self.reads.write('\n'.join(reads) + '\n')
+        self.nbytes  = int(ends[-1])
+        self.nreads += len(reads)
+
+    def append_text(self, fields):
+        """
+        :param fields: the 13 columns of pairs of reads, as lists of strings
+           (see _split_pairs)
+        """
+        crm_ids = self.crm_ids
+        for crm in set(fields[1]) | set(fields[7]):
+            crm_ids.setdefault(crm, len(crm_ids))
+        self.append(fields[0], [
+            np.array([crm_ids[crm] for crm in fields[k]], dtype=np.int32)
+            if k in (1, 7) else _ints(fields[k]) for k in xrange(1, 13)])
+
+    def close(self):
+        for out in self.columns.values() + [self.reads, self.offsets]:
+            out.close()
+        out = open(path.join(self.outdir, 'header'), 'wb')
+        dump({'chromosomes': self.crm_ids.keys(), 'crm_lens': self.crm_lens,
+              'header': self.header, 'nreads': self.nreads}, out,
+             HIGHEST_PROTOCOL)
+        out.close()
+
+
+def _read_range(fnam, beg, end, chunk_size):
+    """
+    lines of a range of bytes of a file, by chunks of about chunk_size bytes
+    of complete lines
+    """
+    fhandler = open(fnam)
+    fhandler.seek(beg)
+    left = end - beg
+    while left > 0:
+        text = fhandler.read(min(chunk_size, left))
+        if not text:
+            break
+        if len(text) < left and not text.endswith('\n'):
+            text += fhandler.readline()
+        left -= len(text)
+        yield text
+    fhandler.close()
+
+
+def _split_pairs(text):
+    """
+    the 13 columns of a chunk of lines of a tab-separated file of pairs of
+    reads, as lists of strings
+    """
+    # all the fields of the chunk split at once
+    nlines = text.count('\n') + (not text.endswith('\n'))
+    fields = text.replace('\n', '\t').split('\t')
+    if not fields[-1]:
+        fields.pop()
+    if len(fields) != 13 * nlines:
+        raise Exception('ERROR: pairs of reads should be described by 13 '
+                        'columns')
+    return [fields[k::13] for k in xrange(13)]
+
+
+def _ints(column):
+    """
+    NumPy array of integers from a column of strings (all converted at once)
+    """
+    values = np.fromstring(' '.join(column), dtype=np.int64, sep=' ')
+    if len(values) != len(column):
+        raise Exception('ERROR: wrong number in pairs of reads: %s' % (
+            column[len(values)].strip()))
+    return values
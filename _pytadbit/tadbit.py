@@ -48,10 +48,10 @@ def tadbit(x, remove=None, n_cpus=1, verbose=True,
     """
     nums = [hic_data for hic_data in read_matrix(x, one=False)]
     size = len(nums[0])
-    nums = [num.get_as_tuple() for num in nums]
     if not remove:
         # if not given just remove columns with zero in diagonal
-        remove = tuple([0 if nums[0][i*size+i] else 1 for i in xrange(size)])
+        remove = tuple((nums[0].get_diagonal() == 0).astype(int).tolist())
+    nums = [num.get_as_tuple() for num in nums]
     n_cpus = n_cpus if n_cpus != 'max' else 0
     max_tad_size = size if max_tad_size in ["max", "auto"] else max_tad_size
     _, nbks, passages, _, _, bkpts = \
@@ -29,13 +29,15 @@ def filter_by_mean(matrx, draw_hist=False, silent=False, bads=None, savefig=None
     nbins = 100
     if not bads:
         bads = {}
-    # get sum of columns
-    cols = []
+    # get sum of columns (cached in the HiC_data object), without the
+    # interactions falling in bad rows (one pass over the cells stored)
     size = len(matrx)
-    for c in sorted([[matrx.get(i+j*size, 0) for j in xrange(size) if not j in bads]
-                     for i in xrange(size) if not i in bads], key=sum):
-        cols.append(sum(c))
-    cols = np.array(cols)
+    colsums = matrx.get_marginals()
+    good = np.ones(size, dtype=bool)
+    good[bads.keys()] = False
+    cols = matrx.get_marginals(skip=bads.keys()) if bads else colsums.copy()
+    # columns with NaN are removed anyway (see hic_filtering_for_modelling)
+    cols = np.sort(cols[good & ~np.isnan(colsums)])
     if draw_hist:
         plt.figure(figsize=(9, 9))
     percentile = np.percentile(cols, 5)
@@ -46,10 +48,9 @@ def filter_by_mean(matrx, draw_hist=False, silent=False, bads=None, savefig=None
     xmax = max(cols)
     y = np.linspace(xmin, xmax, nbins)
     hist = np.digitize(cols, y)
-    x = [sum(hist == i) for i in range(1, nbins + 1)]
+    x = np.bincount(hist, minlength=nbins + 2)[1:nbins + 1]
     if draw_hist:
         hist = plt.hist(cols, bins=100, alpha=.3, color='grey')
-    xp = range(0, int(cols[-1]))
     # check if the binning is correct
     # we want at list half of the bins with some data
     try:
@@ -61,11 +62,10 @@ def filter_by_mean(matrx, draw_hist=False, silent=False, bads=None, savefig=None
             xmax = max(cols)
             y = np.linspace(xmin, xmax, nbins)
             hist = np.digitize(cols, y)
-            x = [sum(hist == i) for i in range(1, nbins + 1)]
+            x = np.bincount(hist, minlength=nbins + 2)[1:nbins + 1]
             if draw_hist:
                 plt.clf()
                 hist = plt.hist(cols, bins=100, alpha=.3, color='grey')
-            xp = range(0, int(cols[-1]))
             if cnt > 10000:
                 raise ValueError
         # find best polynomial fit in a given range
@@ -95,6 +95,7 @@ def filter_by_mean(matrx, draw_hist=False, silent=False, bads=None, savefig=None
         try:
             p, z, root = best[2:]
             if draw_hist:
+                xp = range(0, int(cols[-1]))
                 a = plt.plot(xp, p(xp), "--", color='k')
                 b = plt.vlines(root, 0, plt.ylim()[1], colors='r', linestyles='dashed')
                 # c = plt.vlines(median - mad * 1.5, 0, 110, colors='g',
@@ -130,11 +131,9 @@ def filter_by_mean(matrx, draw_hist=False, silent=False, bads=None, savefig=None
                 else:
                     plt.show()
             # label as bad the columns with sums lower than the root
-            for i, col in enumerate([[matrx.get(i+j*size, 0)
-                                      for j in xrange(size)]
-                                     for i in xrange(size)]):
-                if sum(col) < root:
-                    bads[i] = sum(col)
+            nonzeros = matrx.get_nonzeros()
+            for i in np.flatnonzero(colsums < root).tolist():
+                bads[i] = colsums[i].item() if nonzeros[i] else 0
             # now stored in Experiment._zeros, used for getting more accurate z-scores
             if bads and not silent:
                 stderr.write(('\nWARNING: removing columns having less than %s ' +
@@ -171,12 +170,11 @@ def filter_by_zero_count(matrx, perc_zero, silent=True):
     size = len(matrx)
     min_val = int(size * float(perc_zero) / 100)
     new_bads = []
-    for i, col in enumerate([[matrx.get(i+j*size, 0)
-                              for j in xrange(size)]
-                             for i in xrange(size)]):
-        if col.count(0) > min_val:
-            bads[i] = True
-            new_bads.append(i)
+    # number of cells with interactions by column (cached in the HiC_data)
+    zeros = size - matrx.get_nonzeros()
+    for i in np.flatnonzero(zeros > min_val).tolist():
+        bads[i] = True
+        new_bads.append(i)
     if new_bads and not silent:
         stderr.write(('\nWARNING: removing columns having more than %s ' +
                       'zeroes:\n %s\n') % (
@@ -214,14 +212,16 @@ def hic_filtering_for_modelling(matrx, silent=False, perc_zero=90, auto=True,
         bads.update(filter_by_mean(matrx, draw_hist=draw_hist, silent=silent,
                                    savefig=savefig, bads=bads))
     # also removes rows or columns containing a NaN
-    has_nans = False
-    for i in xrange(len(matrx)):
-        if matrx.get(i + i * len(matrx), 0) == 0 and diagonal:
-            if not i in bads:
-                bads[i] = None
-        elif repr(sum([matrx.get(i + j * len(matrx), 0)
-                       for j in xrange(len(matrx))])) == 'nan':
-            has_nans = True
-            if not i in bads:
-                bads[i] = None
+    # (sums and diagonal are computed in the same pass over the cells as the
+    # number of cells with interactions)
+    nans = np.isnan(matrx.get_marginals())
+    removed = nans
+    if diagonal:
+        empty = matrx.get_diagonal() == 0
+        nans = nans & ~empty
+        removed = nans | empty
+    has_nans = bool(nans.any())
+    for i in np.flatnonzero(removed).tolist():
+        if not i in bads:
+            bads[i] = None
     return bads, has_nans
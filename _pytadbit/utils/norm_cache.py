@@ -0,0 +1,146 @@
+"""
+18 Oct 2026
+
+Cache of the results of normalization and filtering (biases, columns
+removed), stored in a local directory, one file per Hi-C data and set of
+parameters. The cache is bounded in size: files least recently used are
+removed first.
+
+The cache is only used when asked for (e.g. ``normalize_hic(cache=True)``),
+in the directory given by the environment variable TADBIT_CACHE_DIR
+(~/.tadbit/cache by default).
+"""
+
+from os       import path, listdir, makedirs, remove, rename, utime, getpid
+from os       import environ
+from cPickle  import dump, load, HIGHEST_PROTOCOL, UnpicklingError
+from hashlib  import sha1
+from warnings import warn
+from pytadbit._version import __version__
+
+CACHE_DIR = environ.get('TADBIT_CACHE_DIR',
+                        path.join(path.expanduser('~'), '.tadbit', 'cache'))
+MAX_SIZE  = 512 * 2**20
+# to be increased each time the results of normalization or filtering
+# change, results stored by previous versions are not used
+CACHE_VERSION = 1
+_EXT      = '.pik'
+
+
+def cache_key(hic_data, what, **params):
+    """
+    :param hic_data: HiC_data object
+    :param what: name of the result stored (e.g. 'biases')
+    :param params: parameters used to compute the result
+
+    :returns: an hexadecimal string identifying the result (also depends on
+       the version of TADbit and of the cache)
+    """
+    return sha1(repr((__version__, CACHE_VERSION, what,
+                      hic_data.fingerprint(),
+                      sorted(params.items())))).hexdigest()
+
+
+def get_cached(key, cache_dir=None):
+    """
+    :param key: identifier of the result (see :func:`cache_key`)
+    :param None cache_dir: directory of the cache (CACHE_DIR by default)
+
+    :returns: the result stored, or None if not found
+    """
+    fname = path.join(cache_dir or CACHE_DIR, key + _EXT)
+    try:
+        result = load(open(fname, 'rb'))
+    except (IOError, EOFError, UnpicklingError):
+        return None
+    # keep track of the last time it was used
+    try:
+        utime(fname, None)
+    except OSError:
+        pass
+    return result
+
+
+def set_cached(key, result, cache_dir=None, max_size=None):
+    """
+    Stores a result in the cache, and removes the files least recently used
+    if the cache is larger than max_size. Errors writing the cache only raise
+    a warning.
+
+    :param key: identifier of the result (see :func:`cache_key`)
+    :param result: object to be stored (should be picklable)
+    :param None cache_dir: directory of the cache (CACHE_DIR by default)
+    :param None max_size: maximum size of the cache in bytes (MAX_SIZE by
+       default)
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    fname = path.join(cache_dir, key + _EXT)
+    tmp = fname + '_%d' % getpid()
+    try:
+        if not path.exists(cache_dir):
+            makedirs(cache_dir)
+        out = open(tmp, 'wb')
+        dump(result, out, HIGHEST_PROTOCOL)
+        out.close()
+        # the file appears complete for other processes
+        rename(tmp, fname)
+    except (IOError, OSError), e:
+        warn('WARNING: could not write cache file %s (%s)\n' % (fname, e))
+        return
+    evict(cache_dir, max_size)
+
+
+def evict(cache_dir=None, max_size=None):
+    """
+    Removes the files least recently used until the cache is not larger than
+    max_size.
+
+    :param None cache_dir: directory of the cache (CACHE_DIR by default)
+    :param None max_size: maximum size of the cache in bytes (MAX_SIZE by
+       default, 0 to empty the cache)
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    max_size = MAX_SIZE if max_size is None else max_size
+    files = []
+    try:
+        for fname in listdir(cache_dir):
+            if not fname.endswith(_EXT):
+                continue
+            fname = path.join(cache_dir, fname)
+            files.append((path.getmtime(fname), path.getsize(fname), fname))
+    except OSError:
+        return
+    total = sum(size for _, size, _ in files)
+    for _, size, fname in sorted(files):
+        if total <= max_size:
+            break
+        try:
+            remove(fname)
+        except OSError:
+            pass
+        total -= size
+
+
+def cached(hic_data, what, compute, cache=False, **params):
+    """
+    Result of a computation on a given Hi-C data, loaded from the cache if
+    it was already computed with the same data and parameters.
+
+    :param hic_data: HiC_data object
+    :param what: name of the result (e.g. 'biases')
+    :param compute: function with no argument returning the result
+    :param False cache: if False, the result is computed and not stored
+    :param params: parameters used to compute the result (all of them, as
+       they are part of the identifier of the result)
+
+    :returns: the result, and whether it was loaded from the cache
+    """
+    if not cache:
+        return compute(), False
+    key = cache_key(hic_data, what, **params)
+    result = get_cached(key)
+    if result is not None:
+        return result, True
+    result = compute()
+    set_cached(key, result)
+    return result, False
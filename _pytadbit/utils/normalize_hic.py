@@ -51,36 +51,111 @@ matrix W of size N:
 
 """
 
-def _update_S(W):
-    S = {}
-    meanS = 0.0
-    for bin1 in W:
-        S[bin1] = sum(W[bin1].values())
-        meanS += S[bin1]
-    meanS /= len(W)
-    return S, meanS
-
-def _updateDB(S, meanS, B):
-    DB = {}
-    for bin1 in S:
-        DB[bin1] = float(S[bin1]) / meanS
-        B[bin1] *= DB[bin1]
+import numpy as np
+from multiprocessing.pool import ThreadPool
+
+def _update_S(rows, values, size):
+    """
+    sum of each row, computed at once for all the cells stored
+    """
+    return np.bincount(rows, weights=values, minlength=size)
+
+def _stripe_S(S, rows, values):
+    """
+    sum of each row of a stripe of cells (sorted by row), written in S
+    """
+    if len(rows):
+        beg = rows[0]
+        S[beg:rows[-1] + 1] = _update_S(rows - beg, values, rows[-1] + 1 - beg)
+
+def _updateDB(S, meanS, B, good):
+    """
+    deviation of each row from the mean, accumulated in the biases
+    """
+    DB = S / meanS
+    B[good] *= DB[good]
     return DB
 
-def _update_W(W, DB):
-    for bin1 in W:
-        DBbin1 = DB[bin1]
-        W1 = W[bin1]
-        for bin2 in W1:
-            try:
-                W1[bin2] /= DBbin1 * DB[bin2]
-            except ZeroDivisionError: # whole row is empty
-                continue
+def _update_W(rows, cols, values, DB):
+    """
+    divides, in place, each value by the deviations of its row and column
+    """
+    denom = DB[rows] * DB[cols]
+    # whole row is empty
+    nonzero = denom != 0
+    values[nonzero] /= denom[nonzero]
+
+def _stripes(rows, nstripes):
+    """
+    limits of groups of cells (sorted by row) with about the same number of
+    cells, without splitting rows between groups
+    """
+    if nstripes < 2 or len(rows) < nstripes:
+        return [(0, len(rows))]
+    cuts = np.linspace(0, len(rows), nstripes + 1).astype(int)[1:-1]
+    cuts = np.unique(np.searchsorted(rows, rows[cuts])).tolist()
+    return zip([0] + cuts, cuts + [len(rows)])
+
+def _ice(rows, cols, values, good, iterations, max_dev, pool=None,
+         nstripes=1):
+    """
+    iterative correction of the cells given (values are modified in place).
+    With a pool of threads, sums of rows and divisions are computed by
+    nstripes stripes of rows.
+
+    :returns: the biases (before the final scaling), the mean sum of rows,
+       and the lines of the verbose output
+    """
+    size = len(good)
+    ngood = int(good.sum())
+    B = np.ones(size)
+    log = []
+    if not ngood:
+        return B, 1., log
+    pmap = pool.map if pool else map
+    stripes = _stripes(rows, nstripes)
+    for it in xrange(iterations + 1):
+        S = np.zeros(size)
+        pmap(lambda (beg, end): _stripe_S(S, rows[beg:end], values[beg:end]),
+             stripes)
+        meanS = float(S[good].sum()) / ngood
+        DB = _updateDB(S, meanS, B, good)
+        pmap(lambda (beg, end): _update_W(rows[beg:end], cols[beg:end],
+                                          values[beg:end], DB), stripes)
+        minS, maxS = S[good].min(), S[good].max()
+        dev = max(abs(minS / meanS - 1), abs(maxS / meanS - 1))
+        log.append('   %15.3f %15.3f %15.3f %4s %9.5f' % (minS, meanS, maxS,
+                                                          it, dev))
+        if dev < max_dev:
+            break
+    return B, meanS, log
+
+def _native_ice(rows, cols, values, good, iterations, max_dev):
+    """
+    same as :func:`_ice`, computed by the compiled norm_lib module (values
+    are not modified)
+    """
+    try:
+        from pytadbit.norm_lib import iterative_wrapper
+    except ImportError:
+        raise Exception('ERROR: norm_lib module not found, TADbit should ' +
+                        'be re-installed to use the native engine')
+    B, meanS, stats = iterative_wrapper(
+        np.ascontiguousarray(rows, dtype=np.intc),
+        np.ascontiguousarray(cols, dtype=np.intc),
+        np.ascontiguousarray(values, dtype=np.float64),
+        np.ascontiguousarray(good, dtype=np.uint8), iterations, max_dev)
+    log = ['   %15.3f %15.3f %15.3f %4s %9.5f' % (minS, mS, maxS, it, dev)
+           for it, (minS, mS, maxS, dev) in enumerate(stats)]
+    return np.array(B), meanS, log
 
 def iterative(hic_data, bads=None, iterations=0, max_dev=0.00001,
-              verbose=False):
+              verbose=False, cis=False, n_cpus=1, engine='python'):
     """
     Implementation of iterative correction Imakaev 2012
+
+    Only the cells with interactions are stored (as arrays of rows, columns
+    and values), and each iteration is computed at once for all of them.
     
     :param hic_data: dictionary containing the interaction data
     :param None remove: columns not to consider
@@ -88,43 +163,131 @@ def iterative(hic_data, bads=None, iterations=0, max_dev=0.00001,
        matrix with no visibility differences between columns is desired)
     :param 0.00001 max_dev: maximum difference allowed between a row and the
        mean value of all raws
+    :param False cis: normalize each chromosome independently (chromosomes
+       defined in hic_data.section_pos), using only its intra-chromosomal
+       interactions
+    :param 1 n_cpus: number of threads used. Chromosomes are normalized in
+       parallel if cis is True, otherwise sums of rows and divisions are
+       computed by stripes of rows (NumPy releasing the GIL). The biases
+       obtained do not depend on the number of threads
+    :param 'python' engine: 'python' to compute the correction with NumPy,
+       or 'native' to use the compiled norm_lib module (in which case
+       chromosomes are still normalized in parallel if cis is True, but
+       the sums of rows are not split in stripes)
     :returns: a vector of biases (length equal to the size of the matrix)
     """
+    if not engine in ['python', 'native']:
+        raise NotImplementedError(('ERROR: engine %s not supported, use ' +
+                                   'python or native') % engine)
     if verbose:
         print 'iterative correction'
     size = len(hic_data)
     if not bads:
         bads = {}
     remove = [i in bads for i in xrange(size)]
-    remove = remove or tuple([int(hic_data[i+i*size]==0) for i in xrange(size)])
-    W = {}
-    for i in xrange(size):
-        if remove[i]:
-            continue
-        W[i] = {}
-        for j in xrange(size):
-            if remove[j]:
-                continue
-            if hic_data[i, j]:
-                W[i][j] = hic_data[i, j]
-    B = dict([(b, 1.) for b in W])
+    remove = remove or tuple((hic_data.get_diagonal() == 0).astype(int))
+    remove = np.array(remove, dtype=bool)
+    good = ~remove
+    # only keep the cells with interactions
+    rows, cols, values = hic_data.get_coo()
+    keep = (values != 0) & good[rows] & good[cols]
+    if cis:
+        if not hic_data.section_pos:
+            raise Exception('ERROR: chromosomes not defined, needed to ' +
+                            'normalize each of them independently')
+        crms = sorted((beg, end, crm)
+                      for crm, (beg, end) in hic_data.section_pos.iteritems())
+        begs = np.array([beg for beg, _, _ in crms])
+        keep &= (np.searchsorted(begs, rows, side='right') ==
+                 np.searchsorted(begs, cols, side='right'))
+    rows, cols = rows[keep], cols[keep]
+    values = values[keep].astype(float)
+    pool = ThreadPool(n_cpus) if n_cpus > 1 else None
+    ice = _native_ice if engine == 'native' else _ice
+    try:
+        if not cis:
+            if engine == 'native':
+                B, meanS, log = _native_ice(rows, cols, values, good,
+                                            iterations, max_dev)
+            else:
+                B, meanS, log = _ice(rows, cols, values, good, iterations,
+                                     max_dev, pool=pool, nstripes=n_cpus)
+            B = _biases(B, good, meanS)
+        else:
+            # cells of each chromosome are contiguous, being sorted by row
+            def _ice_crm((beg, end, crm)):
+                first, last = np.searchsorted(rows, [beg, end])
+                return ice(rows[first:last] - beg, cols[first:last] - beg,
+                           values[first:last], good[beg:end], iterations,
+                           max_dev)
+            B = np.ones(size)
+            log = []
+            results = (pool.map(_ice_crm, crms) if pool else
+                       map(_ice_crm, crms))
+            for (beg, end, crm), (crmB, meanS, crmlog) in zip(crms, results):
+                B[beg:end] = _biases(crmB, good[beg:end], meanS)
+                log += ['  %s' % (crm)] + crmlog
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    if verbose and log:
+        print '\n'.join(log)
+    return dict(enumerate(B.tolist()))
+
+def _biases(B, good, meanS):
+    """
+    final biases, scaled by the mean sum of rows (one for removed or empty
+    columns)
+    """
+    empty = ~good | (B == 0)
+    B[~empty] *= meanS**.5
+    B[empty] = 1.
+    return B
+
+def iterative_by_chunks(cells, size, bads=None, iterations=0, max_dev=0.00001,
+                        verbose=False):
+    """
+    Same as :func:`iterative`, for matrices that do not fit in memory: only
+    the biases are kept in memory, and all the cells are read again, chunk by
+    chunk, at each iteration (each value being divided by the biases of its
+    row and column found so far).
+
+    :param cells: function returning an iterator over chunks of cells, each
+       chunk being a tuple with the rows, columns and values of its cells
+       (NumPy arrays), and the number of bytes read to get them
+    :param size: number of rows (and columns) of the matrix
+    :param None remove: columns not to consider
+    :param 0 iterations: number of iterations to do (99 if a fully smoothed
+       matrix with no visibility differences between columns is desired)
+    :param 0.00001 max_dev: maximum difference allowed between a row and the
+       mean value of all raws
+    :returns: a vector of biases (length equal to the size of the matrix)
+    """
+    if verbose:
+        print 'iterative correction (by chunks)'
+    if not bads:
+        bads = {}
+    good = np.array([not i in bads for i in xrange(size)], dtype=bool)
+    ngood = int(good.sum())
+    B = np.ones(size)
     for it in xrange(iterations + 1):
-        S, meanS = _update_S(W)
-        DB = _updateDB(S, meanS, B)
-        _update_W(W, DB)
-        S = sorted(S.values())
-        dev = max(abs(S[0]  / meanS - 1), abs(S[-1] / meanS - 1))
+        S = np.zeros(size)
+        nbytes = 0
+        for rows, cols, values, nread in cells():
+            nbytes += nread
+            keep = (values != 0) & good[rows] & good[cols]
+            rows, cols = rows[keep], cols[keep]
+            values = values[keep].astype(float)
+            _update_W(rows, cols, values, B)
+            S += _update_S(rows, values, size)
+        meanS = float(S[good].sum()) / ngood
+        _updateDB(S, meanS, B, good)
+        minS, maxS = S[good].min(), S[good].max()
+        dev = max(abs(minS / meanS - 1), abs(maxS / meanS - 1))
         if verbose:
-            print '   %15.3f %15.3f %15.3f %4s %9.5f' % (S[0], meanS, S[-1], it, dev)
+            print '   %15.3f %15.3f %15.3f %4s %9.5f %12d bytes read' % (
+                minS, meanS, maxS, it, dev, nbytes)
         if dev < max_dev:
             break
-    for i in xrange(size):
-        try:
-            if B[i]:
-                B[i] *= meanS**.5
-            else:
-                B[i] = 1.
-        except KeyError:
-            B[i] = 1.
-    return B
-
+    return dict(enumerate(_biases(B, good, meanS).tolist()))
@@ -99,6 +99,12 @@ def nozero_log_list(values):
 
 def nozero_log_matrix(values, transformation):
     # Set the virtual minimum of the matrix to half the non-null real minimum
+    if isinstance(values, np.ndarray):
+        nozero = values[(values != 0) & ~np.isnan(values)]
+        minv = float(nozero.min()) / 2 if len(nozero) else 1
+        return np.where(values != 0,
+                        transformation(np.where(values != 0, values, 1)),
+                        transformation(minv))
     try:
         transform(0)
         minv = 0.
@@ -145,6 +151,258 @@ def zscore(values):
         values[i] = (values[i] - mean_v) / std_v
 
 
+def zscore_array(values):
+    """
+    Same as :func:`zscore` for a NumPy array of values, all transformed at
+    once (null or negative values being replaced by the log10 of half the
+    non-null minimum).
+
+    :param values: NumPy array of values
+
+    :returns: a new NumPy array with the Z-scores
+    """
+    values = np.asarray(values, dtype=float)
+    minv = float(values[values != 0].min()) / 2
+    positive = ~(values <= 0)
+    logs = np.where(positive, np.log10(np.where(positive, values, 1.)),
+                    transform(minv))
+    return (logs - logs.mean()) / logs.std()
+
+
+class ZScores(object):
+    """
+    Z-scores of the cells of the upper triangle of a matrix (diagonal
+    excluded), kept in a condensed array (one element per cell, in the order
+    given by numpy.triu_indices(size, 1)) of float32 by default, and an array
+    of booleans marking the cells having a Z-score.
+
+    Z-scores are reached by index, zscores[i, j] or zscores.get(i, j) (with
+    i < j), or, as when they were stored in a dictionary of dictionaries,
+    with zscores[str(i)][str(j)].
+
+    :param data: condensed array of Z-scores
+    :param mask: condensed array of booleans, True for the cells with a
+       Z-score
+    :param size: number of rows (and columns) of the matrix
+    :param 0 first: index of the first row of the matrix
+    :param float32 dtype: NumPy type of the Z-scores stored
+    """
+    def __init__(self, data, mask, size, first=0, dtype=np.float32):
+        self.data  = np.asarray(data, dtype=dtype)
+        self.mask  = np.asarray(mask, dtype=bool)
+        self.size  = size
+        self.first = first
+        ncells = size * (size - 1) // 2
+        if not len(self.data) == len(self.mask) == ncells:
+            raise Exception(('ERROR: Z-scores of a matrix of size %d should ' +
+                             'have %d elements') % (size, ncells))
+        self._counts = None
+
+    @classmethod
+    def from_dict(cls, zscores, size=None, first=None, dtype=np.float32):
+        """
+        Converts Z-scores stored in a dictionary of dictionaries (
+        zscores[str(i)][str(j)], with i < j), cells with i > j being stored as
+        (j, i). ZScores objects are returned as they are if their Z-scores are
+        of the type requested (copied otherwise).
+
+        :param zscores: dictionary of dictionaries
+        :param None size: number of rows of the matrix (by default, up to the
+           last row or column found)
+        :param None first: index of the first row of the matrix (by default,
+           the first row found)
+        :param float32 dtype: NumPy type of the Z-scores stored
+
+        :returns: a ZScores object
+        """
+        if isinstance(zscores, ZScores):
+            if zscores.data.dtype == dtype:
+                return zscores
+            return cls(zscores.data, zscores.mask, zscores.size, zscores.first,
+                       dtype=dtype)
+        cells = [(int(i), int(j), v) for i in zscores
+                 for j, v in zscores[i].iteritems() if int(i) != int(j)]
+        if not cells:
+            return cls([], [], size or 0, first or 0, dtype=dtype)
+        rows, cols, values = [np.array(c) for c in zip(*cells)]
+        rows, cols = np.minimum(rows, cols), np.maximum(rows, cols)
+        if first is None:
+            first = int(rows.min())
+        size = size or int(cols.max()) - first + 1
+        zsc = cls(np.zeros(size * (size - 1) // 2), np.zeros(
+            size * (size - 1) // 2, dtype=bool), size, first, dtype=dtype)
+        index = zsc._index(rows - first, cols - first)
+        zsc.data[index] = values
+        zsc.mask[index] = True
+        return zsc
+
+    def _index(self, i, j):
+        """
+        position of cell (i, j) in the condensed arrays (i < j, indexes
+        starting at zero)
+        """
+        return i * (2 * self.size - i - 1) // 2 + j - i - 1
+
+    def get(self, i, j, default=None):
+        """
+        :param i: index of the row
+        :param j: index of the column (greater than i)
+        :param None default: value returned for cells with no Z-score
+
+        :returns: the Z-score of cell (i, j)
+        """
+        i -= self.first
+        j -= self.first
+        if not 0 <= i < j < self.size:
+            return default
+        k = self._index(i, j)
+        if not self.mask[k]:
+            return default
+        return float(self.data[k])
+
+    def has_row(self, i):
+        """
+        :returns: True if the row i has at least one Z-score
+        """
+        i -= self.first
+        if not 0 <= i < self.size:
+            return False
+        return self._row_counts()[i] > 0
+
+    def _row_counts(self):
+        """
+        number of Z-scores of each row
+        """
+        if self._counts is None:
+            rows = np.arange(self.size)
+            starts = self._index(rows, rows + 1)
+            cumsum = np.concatenate(([0], np.cumsum(self.mask)))
+            self._counts = (cumsum[starts + self.size - rows - 1] -
+                            cumsum[starts])
+        return self._counts
+
+    def _row(self, i):
+        """
+        columns and Z-scores of row i
+        """
+        i -= self.first
+        k = self._index(i, i + 1)
+        mask = self.mask[k:k + self.size - i - 1]
+        cols = np.flatnonzero(mask)
+        return cols + i + 1 + self.first, self.data[k:k + self.size - i - 1][
+            cols]
+
+    def pairs(self):
+        """
+        :returns: three NumPy arrays with the rows, the columns and the
+           Z-scores of the cells having a Z-score
+        """
+        rows, cols = np.triu_indices(self.size, 1)
+        return (rows[self.mask] + self.first, cols[self.mask] + self.first,
+                self.data[self.mask])
+
+    def to_dict(self):
+        """
+        :returns: the Z-scores in a dictionary of dictionaries
+        """
+        zscores = {}
+        for i, j, val in zip(*[a.tolist() for a in self.pairs()]):
+            zscores.setdefault(str(i), {})[str(j)] = val
+        return zscores
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            val = self.get(*key)
+            if val is None:
+                raise KeyError(key)
+            return val
+        if not key in self:
+            raise KeyError(key)
+        return _ZScoresRow(self, int(key))
+
+    def __contains__(self, key):
+        if isinstance(key, tuple):
+            return self.get(*key) is not None
+        try:
+            return self.has_row(int(key))
+        except (ValueError, TypeError):
+            return False
+
+    def __iter__(self):
+        for i in np.flatnonzero(self._row_counts()).tolist():
+            yield str(i + self.first)
+
+    def __len__(self):
+        return int(np.count_nonzero(self._row_counts()))
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [self[i] for i in self]
+
+    def items(self):
+        return [(i, self[i]) for i in self]
+
+    def iteritems(self):
+        for i in self:
+            yield i, self[i]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_counts'] = None
+        return state
+
+    def __repr__(self):
+        return 'ZScores of %d cells (matrix of size %d)' % (
+            np.count_nonzero(self.mask), self.size)
+
+
+class _ZScoresRow(object):
+    """
+    Z-scores of a row of a ZScores object, reached with the column index as
+    string, as a dictionary
+    """
+    def __init__(self, zscores, i):
+        self._zscores = zscores
+        self._i       = i
+
+    def get(self, j, default=None):
+        return self._zscores.get(self._i, int(j), default)
+
+    def __getitem__(self, j):
+        val = self.get(j)
+        if val is None:
+            raise KeyError(j)
+        return val
+
+    def __contains__(self, j):
+        try:
+            return self.get(j) is not None
+        except (ValueError, TypeError):
+            return False
+
+    def __iter__(self):
+        for j in self._zscores._row(self._i)[0].tolist():
+            yield str(j)
+
+    def __len__(self):
+        return int(self._zscores._row_counts()[self._i - self._zscores.first])
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return self._zscores._row(self._i)[1].tolist()
+
+    def items(self):
+        cols, values = self._zscores._row(self._i)
+        return zip([str(j) for j in cols.tolist()], values.tolist())
+
+    def iteritems(self):
+        return iter(self.items())
+
+
 def calinski_harabasz(scores, clusters):
     """
     Implementation of the CH score [CalinskiHarabasz1974]_, that has shown to be
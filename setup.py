@@ -136,6 +136,11 @@ def main():
                                          'src/3d-lib/3dStats.cpp',
                                          'src/3d-lib/align.cpp'],
                                 extra_compile_args=["-ffast-math"])
+    # c++ module for the iterative correction of Hi-C matrices
+    norm_module = Extension('pytadbit.norm_lib',
+                            language = "c++",
+                            sources=['src/norm-lib/iterative_py.cpp',
+                                     'src/norm-lib/iterative.cpp'])
 
     # UPDATE version number
     version_full = open(path.join(PATH, '_pytadbit', '_version.py')
@@ -190,7 +195,8 @@ def main():
         author_email = 'serra.francois@gmail.com',
         ext_modules  = [pytadbit_module, pytadbit_module_old,
                         eqv_rmsd_module, centroid_module,
-                        consistency_module, aligner3d_module],
+                        consistency_module, aligner3d_module,
+                        norm_module],
         package_dir  = {'pytadbit': PATH + '/_pytadbit'},
         packages     = ['pytadbit', 'pytadbit.parsers',
                         'pytadbit.boundary_aligner', 'pytadbit.utils',
@@ -2,18 +2,11 @@
  */
 /*
  *  Created by Ivan Junier
- *  
+ *
  */
 
 #include <stdlib.h>
-#include <sys/types.h>
-#include <unistd.h>
 #include <math.h>
-#include <stdio.h>
-#include <string.h>
-
-#include <boost/regex.hpp>
-#include <boost/regex/v4/regex.hpp>
 
 
 #ifndef _ITERATIVE_H
@@ -22,10 +15,11 @@
 #ifdef __cplusplus
     extern "C" {
 #endif
-      double **iterative(int **obs, int m, int n);
+      int iterative(const int *rows, const int *cols, double *values,
+		    long nnz, int size, const char *good, int iterations,
+		    double max_dev, double *B, double *meanS, double *stats);
 #ifdef __cplusplus
     }
 #endif
 
 #endif  /* _ITERATIVE_H */
-
@@ -0,0 +1,145 @@
+#include "Python.h"
+#include "iterative.h"
+#include <string.h>
+
+/* The function doc string */
+PyDoc_STRVAR(iterative_wrapper__doc__,
+"Iterative correction (Imakaev 2012) of the cells given as flat arrays.\n\
+   :param rows: contiguous buffer of C ints with the row of each cell\n\
+   :param cols: contiguous buffer of C ints with the column of each cell\n\
+   :param values: contiguous buffer of doubles with the value of each cell\n\
+      (not modified)\n\
+   :param good: contiguous buffer of bytes (one per row) non-zero for the\n\
+      rows to consider\n\
+   :param iterations: number of iterations to do\n\
+   :param max_dev: iterations stop when the maximum deviation of a sum of\n\
+      row from their mean is below this value\n\
+\n\
+   :returns: the list of biases (before the final scaling), the mean sum of\n\
+      rows, and, for each iteration, a tuple with the minimum, mean and\n\
+      maximum sum of rows and the deviation\n\
+");
+
+
+static int get_buffer(PyObject *obj, Py_buffer *view, Py_ssize_t itemsize,
+		      const char *name)
+{
+  if (PyObject_GetBuffer(obj, view, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) < 0)
+    return -1;
+  if (view->itemsize != itemsize) {
+    PyErr_Format(PyExc_TypeError,
+		 "ERROR: %s should be made of items of %d bytes, not %d",
+		 name, (int) itemsize, (int) view->itemsize);
+    PyBuffer_Release(view);
+    return -1;
+  }
+  return 0;
+}
+
+static PyObject* iterative_wrapper(PyObject* self, PyObject* args)
+{
+  PyObject *py_rows;
+  PyObject *py_cols;
+  PyObject *py_values;
+  PyObject *py_good;
+  int iterations;
+  double max_dev;
+
+  if (!PyArg_ParseTuple(args, "OOOOid", &py_rows, &py_cols, &py_values,
+			&py_good, &iterations, &max_dev))
+    return NULL;
+  if (iterations < 0)
+    iterations = 0;
+
+  Py_buffer rows;
+  Py_buffer cols;
+  Py_buffer values;
+  Py_buffer good;
+  if (get_buffer(py_rows, &rows, sizeof(int), "rows") < 0)
+    return NULL;
+  if (get_buffer(py_cols, &cols, sizeof(int), "cols") < 0) {
+    PyBuffer_Release(&rows);
+    return NULL;
+  }
+  if (get_buffer(py_values, &values, sizeof(double), "values") < 0) {
+    PyBuffer_Release(&rows);
+    PyBuffer_Release(&cols);
+    return NULL;
+  }
+  if (get_buffer(py_good, &good, 1, "good") < 0) {
+    PyBuffer_Release(&rows);
+    PyBuffer_Release(&cols);
+    PyBuffer_Release(&values);
+    return NULL;
+  }
+
+  long nnz = (long) (rows.len / sizeof(int));
+  int size = (int) good.len;
+  const int *prows = (const int *) rows.buf;
+  const int *pcols = (const int *) cols.buf;
+  const char *msg = NULL;
+  if ((long) (cols.len / sizeof(int)) != nnz ||
+      (long) (values.len / sizeof(double)) != nnz)
+    msg = "ERROR: rows, cols and values should be of the same length";
+  for (long k = 0; !msg && k < nnz; k++)
+    if (prows[k] < 0 || prows[k] >= size || pcols[k] < 0 || pcols[k] >= size)
+      msg = "ERROR: rows and cols should be lower than the length of good";
+  if (msg) {
+    PyBuffer_Release(&rows);
+    PyBuffer_Release(&cols);
+    PyBuffer_Release(&values);
+    PyBuffer_Release(&good);
+    PyErr_SetString(PyExc_ValueError, msg);
+    return NULL;
+  }
+
+  double *W = new double[nnz > 0 ? nnz : 1];
+  double *B = new double[size > 0 ? size : 1];
+  double *stats = new double[4 * (iterations + 1)];
+  double meanS;
+  int nits;
+  memcpy(W, values.buf, nnz * sizeof(double));
+
+  // sums and divisions do not need the interpreter
+  Py_BEGIN_ALLOW_THREADS
+  nits = iterative(prows, pcols, W, nnz, size, (const char *) good.buf,
+		   iterations, max_dev, B, &meanS, stats);
+  Py_END_ALLOW_THREADS
+
+  PyBuffer_Release(&rows);
+  PyBuffer_Release(&cols);
+  PyBuffer_Release(&values);
+  PyBuffer_Release(&good);
+  delete[] W;
+
+  // give it to me
+  PyObject *py_B = PyList_New(size);
+  for (int i = 0; i < size; i++)
+    PyList_SET_ITEM(py_B, i, PyFloat_FromDouble(B[i]));
+  PyObject *py_stats = PyList_New(nits);
+  for (int it = 0; it < nits; it++)
+    PyList_SET_ITEM(py_stats, it, Py_BuildValue("(dddd)", stats[4 * it],
+						stats[4 * it + 1],
+						stats[4 * it + 2],
+						stats[4 * it + 3]));
+  delete[] B;
+  delete[] stats;
+  return Py_BuildValue("(NdN)", py_B, meanS, py_stats);
+}
+
+
+
+static PyMethodDef iterativeMethods[] =
+  {
+    {"iterative_wrapper", iterative_wrapper, METH_VARARGS,
+     iterative_wrapper__doc__},
+    {NULL, NULL, 0, NULL}
+  };
+
+PyMODINIT_FUNC
+
+initnorm_lib(void)
+{
+  (void) Py_InitModule3("norm_lib", iterativeMethods,
+			"Functions to normalize Hi-C matrices.");
+}
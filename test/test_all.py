@@ -7,15 +7,27 @@ unittest for pytadbit functions
 import unittest
 from pytadbit                             import Chromosome, load_chromosome
 from pytadbit                             import tadbit, batch_tadbit
+from pytadbit                             import merge_experiments, Experiment
 from pytadbit.tad_clustering.tad_cmo      import optimal_cmo
 from pytadbit.imp.structuralmodels        import load_structuralmodels
 from pytadbit.imp.impmodel                import load_impmodel_from_cmm
 from pytadbit.eqv_rms_drms                import rmsdRMSD_wrapper
-from os                                   import system, path, chdir
-from warnings                             import warn
+from os                                   import system, path, chdir, listdir
+from tempfile                             import mkdtemp
+from warnings                             import warn, catch_warnings
+from warnings                             import simplefilter
 from distutils.spawn                      import find_executable
 from pytadbit.parsers.genome_parser       import parse_fasta
 from pytadbit.mapping.restriction_enzymes import map_re_sites
+from pytadbit.parsers.hic_parser          import read_matrix, load_hic_data
+from pytadbit.parsers.hic_parser          import load_hic_data_from_reads
+from pytadbit.parsers.pairs_parser        import write_pairs_columns
+from pytadbit.parsers.pairs_parser        import load_pairs_columns, read_ids
+from pytadbit.mapping.filter              import filter_reads, apply_filter
+from pytadbit.mapping.restriction_enzymes import count_re_fragments
+from cPickle                              import dumps, loads, load
+from pytadbit.utils                       import norm_cache
+from pytadbit.utils.tadmaths              import ZScores
 
 CHKTIME = False
 
@@ -24,6 +36,20 @@ if CHKTIME:
 
 PATH = path.abspath(path.split(path.realpath(__file__))[0])
 
+HOME_CACHE = norm_cache.CACHE_DIR
+
+
+def setUpModule():
+    """
+    normalizations cached in a temporary directory during the tests
+    """
+    norm_cache.CACHE_DIR = mkdtemp()
+
+
+def tearDownModule():
+    system('rm -rf %s' % norm_cache.CACHE_DIR)
+    norm_cache.CACHE_DIR = HOME_CACHE
+
 
 def check_hic(hic, size):
     """
@@ -36,6 +62,26 @@ def check_hic(hic, size):
     return True
 
 
+def write_pairs(fnam, npairs=3000):
+    """
+    writes a file of pairs of reads, the positions being repeated every 2600
+    pairs (duplicates)
+    """
+    out = open(fnam, 'w')
+    out.write('# CRM chrA\t200000\n# CRM chrB\t100000\n')
+    for i in xrange(npairs):
+        reads = []
+        for j in xrange(2):
+            crm = 'chrA' if (i % 2600 * 7 + j * 3) % 5 else 'chrB'
+            pos = (i % 2600 * 7919 * (j + 1) + j * 347) % 99000 / (
+                1 + i % 2600 % 3)
+            reads.append('%s\t%d\t%d\t50\t%d\t%d' % (
+                crm, pos, (i + j) % 2, pos / 1000 * 1000,
+                pos / 1000 * 1000 + 1000))
+        out.write('read%d\t%s\t%s\n' % (i, reads[0], reads[1]))
+    out.close()
+
+
 class TestTadbit(unittest.TestCase):
     """
     test main tadbit functions
@@ -147,7 +193,47 @@ class TestTadbit(unittest.TestCase):
         #                  49.0, 61.0, 66.0, 75.0, 89.0, 94.0, 99.0], found)
         self.assertEqual([3.0, 14.0, 19.0, 33.0, 43.0, 49.0, 61.0, 66.0,
                            71.0, 89.0, 94.0, 99.0], found)
-        
+        # experiments summed at once
+        xprs = [test_chr.get_experiment(n) for n in ['exp1', 'exp2', 'exp3']]
+        merged = merge_experiments(xprs, silent=True)
+        self.assertEqual(merged.name, 'exp1+exp2+exp3')
+        self.assertEqual(merged.hic_data[0].get_total(),
+                         sum(x.hic_data[0].get_total() for x in xprs))
+        pair = xprs[0].__add__(xprs[1], silent=True)
+        self.assertEqual(pair.hic_data[0].get_total(),
+                         xprs[0].hic_data[0].get_total() +
+                         xprs[1].hic_data[0].get_total())
+        # normalized data summed, with the sum of the factors
+        xprs = [Experiment('exp%d' % i, 20000,
+                           hic_data=PATH + '/20Kb/chrT/chrT_%s.tsv' % crm,
+                           identifier='id%d' % i, cell_type='fibroblast',
+                           no_warn=True, lab='lab%d' % i, condition='wt')
+                for i, crm in enumerate('AD')]
+        for xpr in xprs:
+            xpr.normalize_hic(silent=True)
+        merged = merge_experiments(xprs, silent=True)
+        self.assertEqual(merged._normalization, 'visibility_factor:2')
+        self.assertAlmostEqual(merged.norm[0].get_total(),
+                               sum(x.norm[0].get_total() for x in xprs))
+        self.assertEqual(merged.identifier, 'id0+id1')
+        self.assertEqual(merged.cell_type, 'fibroblast')
+        self.assertEqual(merged.description, {'lab': 'lab0+lab1',
+                                              'condition': 'wt'})
+        # different resolutions, summed at the largest one and normalized
+        # again at this resolution
+        xprs[1].set_resolution(40000)
+        xprs[1].normalize_hic(silent=True)
+        merged = merge_experiments(xprs, silent=True)
+        self.assertEqual(merged.resolution, 40000)
+        self.assertEqual(len(merged.hic_data[0]), 50)
+        self.assertEqual(merged.hic_data[0].get_total(),
+                         sum(x.hic_data[0].get_total() for x in xprs))
+        self.assertEqual(merged.hic_data[0][0, 0], 1569 + 1315)
+        self.assertEqual(merged._normalization, 'visibility_factor:2')
+        self.assertAlmostEqual(merged.norm[0].get_total(), 2 * 50 * 50)
+        self.assertEqual(xprs[0].resolution, 20000)
+        self.assertEqual(xprs[0]._normalization, 'visibility_factor:1')
+
         if CHKTIME:
             print '4', time() - t0
 
@@ -265,6 +351,14 @@ class TestTadbit(unittest.TestCase):
         check_hic(exp.hic_data[0], exp.size)
         self.assertTrue(sum20 == sum80 == sum160 == sum360 == sum40 \
                         == sum21 == sum2400 == sum41)
+        # levels are computed once and then switched by reference
+        exp.build_resolution_pyramid([80000, 160000])
+        exp.set_resolution(80000)
+        hic80 = exp.hic_data
+        exp.set_resolution(160000)
+        exp.set_resolution(80000)
+        self.assertTrue(exp.hic_data is hic80)
+        self.assertEqual(sum(exp.hic_data[0].values()), sum80)
         if CHKTIME:
             print '8', time() - t0
 
@@ -283,11 +377,15 @@ class TestTadbit(unittest.TestCase):
         exp = test_chr.experiments[0]
         exp.load_hic_data(PATH + '/20Kb/chrT/chrT_A.tsv', silent=True)
         exp.normalize_hic(silent=True)
+        self.assertRaises(Exception, exp.get_zscore_array)
         exp.get_hic_zscores()
         exp.get_hic_zscores(zscored=False)
         sumz = sum([exp._zscores[k1][k2] for k1 in exp._zscores.keys()
                     for k2 in exp._zscores[k1]])
         self.assertEqual(round(sumz, 4), round(4059.2877, 4))
+        # same values kept in arrays
+        values, mask = exp.get_zscore_array()
+        self.assertEqual(round(values[mask].sum(), 4), round(4059.2877, 4))
         if CHKTIME:
             print '9', time() - t0
 
@@ -587,6 +685,417 @@ class TestTadbit(unittest.TestCase):
             print '17', time() - t0
 
 
+    def test_19_hic_data_binary(self):
+        """
+        save HiC_data in binary format and read it back memory-mapped
+        """
+        if CHKTIME:
+            t0 = time()
+
+        hic = read_matrix(PATH + '/20Kb/chrT/chrT_D.tsv')
+        hic.add_sections([40, 30, 30], ['chrA', 'chrB', 'chrC'], binned=True)
+        hic.normalize_hic(silent=True)
+        hic.save_hic_data('lala')
+        new = load_hic_data('lala')
+        self.assertEqual(new.get_matrix(focus=('chrB', 'chrB')),
+                         hic.get_matrix(focus=('chrB', 'chrB')))
+        self.assertEqual(new.get_matrix(focus=('chrA', 'chrC'),
+                                        normalized=True),
+                         hic.get_matrix(focus=('chrA', 'chrC'),
+                                        normalized=True))
+        self.assertEqual(new.section_pos, hic.section_pos)
+        self.assertEqual(sum(new.values()), sum(hic.values()))
+        # normalization reading the file by chunks
+        new.normalize_hic(silent=True)
+        self.assertEqual([round(new.bias[i], 5) for i in xrange(len(hic))],
+                         [round(hic.bias[i], 5) for i in xrange(len(hic))])
+        # sparse formats
+        for fmt in ['sparse', 'npz']:
+            hic.write_matrix('lala', format=fmt)
+            new = read_matrix('lala')
+            self.assertEqual(new.get_matrix(), hic.get_matrix())
+            self.assertEqual(new.section_pos, hic.section_pos)
+        # each warning about the values found once
+        out = open('lala', 'w')
+        out.write('1\tnan\t2\nnan\t2.5\t3.5\n2\t3.5\t4\n')
+        out.close()
+        with catch_warnings(record=True) as warns:
+            simplefilter('always')
+            new = read_matrix('lala')
+        self.assertEqual([str(w.message) for w in warns],
+                         ['WARNING: NA or NaN founds, set to zero',
+                          'WARNING: non integer values'])
+        self.assertEqual(new.get_matrix(), [[1, 0, 2], [0, 3, 4], [2, 4, 4]])
+        # shared between processes, pickled as a reference to the file
+        shared = hic.share()
+        new = loads(dumps(shared, 2))
+        self.assertTrue(len(dumps(shared, 2)) < 1000)
+        self.assertEqual(new.get_matrix(focus=('chrA', 'chrC'),
+                                        normalized=True),
+                         hic.get_matrix(focus=('chrA', 'chrC'),
+                                        normalized=True))
+        shared.unshare()
+        system('rm -f lala')
+        if CHKTIME:
+            print '19', time() - t0
+
+
+    def test_20_hic_data_blocks(self):
+        """
+        sums by pair of chromosomes, and cis/trans ratio
+        """
+        if CHKTIME:
+            t0 = time()
+
+        hic = read_matrix(PATH + '/20Kb/chrT/chrT_D.tsv')
+        hic.add_sections([40, 30, 30], ['chrA', 'chrB', 'chrC'], binned=True)
+        sums = hic.get_block_sums()
+        self.assertEqual(sums[('chrA', 'chrC')][0],
+                         hic.get_array(focus=('chrA', 'chrC')).sum())
+        self.assertEqual(sum(s for s, _ in sums.values()), sum(hic.values()))
+        self.assertEqual(round(hic.cis_trans_ratio(), 3), 0.812)
+        # expected interactions by distance, and observed/expected
+        expected = hic.get_expected()
+        chrb = hic.get_array(focus='chrB')
+        self.assertEqual(round(expected['chrB'][3], 5),
+                         round(chrb.diagonal(3).mean(), 5))
+        self.assertEqual(round(hic.get_oe_array('chrB')[2, 5], 5),
+                         round(chrb[2, 5] / expected['chrB'][3], 5))
+        self.assertTrue(hic.get_expected() is expected)
+        diagonals = hic.get_diagonal_sums()
+        self.assertEqual(diagonals['chrB'][3], chrb.diagonal(3).sum())
+        # shared with the cache, not modifiable
+        self.assertRaises(ValueError, diagonals['chrB'].__setitem__, 3, 0)
+        self.assertRaises(ValueError, expected['chrB'].__setitem__, 3, 0)
+        # chromosomes normalized independently, in parallel
+        hic.normalize_hic(silent=True, cis=True, n_cpus=2)
+        alone = read_matrix([hic.get_matrix(focus=('chrB', 'chrB'))])
+        alone.normalize_hic(silent=True)
+        beg, end = hic.section_pos['chrB']
+        self.assertEqual([round(alone.bias[i], 5) for i in xrange(end - beg)],
+                         [round(hic.bias[i], 5) for i in xrange(beg, end)])
+        # same biases with the compiled engine
+        bias = hic.bias
+        hic.normalize_hic(silent=True, cis=True, n_cpus=2, engine='native')
+        self.assertEqual([round(bias[i], 5) for i in xrange(len(hic))],
+                         [round(hic.bias[i], 5) for i in xrange(len(hic))])
+        # biases found in the cache of normalizations
+        cache_dir = norm_cache.CACHE_DIR
+        norm_cache.CACHE_DIR = 'lala_cache'
+        try:
+            hic.normalize_hic(silent=True, cis=True, n_cpus=2,
+                              engine='native', cache=True)
+            bias = hic.bias
+            hic.normalize_hic(silent=True, cis=True, engine='native',
+                              cache=True)
+            self.assertEqual(hic.bias, bias)
+            self.assertEqual(len(listdir('lala_cache')), 1)
+            # not used unless asked for
+            hic.normalize_hic(silent=True, engine='native')
+            self.assertEqual(len(listdir('lala_cache')), 1)
+            norm_cache.evict(max_size=0)
+            self.assertEqual(listdir('lala_cache'), [])
+        finally:
+            norm_cache.CACHE_DIR = cache_dir
+            system('rm -rf lala_cache')
+        hic.save_hic_data('lala')
+        self.assertEqual(load_hic_data('lala').get_block_sums(), sums)
+        system('rm -f lala')
+        if CHKTIME:
+            print '20', time() - t0
+
+
+    def test_21_pairs_columns(self):
+        """
+        pairs of reads stored by columns, read instead of the tsv file
+        """
+        if CHKTIME:
+            t0 = time()
+
+        write_pairs('lala')
+        write_pairs_columns('lala', 'lala_cols')
+        pairs = load_pairs_columns('lala_cols')
+        self.assertEqual(pairs['nreads'], 3000)
+        self.assertEqual(pairs['chromosomes'], ['chrA', 'chrB'])
+        self.assertEqual(read_ids(pairs, 10, 12), ['read10', 'read11'])
+        self.assertEqual(count_re_fragments('lala'),
+                         count_re_fragments('lala_cols'))
+        hic1 = load_hic_data_from_reads('lala', 10000)
+        hic2 = load_hic_data_from_reads('lala_cols', 10000)
+        self.assertEqual(hic1.get_matrix(), hic2.get_matrix())
+        masked1 = filter_reads('lala', output='lala1', verbose=False)
+        masked2 = filter_reads('lala_cols', output='lala2', verbose=False)
+        for k in masked1:
+            self.assertEqual(masked1[k]['reads'], masked2[k]['reads'])
+            self.assertEqual(open(masked1[k]['fnam']).read(),
+                             open(masked2[k]['fnam']).read())
+        system('rm -rf lala lala1_* lala2_* lala_cols')
+        if CHKTIME:
+            print '21', time() - t0
+
+
+    def test_22_filter_reads_parallel(self):
+        """
+        filter pairs of reads with several processes, by ranges of the file
+        """
+        if CHKTIME:
+            t0 = time()
+
+        write_pairs('lala')
+        masked1 = filter_reads('lala', output='lala1', verbose=False)
+        masked2 = filter_reads('lala', output='lala2', verbose=False,
+                               n_cpus=3, chunk_size=5000)
+        for k in masked1:
+            self.assertEqual(masked1[k]['reads'], masked2[k]['reads'])
+            self.assertEqual(open(masked1[k]['fnam']).read(),
+                             open(masked2[k]['fnam']).read())
+        self.assertEqual(open(masked1[1]['flags']).read(),
+                         open(masked2[1]['flags']).read())
+        self.assertTrue(masked1[9]['reads'] > 0)
+        # errors in any of the processes
+        out = open('lala', 'a')
+        out.write('read\tchrA\t1\t0\t50\t0\n')
+        out.close()
+        self.assertRaises(Exception, filter_reads, 'lala', output='lala2',
+                          verbose=False, n_cpus=3)
+        system('rm -rf lala lala1_* lala2_*')
+        if CHKTIME:
+            print '22', time() - t0
+
+
+    def test_23_apply_filter(self):
+        """
+        select the pairs of reads from the flags of each line, as from the IDs
+        of the reads removed by each filter
+        """
+        if CHKTIME:
+            t0 = time()
+
+        write_pairs('lala')
+        masked = filter_reads('lala', output='lala1', verbose=False)
+        by_ids = dict((k, dict((i, masked[k][i]) for i in masked[k]
+                               if i != 'flags'))
+                      for k in masked)
+        for filters in (None, [5, 9], set([5, 9])):
+            for reverse in (False, True):
+                apply_filter('lala', 'lala2', masked, filters=filters,
+                             reverse=reverse, verbose=False)
+                apply_filter('lala', 'lala3', by_ids, filters=filters,
+                             reverse=reverse, verbose=False)
+                self.assertEqual(open('lala2').read(), open('lala3').read())
+                self.assertTrue(len(open('lala2').readlines()) > 2)
+        # the input file should be the one filtered
+        for nreads, error in ((2999, 'less lines'), (3001, 'more lines')):
+            write_pairs('lala', nreads)
+            self.assertRaisesRegexp(Exception, error, apply_filter, 'lala',
+                                    'lala2', masked, verbose=False)
+        system('rm -rf lala lala1_* lala2 lala3')
+        if CHKTIME:
+            print '23', time() - t0
+
+
+    def test_24_filter_reads_max_memory(self):
+        """
+        search duplicated pairs of reads by groups of positions
+        """
+        if CHKTIME:
+            t0 = time()
+
+        write_pairs('lala')
+        masked1 = filter_reads('lala', output='lala1', verbose=False)
+        # about 100 bytes by pair of reads -> 10 groups
+        masked2 = filter_reads('lala', output='lala2', verbose=False,
+                               n_cpus=2, chunk_size=5000, max_memory=30000)
+        for k in masked1:
+            self.assertEqual(masked1[k]['reads'], masked2[k]['reads'])
+            self.assertEqual(open(masked1[k]['fnam']).read(),
+                             open(masked2[k]['fnam']).read())
+        self.assertEqual(open(masked1[1]['flags']).read(),
+                         open(masked2[1]['flags']).read())
+        self.assertEqual(masked2[9]['reads'], 400)
+        self.assertEqual([f for f in listdir('.') if '_pairs_' in f], [])
+        system('rm -rf lala lala1_* lala2_*')
+        if CHKTIME:
+            print '24', time() - t0
+
+
+    def test_25_zscores(self):
+        """
+        Z-scores kept in condensed arrays, and reached as dictionaries
+        """
+        if CHKTIME:
+            t0 = time()
+
+        # rows 2 to 9, row 5 missing, values exact in float32
+        legacy = {}
+        for i in xrange(2, 10):
+            for j in xrange(i + 1, 10):
+                if i != 5 and (i * 7 + j * 3) % 4:
+                    legacy.setdefault(str(i), {})[str(j)] = (i - j) / 4.
+        zscores = ZScores.from_dict(legacy)
+        self.assertEqual((zscores.first, zscores.size), (2, 8))
+        self.assertEqual(zscores.to_dict(), legacy)
+        # dictionary view
+        self.assertEqual(sorted(zscores.keys()), sorted(legacy.keys()))
+        self.assertEqual(len(zscores), len(legacy))
+        self.assertFalse('5' in zscores)
+        self.assertFalse('lala' in zscores)
+        for i in legacy:
+            self.assertTrue(i in zscores)
+            self.assertEqual(sorted(zscores[i].keys()), sorted(legacy[i]))
+            for j in legacy[i]:
+                self.assertEqual(zscores[i][j], legacy[i][j])
+        # cells given as (j, i)
+        zscores = ZScores.from_dict({'7': {'4': 0.5, '9': 1.5}})
+        self.assertEqual(zscores.to_dict(), {'4': {'7': 0.5},
+                                             '7': {'9': 1.5}})
+        self.assertEqual(zscores[4, 7], 0.5)
+        # same Z-scores and neighbours as the lookups in the dictionary of
+        # dictionaries used for the restraints of the modelling
+        zscores = ZScores.from_dict(legacy)
+        nan = float('nan')
+        for x in xrange(0, 12):
+            for y in xrange(x + 1, 12):
+                sx, sy = str(x), str(y)
+                if sx in legacy and sy in legacy[sx]:
+                    old = legacy[sx][sy]
+                elif sx in legacy:
+                    row = legacy[sx]
+                    prevy, posty = str(y - 1), str(y + 1)
+                    old = (row.get(prevy, row.get(posty, nan)) +
+                           row.get(posty, row.get(prevy, nan))) / 2
+                else:
+                    prevx, postx = str(x - 1), str(x + 1)
+                    prevx = prevx if prevx in legacy else postx
+                    postx = postx if postx in legacy else prevx
+                    try:
+                        prev, post = legacy[prevx], legacy[postx]
+                        old = (prev.get(sy, post.get(sy, nan)) +
+                               post.get(sy, prev.get(sy, nan))) / 2
+                    except KeyError:
+                        old = nan
+                get = zscores.get
+                if get(x, y) is not None:
+                    new = get(x, y)
+                elif zscores.has_row(x):
+                    new = (get(x, y - 1, get(x, y + 1, nan)) +
+                           get(x, y + 1, get(x, y - 1, nan))) / 2
+                else:
+                    prevx = x - 1 if zscores.has_row(x - 1) else x + 1
+                    postx = x + 1 if zscores.has_row(x + 1) else prevx
+                    new = (get(prevx, y, get(postx, y, nan)) +
+                           get(postx, y, get(prevx, y, nan))) / 2
+                self.assertEqual(repr(old), repr(new))
+        # models saved with Z-scores in a dictionary of dictionaries
+        legacy = load(open('models.pick'))['zscore']
+        self.assertTrue(isinstance(legacy, dict))
+        models = load_structuralmodels('models.pick')
+        self.assertTrue(isinstance(models._zscores, ZScores))
+        self.assertEqual(sorted(models._zscores.keys()), sorted(legacy))
+        for i in legacy:
+            for j in legacy[i]:
+                self.assertAlmostEqual(models._zscores[i][j], legacy[i][j],
+                                       places=5)
+        models.save_models('lala')
+        self.assertEqual(load_structuralmodels('lala')._zscores.to_dict(),
+                         models._zscores.to_dict())
+        system('rm -f lala')
+        if CHKTIME:
+            print '25', time() - t0
+
+
+    def test_26_hic_data_from_reads(self):
+        """
+        bin pairs of reads into HiC_data objects
+        """
+        if CHKTIME:
+            t0 = time()
+
+        write_pairs('lala')
+        write_pairs_columns('lala', 'lala_cols')
+        # several resolutions at once, by ranges of the file in parallel
+        for fnam in ('lala', 'lala_cols'):
+            hics = load_hic_data_from_reads(fnam, [10000, 50000], n_cpus=2,
+                                            chunk_size=100)
+            self.assertEqual(sorted(hics), [10000, 50000])
+            for reso in hics:
+                hic = load_hic_data_from_reads(fnam, reso)
+                self.assertEqual(len(hics[reso]), len(hic))
+                self.assertEqual(hics[reso].resolution, reso)
+                self.assertEqual(hics[reso].section_pos, hic.section_pos)
+                self.assertEqual([a.tolist() for a in hics[reso].get_coo()],
+                                 [a.tolist() for a in hic.get_coo()])
+                self.assertEqual(hics[reso].get_total(), 2 * 3000)
+        system('rm -rf lala_cols')
+        hic = load_hic_data_from_reads('lala', 10000)
+        # reads outside the matrix are not stored
+        out = open('lala', 'a')
+        out.write('read3000\tchrA\t-5\t0\t50\t0\t1000\t'
+                  'chrB\t5000\t1\t50\t5000\t6000\n')
+        out.write('read3001\tchrA\t5000\t0\t50\t5000\t6000\t'
+                  'chrB\t9000000\t1\t50\t9000000\t9001000\n')
+        out.close()
+        write_pairs_columns('lala', 'lala_cols')
+        for fnam in ('lala', 'lala_cols'):
+            with catch_warnings(record=True) as warns:
+                simplefilter('always')
+                new = load_hic_data_from_reads(fnam, 10000)
+            self.assertEqual([str(w.message) for w in warns],
+                             ['WARNING: 2 reads outside the matrix at ' +
+                              'resolution 10000, not stored'])
+            self.assertEqual([a.tolist() for a in new.get_coo()],
+                             [a.tolist() for a in hic.get_coo()])
+        system('rm -rf lala lala_cols')
+        if CHKTIME:
+            print '26', time() - t0
+
+
+    def test_27_hic_data_stats(self):
+        """
+        sums of rows, diagonal and expected kept until the matrix is modified
+        """
+        if CHKTIME:
+            t0 = time()
+
+        hic = read_matrix(PATH + '/20Kb/chrT/chrT_D.tsv')
+        size = len(hic)
+        def check():
+            mtrx = hic.get_matrix()
+            self.assertEqual(hic.get_marginals().tolist(),
+                             [sum(row) for row in mtrx])
+            self.assertEqual(hic.get_nonzeros().tolist(),
+                             [sum(1 for v in row if v) for row in mtrx])
+            self.assertEqual(hic.get_diagonal().tolist(),
+                             [mtrx[i][i] for i in xrange(len(hic))])
+            self.assertEqual(hic.get_total(), sum(sum(row) for row in mtrx))
+        check()
+        hic[3, 5] = hic[3, 5] + 10
+        hic[5, 3] = hic[5, 3] + 10
+        hic[4, 4] = 7
+        check()
+        self.assertEqual(hic.get_diagonal()[4], 7)
+        del(hic[3 * size + 5])
+        del(hic[5 * size + 3])
+        check()
+        self.assertEqual(hic[3, 5], 0)
+        # sections modified (one more bin by chromosome)
+        self.assertEqual(hic.get_expected().keys(), [None])
+        for lengths in ([39, 29, 29], [40, 30, 30]):
+            hic.add_sections(lengths, ['chrA', 'chrB', 'chrC'], binned=True)
+            self.assertEqual(len(hic), max(size, sum(lengths) + 3))
+            check()
+            self.assertEqual(sorted(hic.get_expected()),
+                             ['chrA', 'chrB', 'chrC'])
+            beg, end = hic.section_pos['chrB']
+            self.assertEqual(end - beg, lengths[1] + 1)
+            chrb = [row[beg:end] for row in hic.get_matrix()[beg:end]]
+            self.assertEqual(hic.get_diagonal_sums()['chrB'][3],
+                             sum(chrb[i][i + 3]
+                                 for i in xrange(end - beg - 3)))
+        if CHKTIME:
+            print '27', time() - t0
+
+
 if __name__ == "__main__":
     unittest.main()
     